@@ -0,0 +1,77 @@
+"""
+Golden vectors and throughput for the job history confirmation encodings in
+email2/src/canonical.py.
+
+The golden vectors pin the exact bytes behind anchored confirmation hashes: if one of
+them fails, the encoding changed and needs a new version instead. They run before the
+timings, and on their own with --check.
+
+    python benchmarks/canonical_encoding.py [iterations] [--check]
+"""
+import hashlib
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions', 'email2', 'src'))
+
+import canonical  # noqa: E402
+
+
+JOB_HISTORY = {
+    '$id': '6830f1a2000b7c3d9e41',
+    'company_name': 'Acme & Sons',
+    'job_title': 'Senior Engineer',
+    'start_date': '2021-01-04T00:00:00.000+00:00',
+    'end_date': '2024-06-28T00:00:00.000+00:00',
+    'description': 'Led the payments team.',
+    'is_current_job': False,
+    'verification_status': 'VERIFIED_BY_RECIPIENT',
+    'verifier_email': 'hr@acme.example',
+    'verification_message': 'Please confirm.',
+    'verification_processed_at': None,
+}
+ONLY_ID = {'$id': 'empty'}
+# Decomposed accents and a non-UTC offset for the same instant as JOB_HISTORY's start date.
+UNICODE = dict(JOB_HISTORY, company_name='Cafe\u0301 Zoe\u0308', start_date='2021-01-04T02:00:00+02:00')
+
+# (version, document, sha256 of the encoding)
+GOLDEN_VECTORS = [
+    (0, JOB_HISTORY, 'ff99ae285a2fbcf4fe6cb7aa60a4dd64c3360b4e53e2246c7ed38c2e4ece9ca6'),
+    (0, ONLY_ID, '002b780d312773e46c4ae4554e7868a6f75572b29de7727a0fd3691f21dad7ee'),
+    (1, JOB_HISTORY, 'aab9797c78acb8b833048042f4b6ddf04e20d6e732e66343dcff89a4be65da65'),
+    (1, ONLY_ID, 'e6fda26d67186f9444ffe745b30c687691975bf44deb5d246331cf5de19e7cc0'),
+    (1, UNICODE, 'b93e473d59006ba8348e419847d597db0c95d9ff307c3a38725cee40d33bfbce'),
+]
+
+
+def check_golden_vectors():
+    for version, document, expected in GOLDEN_VECTORS:
+        actual = hashlib.sha256(canonical.get_encoder(version).encode(document)).hexdigest()
+        assert actual == expected, f'v{version} encoding of {document["$id"]} changed: {actual}'
+
+    # Equivalent inputs (NFC vs NFD text, UTC vs offset timestamps) encode identically in v1.
+    composed = dict(UNICODE, company_name='Caf\u00e9 Zo\u00eb', start_date=JOB_HISTORY['start_date'])
+    assert canonical.get_encoder(1).encode(composed) == canonical.get_encoder(1).encode(UNICODE)
+    print(f'{len(GOLDEN_VECTORS)} golden vectors OK')
+
+
+def report(name, iterations, seconds):
+    print(f'{name:<34} {seconds / iterations * 1e6:10.2f} us/blob {iterations / seconds:12.0f} blobs/s')
+
+
+def main():
+    args = [a for a in sys.argv[1:] if a != '--check']
+    check_golden_vectors()
+    if '--check' in sys.argv:
+        return
+
+    iterations = int(args[0]) if args else 50000
+    for version in sorted(canonical.ENCODERS):
+        encoder = canonical.get_encoder(version)
+        seconds = min(timeit.repeat(lambda: hashlib.sha256(encoder.encode(JOB_HISTORY)).digest(), number=iterations, repeat=5))
+        report(f'{encoder.label} encode + sha256', iterations, seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Microbenchmark: encoding a `store_verified_resume_data` call through the per-call
+ContractInstance.create_from_address path versus the process-wide CompiledContract.
+
+Runs offline against a SubstrateInterface stand-in that only carries a runtime config.
+
+    python benchmarks/contract_encoding.py [iterations]
+"""
+import os
+import sys
+import timeit
+
+from scalecodec.base import RuntimeConfigurationObject
+from scalecodec.type_registry import load_type_registry_preset
+from substrateinterface.contracts import ContractMetadata
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import chain  # noqa: E402
+
+
+METADATA_FILE = os.path.join(os.path.dirname(__file__), '..', 'src', 'zid_contract.json')
+RESUME_HASH = bytes(range(32))
+
+
+class OfflineSubstrate:
+    def __init__(self):
+        self.runtime_config = RuntimeConfigurationObject()
+        self.runtime_config.update_type_registry(load_type_registry_preset('core'))
+
+    def init_runtime(self, block_hash=None, block_id=None):
+        pass
+
+    def encode_scale(self, type_string, value, block_hash=None):
+        obj = self.runtime_config.create_scale_object(type_string)
+        return obj.encode(value)
+
+
+def current_path(substrate):
+    metadata = ContractMetadata.create_from_file(METADATA_FILE, substrate=substrate)
+    return metadata.generate_message_data('store_verified_resume_data', {'hash': RESUME_HASH}).data
+
+
+def compiled_path():
+    contract = chain.get_contract('5Contract', METADATA_FILE)
+    return contract.encode_call('store_verified_resume_data', {'hash': RESUME_HASH})
+
+
+def report(name, iterations, seconds):
+    print(f'{name:<34} {seconds / iterations * 1e6:10.2f} us/call {iterations / seconds:12.0f} calls/s')
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    substrate = OfflineSubstrate()
+
+    assert bytes(current_path(substrate)) == compiled_path(), 'encodings differ'
+
+    report('create_from_file + encode', iterations, timeit.timeit(lambda: current_path(substrate), number=iterations))
+    report('CompiledContract.encode_call', iterations * 100, timeit.timeit(compiled_path, number=iterations * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Microbenchmark: rendering the verification email with the per-send f-strings that
+email2 used to build versus the templates in email2/src/templates.py, which escape the
+HTML body's values as an escaped f-string would.
+
+    python benchmarks/email_templates.py [iterations]
+"""
+import datetime
+import html
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions', 'email2', 'src'))
+
+import templates  # noqa: E402
+
+
+FIELDS = {
+    'verification_message': 'A candidate has requested employment verification.',
+    'company_name': 'Acme & Sons',
+    'job_title': 'Senior Engineer',
+    'start_date': '2021-01-04',
+    'end_date': '2024-06-28',
+    'description': 'Led the <payments> team; shipped "instant" refunds. ' * 8,
+    'accept_link': 'https://zeroid.example/verify-employment/abc123/accept',
+    'reject_link': 'https://zeroid.example/verify-employment/abc123/reject',
+}
+
+
+def current_path(fields, escape=None):
+    """The old email2 rendering; `escape`, if given, is applied to the HTML body's fields."""
+    html_fields = {name: escape(value) for name, value in fields.items()} if escape is not None else fields
+    html_body = _html_body(html_fields)
+    text_body = _text_body(fields)
+    return html_body, text_body
+
+
+def _html_body(fields):
+    verification_message_str = fields['verification_message']
+    company_name_str = fields['company_name']
+    job_title_str = fields['job_title']
+    start_date_str = fields['start_date']
+    end_date_str = fields['end_date']
+    description_str = fields['description']
+    accept_link = fields['accept_link']
+    reject_link = fields['reject_link']
+    current_year = datetime.datetime.now().year
+
+    html_body = f"""
+<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="utf-8">
+  <meta http-equiv="x-ua-compatible" content="ie=edge">
+  <title>Employment Verification Request</title>
+  <meta name="viewport" content="width=device-width, initial-scale=1">
+  <style type="text/css">
+    body, table, td, a {{ -ms-text-size-adjust: 100%; -webkit-text-size-adjust: 100%; }}
+    table, td {{ mso-table-lspace: 0pt; mso-table-rspace: 0pt; }}
+    img {{ -ms-interpolation-mode: bicubic; border: 0; height: auto; line-height: 100%; outline: none; text-decoration: none; }}
+    table {{ border-collapse: collapse !important; }}
+    body {{ height: 100% !important; margin: 0 !important; padding: 0 !important; width: 100% !important; font-family: Arial, sans-serif; line-height: 1.6; color: #333333; background-color: #f4f4f4; padding: 20px; }}
+    .container {{ background-color: #ffffff; padding: 30px; border-radius: 8px; max-width: 600px; margin: 0 auto; box-shadow: 0 0 10px rgba(0,0,0,0.1); }}
+    .header {{ text-align: center; padding-bottom: 20px; border-bottom: 1px solid #eeeeee; }}
+    .header h1 {{ margin: 0; font-size: 24px; color: #007bff; }}
+    .content p {{ margin: 15px 0; }}
+    .content strong {{ color: #555555; }}
+    .data-item {{ margin-bottom: 10px; padding-left: 10px; }}
+    .data-item span {{ font-weight: bold; }}
+    .verification-links p {{ margin-top: 20px; margin-bottom: 20px; text-align: center; }} /* Centered paragraph for links */
+    .verification-links a {{ text-decoration: none; padding: 0 10px; }}
+    .accept-link {{ font-weight: bold; color: green; }}
+    .reject-link {{ font-weight: bold; color: red; }}
+    .footer {{ text-align: center; padding-top: 20px; border-top: 1px solid #eeeeee; font-size: 12px; color: #777777; }}
+    .footer p {{ margin: 5px 0; }}
+  </style>
+</head>
+<body>
+  <div class="container">
+    <div class="header"><h1>Employment Verification Request</h1></div>
+    <div class="content">
+      <p>Dear Recipient,</p>
+      <p><strong>{verification_message_str}</strong></p>
+      <p>Please verify the following employment details for a candidate:</p>
+      <div class="data-item"><span>Company:</span> {company_name_str}</div>
+      <div class="data-item"><span>Job Title:</span> {job_title_str}</div>
+      <div class="data-item"><span>Employment Duration:</span> {start_date_str} to {end_date_str}</div>
+      <div class="data-item"><span>Job Description:</span></div>
+      <p style="padding-left: 10px;">{description_str}</p>
+      <p>Your timely response is greatly appreciated.</p>
+      
+      <div class="verification-links">
+        <p>
+          <a href="{accept_link}" class="accept-link" target="_blank">ACCEPT</a>
+          <span style="color: #cccccc;">&nbsp;|&nbsp;</span>
+          <a href="{reject_link}" class="reject-link" target="_blank">REJECT</a>
+        </p>
+      </div>
+
+      <p style="font-size:12px; color: #555555;">If you are unable to click the links above, please copy and paste the appropriate URL into your browser:</p>
+      <p style="font-size:12px; color: #555555;">Accept: {accept_link}</p>
+      <p style="font-size:12px; color: #555555;">Reject: {reject_link}</p>
+    </div>
+    <div class="footer">
+      <p>This email was sent from Zero ID.</p>
+      <p>If you received this email in error, you can safely delete it. Please do not reply if you are not the intended recipient.</p>
+      <p>&copy; {current_year} Zero ID. All rights reserved.</p>
+    </div>
+  </div>
+</body>
+</html>
+"""
+    return html_body
+
+
+def _text_body(fields):
+    verification_message_str = fields['verification_message']
+    company_name_str = fields['company_name']
+    job_title_str = fields['job_title']
+    start_date_str = fields['start_date']
+    end_date_str = fields['end_date']
+    description_str = fields['description']
+    accept_link = fields['accept_link']
+    reject_link = fields['reject_link']
+    current_year = datetime.datetime.now().year
+
+    text_body = f"""
+Dear Recipient,
+
+{verification_message_str}
+
+Please verify the following employment details for a candidate:
+
+Company: {company_name_str}
+Job Title: {job_title_str}
+Employment Duration: {start_date_str} to {end_date_str}
+
+Job Description:
+{description_str}
+
+Your timely response is greatly appreciated.
+
+To process this request, please use the links below:
+
+ACCEPT:
+{accept_link}
+
+REJECT:
+{reject_link}
+
+---
+This email was sent from Zero ID.
+If you received this email in error, you can safely delete it. Please do not reply if you are not the intended recipient.
+© {current_year} Zero ID. All rights reserved.
+"""
+    return text_body
+
+
+def template_path(fields):
+    fields = dict(fields, current_year=templates.current_year())
+    html_body = templates.load('verification_email.html').render(fields)
+    text_body = templates.load('verification_email.txt').render(fields)
+    return html_body, text_body
+
+
+def report(name, iterations, seconds):
+    print(f'{name:<34} {seconds / iterations * 1e6:10.2f} us/render {iterations / seconds:12.0f} renders/s')
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    old_html, old_text = current_path(FIELDS)
+    escaped_html, _ = current_path(FIELDS, html.escape)
+    new_html, new_text = template_path(FIELDS)
+    assert new_text == old_text.lstrip('\n'), 'text bodies differ'
+    assert new_html == escaped_html.lstrip('\n'), 'HTML bodies differ from the escaped f-string'
+    assert '<payments>' in old_html and '<payments>' not in new_html, 'description is not escaped'
+
+    report('f-string per send', iterations, timeit.timeit(lambda: current_path(FIELDS), number=iterations))
+    report('f-string per send, escaped', iterations, timeit.timeit(lambda: current_path(FIELDS, html.escape), number=iterations))
+    report('templates', iterations, timeit.timeit(lambda: template_path(FIELDS), number=iterations))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+"""
+Offline end-to-end benchmark of the Appwrite functions: Store Verified Resume Data,
+email2 and Hash Resume Files.
+
+Each function's main(context) runs unmodified, with its real SDK clients, against local
+stand-ins (see benchmarks/offline): a scripted Substrate node on a websocket JSON-RPC
+endpoint, an in-memory Appwrite REST API that also answers Resend's email API, and a
+fake Appwrite runtime context. Invocations run at the requested concurrency; the
+report gives p50/p95/p99 latency and throughput per invocation and per phase, where a
+phase is one kind of outgoing call: an Appwrite route, a Substrate RPC method (for
+author_submitAndWatchExtrinsic this includes waiting for inclusion) or a Resend request.
+
+Scenarios:
+    store             POST {"blob_text": ...}; waits for the extrinsic to be included
+    store-submit      POST {"blob_text": ..., "wait": false}; submit-only, records a chain submission
+    store-upload      POST a raw application/octet-stream document of --upload-bytes
+    store-read        GET; reads get_verified_resume_data
+    email2            one cron run per invocation over seeded SEND_VERIFICATION_EMAIL and
+                      CONFIRM_EMPLOYMENT actions (--actions-per-run of them per invocation)
+    email2-workers    email2 with --concurrency overlapping runs draining the shared backlog,
+                      as several workers would; reports claim conflicts and duplicate sends
+    hash-resume-files one scheduled run per invocation over seeded candidates and files
+
+    python benchmarks/end_to_end.py [scenario ...] [--invocations 50] [--concurrency 4]
+        [--block-time 0.2] [--rpc-latency 0.001] [--appwrite-latency 0.002] [--env KEY=VALUE ...]
+
+Functions read their configuration at import, so --env overrides (e.g.
+ANCHOR_BATCH_MODE=merkle, EMAIL_PROVIDER=stub) apply to every scenario of the run.
+The functions index Appwrite responses as dicts, so run it with the Appwrite SDK they
+pin (appwrite>=15,<16, from backend/requirements.txt); later SDKs return models.
+"""
+import argparse
+import datetime
+import importlib
+import importlib.machinery
+import importlib.util
+import itertools
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from appwrite.client import Client
+from substrateinterface import Keypair, SubstrateInterface
+
+from offline.appwrite_server import AppwriteServer
+from offline.context import Context, Request
+from offline.substrate_node import NodeServer, StandInNode
+
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+FUNCTIONS = {
+    'store': os.path.join(BACKEND_DIR, 'functions', 'Store Verified Resume Data', 'src'),
+    'email2': os.path.join(BACKEND_DIR, 'functions', 'email2', 'src'),
+    'hash-resume-files': os.path.join(BACKEND_DIR, 'functions', 'Hash Resume Files', 'src'),
+}
+SCENARIOS = {
+    'store': 'store',
+    'store-submit': 'store',
+    'store-upload': 'store',
+    'store-read': 'store',
+    'email2': 'email2',
+    'email2-workers': 'email2',
+    'hash-resume-files': 'hash-resume-files',
+}
+
+CONTRACT_ADDRESS = '5FHneW46xGXgs5mUiveU4sbTyGBzmstUspZC92UhjJM694ty'
+DB_ID = 'zeroid'
+COLLECTIONS = {
+    'APPWRITE_JOB_HISTORY_ID': 'job_history',
+    'APPWRITE_SERVER_ACTIONS_COLLECTION_ID': 'server_actions',
+    'APPWRITE_ACTION_CLAIMS_COLLECTION_ID': 'action_claims',
+    'APPWRITE_CHAIN_SUBMISSIONS_COLLECTION_ID': 'chain_submissions',
+    'APPWRITE_CANDIDATES_COLLECTION_ID': 'candidates',
+    'APPWRITE_JOB_CHECKPOINTS_COLLECTION_ID': 'job_checkpoints',
+}
+RESUME_BUCKET_ID = 'resumes'
+EPOCH = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+# --- Measurement ---
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of sorted `samples`."""
+    return samples[min(len(samples) - 1, max(0, round(fraction * len(samples)) - 1))]
+
+
+class Phases:
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+    def timed(self, name_of, function):
+        phases = self
+
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                phases.record(name_of(*args, **kwargs), time.perf_counter() - started)
+        return wrapper
+
+    def report(self, wall_time):
+        rows = sorted(self.samples.items(), key=lambda item: (not item[0].startswith('invocation'), -sum(item[1])))
+        print(f'  {"phase":<52} {"count":>6} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"per s":>8}')
+        for name, samples in rows:
+            samples = sorted(samples)
+            print(f'  {name:<52} {len(samples):>6} {percentile(samples, .50) * 1000:>9.1f} '
+                  f'{percentile(samples, .95) * 1000:>9.1f} {percentile(samples, .99) * 1000:>9.1f} '
+                  f'{len(samples) / wall_time:>8.1f}')
+
+
+def _appwrite_phase(client, method, path='', *args, **kwargs):
+    parts = path.strip('/').split('/')
+    if parts[0] == 'databases' and len(parts) >= 5:
+        resource = parts[3] + ('/{id}' if len(parts) > 5 else '')
+    elif parts[0] == 'storage':
+        resource = 'files/{id}' + ('/download' if parts[-1] == 'download' else '')
+    else:
+        resource = path
+    return f'appwrite {method.upper()} {resource}'
+
+
+def instrument(phases):
+    """Times every outgoing Appwrite, Substrate and Resend call under its phase name."""
+    import resend.http_client_requests
+
+    # Newer Appwrite SDKs force their per-call deprecation warnings on, which would bury the report.
+    show_warning = warnings.showwarning
+    warnings.showwarning = lambda message, category, *args, **kwargs: (
+        None if issubclass(category, DeprecationWarning) else show_warning(message, category, *args, **kwargs))
+
+    Client.call = phases.timed(_appwrite_phase, Client.call)
+    SubstrateInterface.rpc_request = phases.timed(lambda substrate, method, *a, **k: f'rpc {method}', SubstrateInterface.rpc_request)
+    requests_client = resend.http_client_requests.RequestsClient
+    requests_client.request = phases.timed(
+        lambda client, method, url, *a, **k: f'resend {method.upper()} {url.split("://", 1)[-1].split("/", 1)[-1]}',
+        requests_client.request,
+    )
+
+
+# --- Functions under test ---
+
+def load_function(name):
+    """Imports a function's src/main.py as its own package, so functions sharing module names stay apart."""
+    package = 'offline_' + name.replace('-', '_')
+    if package + '.main' not in sys.modules:
+        spec = importlib.machinery.ModuleSpec(package, None, is_package=True)
+        spec.submodule_search_locations = [FUNCTIONS[name]]
+        sys.modules[package] = importlib.util.module_from_spec(spec)
+    return importlib.import_module(package + '.main')
+
+
+def configure_environment(node_url, appwrite, actions_per_run, overrides):
+    scratch = tempfile.mkdtemp(prefix='zeroid-bench-')
+    os.environ.update({
+        'APPWRITE_FUNCTION_API_ENDPOINT': appwrite.endpoint,
+        'APPWRITE_FUNCTION_PROJECT_ID': 'offline',
+        'APPWRITE_FUNCTION_API_KEY': 'offline-key',
+        'APPWRITE_DATABASE_ID': DB_ID,
+        'APPWRITE_RESUME_BUCKET_ID': RESUME_BUCKET_ID,
+        **COLLECTIONS,
+        'RESEND_API_KEY': 're_offline',
+        'RESEND_API_URL': appwrite.url,
+        'POLKADOT_SUBSTRATE_URL': node_url,
+        'POLKADOT_CONTRACT_ADDRESS': CONTRACT_ADDRESS,
+        'POLKADOT_KEYPAIR_ACCOUNT': '//Alice',
+        'POLKADOT_KEYPAIR_MNEMONIC': Keypair.generate_mnemonic(),
+        'POLKADOT_METADATA_CACHE_DIR': os.path.join(scratch, 'metadata'),
+        'ANCHOR_INDEX_PATH': os.path.join(scratch, 'anchor-index.sqlite3'),
+        'ENV': 'local',
+        # Room for the cold-start CONFIRM_EMPLOYMENT estimate, so email2's first run anchors too.
+        'RUN_TIME_BUDGET_SECONDS': '60',
+        'ACTIONS_PAGE_SIZE': str(actions_per_run),
+    })
+    os.environ.update(overrides)
+
+
+# --- Scenarios ---
+
+def seed_email2(state, start, count, confirm_ratio):
+    """Queues `count` pending actions, each with its job history document."""
+    jobs, actions = [], []
+    for i in range(start, start + count):
+        jobs.append({
+            '$id': f'job-{i}', 'candidate_id': f'candidate-{i}', 'company_name': f'Company {i % 97}',
+            'job_title': 'Engineer', 'description': 'Built <things> & shipped them.', 'verifier_email': f'verifier{i}@example.com',
+            'start_date': '2020-01-01T00:00:00.000+00:00', 'end_date': '2023-06-30T00:00:00.000+00:00', 'is_current_job': False,
+            'verification_message': 'Please confirm.', 'verification_status': 'VERIFIED_BY_RECIPIENT',
+        })
+        action_type = 'CONFIRM_EMPLOYMENT' if random.random() < confirm_ratio else 'SEND_VERIFICATION_EMAIL'
+        actions.append({
+            '$id': f'action-{i}', 'action_type': action_type, 'status': 'pending', 'attempts': 0,
+            'payload': f'{{"job_history_id": "job-{i}"}}', '$createdAt': (EPOCH + datetime.timedelta(milliseconds=i)).isoformat(timespec='milliseconds'),
+        })
+    with state.lock:
+        state.seed(DB_ID, COLLECTIONS['APPWRITE_JOB_HISTORY_ID'], jobs)
+        state.seed(DB_ID, COLLECTIONS['APPWRITE_SERVER_ACTIONS_COLLECTION_ID'], actions)
+
+
+def seed_candidates(state, count, file_bytes):
+    candidates = []
+    for i in range(count):
+        file_id = f'resume-{i}'
+        state.add_file(RESUME_BUCKET_ID, file_id, random.randbytes(file_bytes), name=f'{file_id}.pdf')
+        candidates.append({'$id': f'candidate-{i:06d}', 'name': f'Candidate {i}', 'resume_file_id': file_id,
+                           'resume_file_hash': None, 'resume_file_hashed_id': None})
+    state.seed(DB_ID, COLLECTIONS['APPWRITE_CANDIDATES_COLLECTION_ID'], candidates)
+
+
+def clear_hashes(state):
+    """Marks every candidate's resume as unhashed, so the next scheduled run is a full pass."""
+    with state.lock:
+        for candidate in state.collection(DB_ID, COLLECTIONS['APPWRITE_CANDIDATES_COLLECTION_ID']).values():
+            candidate['resume_file_hash'] = None
+        state.collection(DB_ID, COLLECTIONS['APPWRITE_JOB_CHECKPOINTS_COLLECTION_ID']).clear()
+
+
+def make_request(scenario, i, args):
+    if scenario == 'store':
+        return Request(body={'blob_text': f'resume {i} {random.random()}'})
+    if scenario == 'store-submit':
+        return Request(body={'blob_text': f'resume {i} {random.random()}', 'wait': False})
+    if scenario == 'store-upload':
+        return Request(body=random.randbytes(args.upload_bytes), headers={'content-type': 'application/octet-stream'})
+    if scenario == 'store-read':
+        return Request(method='GET')
+    return Request(body={})
+
+
+def failed(response):
+    body = response['body'] if isinstance(response['body'], dict) else {}
+    return response['status_code'] >= 400 or body.get('status_code', 200) >= 400 or body.get('status') == 'failure'
+
+
+def run_scenario(scenario, args, phases, appwrite, node):
+    module = load_function(SCENARIOS[scenario])
+    errors = []
+    skipped = []
+    action_numbers = itertools.count(len(appwrite.state.collection(DB_ID, COLLECTIONS['APPWRITE_SERVER_ACTIONS_COLLECTION_ID'])), args.actions_per_run)
+
+    def invoke(i, record=True):
+        # Every scheduled run starts with a fresh backlog: one page of actions, or unhashed resumes.
+        if scenario.startswith('email2'):
+            seed_email2(appwrite.state, next(action_numbers), args.actions_per_run, args.confirm_ratio)
+        elif scenario == 'hash-resume-files':
+            clear_hashes(appwrite.state)
+        context = Context(make_request(scenario, i, args))
+        started = time.perf_counter()
+        response = module.main(context)
+        elapsed = time.perf_counter() - started
+        if record:
+            phases.record(f'invocation {scenario}', elapsed)
+        if failed(response):
+            errors.append((response, context.errors[-3:]))
+        if scenario == 'email2-workers' and isinstance(response['body'], dict):
+            skipped.extend(a for a in response['body'].get('actions', []) if a['status'] == 'skipped')
+        return response
+
+    # Cold start (pool connections, runtime metadata) is reported separately from the steady state.
+    for i in range(args.warmup):
+        started = time.perf_counter()
+        invoke(-1 - i, record=False)
+        print(f'{scenario}: warm-up invocation {i + 1} took {(time.perf_counter() - started) * 1000:.1f} ms')
+    phases.samples.clear()
+    errors.clear()
+
+    # Scheduled functions run one execution at a time, as their cron schedule does; email2-workers
+    # overlaps them on purpose.
+    concurrency = 1 if scenario in ('email2', 'hash-resume-files') else args.concurrency
+    submitted_before = node.submitted
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(invoke, range(args.invocations)))
+    wall_time = time.perf_counter() - started
+
+    print(f'{scenario}: {args.invocations} invocation(s), concurrency {concurrency}, {wall_time:.2f}s wall, '
+          f'{args.invocations / wall_time:.1f} invocations/s, {len(errors)} failed, '
+          f'{node.submitted - submitted_before} extrinsic(s) submitted')
+    phases.report(wall_time)
+    for response, context_errors in errors[:3]:
+        print(f'  failed: {response["body"]}  {context_errors}')
+
+    if scenario.startswith('email2'):
+        statuses = {}
+        for action in appwrite.state.collection(DB_ID, COLLECTIONS['APPWRITE_SERVER_ACTIONS_COLLECTION_ID']).values():
+            statuses[action['status']] = statuses.get(action['status'], 0) + 1
+        print(f'  actions by status: {statuses}, emails sent: {len(appwrite.state.emails)}')
+    if scenario == 'email2-workers':
+        recipients = [str(email.get('to')) for email in appwrite.state.emails]
+        print(f'  claim conflicts: {len(skipped)}, duplicate sends: {len(recipients) - len(set(recipients))}')
+    print()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('scenarios', nargs='*', default=['store', 'store-read', 'email2', 'hash-resume-files'],
+                        help=f'any of {", ".join(SCENARIOS)}')
+    parser.add_argument('--invocations', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--block-time', type=float, default=0.2)
+    parser.add_argument('--finality-lag', type=int, default=2)
+    parser.add_argument('--rpc-latency', type=float, default=0.001)
+    parser.add_argument('--appwrite-latency', type=float, default=0.002)
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of contract calls that fail on chain')
+    parser.add_argument('--upload-bytes', type=int, default=256 * 1024)
+    parser.add_argument('--actions-per-run', type=int, default=25)
+    parser.add_argument('--confirm-ratio', type=float, default=0.5)
+    parser.add_argument('--candidates', type=int, default=200)
+    parser.add_argument('--file-bytes', type=int, default=200 * 1024)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    unknown = [scenario for scenario in args.scenarios if scenario not in SCENARIOS]
+    if unknown:
+        parser.error(f'unknown scenario(s): {", ".join(unknown)}')
+    random.seed(args.seed)
+
+    with AppwriteServer(latency=args.appwrite_latency) as appwrite:
+        # The selectors come from the same ABI the functions load.
+        sys.path.insert(0, os.path.join(BACKEND_DIR, 'src'))
+        import chain
+        contract = chain.get_contract(CONTRACT_ADDRESS, os.path.join(BACKEND_DIR, 'src', 'zid_contract.json'))
+        node = StandInNode(
+            CONTRACT_ADDRESS,
+            store_selector=contract.messages['store_verified_resume_data'].selector,
+            read_selector=contract.messages['get_verified_resume_data'].selector,
+            block_time=args.block_time, finality_lag=args.finality_lag, rpc_latency=args.rpc_latency,
+            failure_rate=args.failure_rate,
+        )
+        with NodeServer(node) as node_server:
+            configure_environment(node_server.url, appwrite, args.actions_per_run, dict(pair.split('=', 1) for pair in args.env))
+            seed_candidates(appwrite.state, args.candidates, args.file_bytes)
+
+            phases = Phases()
+            instrument(phases)
+            for scenario in args.scenarios:
+                run_scenario(scenario, args, phases, appwrite, node)
+
+            print(f'node: {node.head.number} block(s), {node.submitted} extrinsic(s) submitted, {node.failed} failed on chain')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Cold-start import profile of the Appwrite functions, with an import-time budget.
+
+Every cold start of a function pays for importing its src/main.py before main(context)
+runs. This imports each function's main in a fresh interpreter, as the runtime does,
+and reports:
+
+    - the cold import time (the best of --repeat runs, to keep scheduler noise out);
+    - the most expensive modules under `python -X importtime`, by self and cumulative time;
+    - the cost per top-level package (appwrite, substrateinterface, resend, ...).
+
+With a budget (--budget-ms, or the per-function default in BUDGETS_MS) it exits with
+status 1 when a function's cold import takes longer, so CI can run it as a regression
+check:
+
+    python benchmarks/import_profile.py [function ...] [--repeat 3] [--top 15]
+        [--budget-ms N] [--no-budget]
+
+The functions index Appwrite responses as dicts and pin the Appwrite SDK they run with
+(appwrite>=15,<16, see their requirements.txt); later SDKs import much more at module
+load, so the budgets only hold for the pinned SDK and the profile refuses to run with
+another one. CI runs it on every change to backend/ (.github/workflows/backend.yml).
+"""
+import argparse
+import importlib.metadata
+import os
+import subprocess
+import sys
+
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+FUNCTIONS = {
+    'store': os.path.join(BACKEND_DIR, 'functions', 'Store Verified Resume Data', 'src'),
+    'email2': os.path.join(BACKEND_DIR, 'functions', 'email2', 'src'),
+    'hash-resume-files': os.path.join(BACKEND_DIR, 'functions', 'Hash Resume Files', 'src'),
+}
+# Cold import budgets in milliseconds. email2 loads the chain libraries and resend only when
+# a run needs them, so its budget leaves no room for substrateinterface; the Store function
+# writes to the chain on every request and imports it up front.
+BUDGETS_MS = {
+    'store': 1000,
+    'email2': 400,
+    'hash-resume-files': 400,
+}
+# The Appwrite SDK major version the functions pin and the budgets were set with.
+APPWRITE_SDK_MAJOR = 15
+# Configuration the functions read at import; nothing is contacted while importing.
+ENVIRONMENT = {
+    'ENV': 'local',
+    'APPWRITE_FUNCTION_API_ENDPOINT': 'http://127.0.0.1:9/v1',
+    'APPWRITE_FUNCTION_PROJECT_ID': 'import-profile',
+    'APPWRITE_FUNCTION_API_KEY': 'import-profile',
+    'POLKADOT_SUBSTRATE_URL': 'ws://127.0.0.1:9',
+    'POLKADOT_CONTRACT_ADDRESS': '5FHneW46xGXgs5mUiveU4sbTyGBzmstUspZC92UhjJM694ty',
+    'POLKADOT_KEYPAIR_ACCOUNT': '//Alice',
+    'POLKADOT_KEYPAIR_MNEMONIC': 'bottom drive obey lake curtain smoke basket hold race lonely fit walk',
+    'RESEND_API_KEY': 're_import_profile',
+}
+# Run in the child interpreter: imports the function's main.py as its own package, like
+# benchmarks/end_to_end.py does, and prints how long that took.
+IMPORT_SCRIPT = '''
+import importlib, importlib.machinery, importlib.util, sys, time
+started = time.perf_counter()
+spec = importlib.machinery.ModuleSpec('profiled_function', None, is_package=True)
+spec.submodule_search_locations = [sys.argv[1]]
+sys.modules['profiled_function'] = importlib.util.module_from_spec(spec)
+importlib.import_module('profiled_function.main')
+print(time.perf_counter() - started)
+'''
+
+
+def _run(source_dir, importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', IMPORT_SCRIPT, source_dir]
+    env = {**os.environ, **ENVIRONMENT, 'PYTHONDONTWRITEBYTECODE': '1', 'PYTHONWARNINGS': 'ignore'}
+    result = subprocess.run(command, capture_output=True, text=True, env=env, cwd=source_dir)
+    if result.returncode != 0:
+        raise RuntimeError(f'Importing {source_dir}/main.py failed:\n{result.stderr.strip()}')
+    return float(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us)] from the `import time:` lines of -X importtime."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def by_package(modules):
+    """Self time summed per top-level package, largest first."""
+    totals = {}
+    for name, self_us, _ in modules:
+        package = name.split('.')[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def profile(name, repeat, top):
+    source_dir = FUNCTIONS[name]
+    cold_ms = min(_run(source_dir)[0] for _ in range(repeat)) * 1000
+    modules = parse_importtime(_run(source_dir, importtime=True)[1])
+
+    print(f'\n{name}: cold import {cold_ms:.0f} ms (best of {repeat}), {len(modules)} modules')
+    print(f'  {"package":<28} {"self ms":>9}')
+    for package, self_us in by_package(modules)[:top]:
+        print(f'  {package:<28} {self_us / 1000:9.1f}')
+    print(f'  {"module":<48} {"self ms":>9} {"cumul ms":>9}')
+    for module, self_us, cumulative_us in sorted(modules, key=lambda m: m[2], reverse=True)[:top]:
+        print(f'  {module:<48} {self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}')
+    return cold_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('functions', nargs='*', help=f'functions to profile (default: all of {", ".join(FUNCTIONS)})')
+    parser.add_argument('--repeat', type=int, default=3, help='cold imports per function; the fastest is reported')
+    parser.add_argument('--top', type=int, default=15, help='packages and modules to list')
+    parser.add_argument('--budget-ms', type=float, help='cold import budget for every function (default: BUDGETS_MS)')
+    parser.add_argument('--no-budget', action='store_true', help='only report, never fail')
+    args = parser.parse_args()
+
+    unknown = [name for name in args.functions if name not in FUNCTIONS]
+    if unknown:
+        parser.error(f'unknown function(s) {", ".join(unknown)}; choose from {", ".join(FUNCTIONS)}')
+
+    sdk_version = importlib.metadata.version('appwrite')
+    if int(sdk_version.split('.')[0]) != APPWRITE_SDK_MAJOR:
+        print(f'appwrite {sdk_version} is installed; the functions pin appwrite {APPWRITE_SDK_MAJOR}.x '
+              f'(pip install -r backend/requirements.txt).')
+        return 2
+
+    over_budget = []
+    for name in args.functions or FUNCTIONS:
+        cold_ms = profile(name, max(args.repeat, 1), args.top)
+        budget_ms = args.budget_ms if args.budget_ms is not None else BUDGETS_MS[name]
+        if not args.no_budget and cold_ms > budget_ms:
+            over_budget.append(f'{name}: {cold_ms:.0f} ms > {budget_ms:.0f} ms')
+
+    if over_budget:
+        print('\nCold import over budget:\n  ' + '\n  '.join(over_budget))
+        return 1
+    if not args.no_budget:
+        print('\nAll cold imports within budget.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+Throughput benchmark: transactions per block from one signing account, before and
+after the in-memory NonceManager.
+
+The stand-in node answers RPCs after RPC_LATENCY, produces a block every BLOCK_TIME
+seconds and includes pooled extrinsics whose nonces are contiguous with the account
+nonce, like a Substrate transaction pool. "before" fetches the nonce from the node
+for every call and waits for inclusion, as ContractInstance.exec does (run serially,
+then with concurrent callers racing for the same nonce). "after" runs the same
+callers through chain.submit_signed, so their nonces are allocated locally.
+
+Before benchmarking, check_signing_failure verifies that a submission whose signing
+fails gives its reserved nonce back: the next submission must use the nonce the
+chain expects. It exits with status 1 if not.
+
+    python benchmarks/nonce_pipelining.py [blocks] [workers]
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from substrateinterface.exceptions import SubstrateRequestException
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import chain  # noqa: E402
+
+
+BLOCK_TIME = 0.05
+RPC_LATENCY = 0.002
+ADDRESS = '5StandInSigner'
+
+
+class StandInNode:
+    def __init__(self, block_time=BLOCK_TIME):
+        self.block_time = block_time
+        self.account_nonce = 0
+        self.pool = {}
+        self.blocks = []
+        self._cond = threading.Condition()
+        self._running = True
+        self._producer = threading.Thread(target=self._produce, daemon=True)
+        self._producer.start()
+
+    def _produce(self):
+        while self._running:
+            time.sleep(self.block_time)
+            with self._cond:
+                included = 0
+                while self.account_nonce in self.pool:
+                    self.pool.pop(self.account_nonce).set()
+                    self.account_nonce += 1
+                    included += 1
+                self.blocks.append(included)
+                self._cond.notify_all()
+
+    def stop(self):
+        self._running = False
+        self._producer.join()
+
+    def next_index(self):
+        time.sleep(RPC_LATENCY)
+        with self._cond:
+            nonce = self.account_nonce
+            while nonce in self.pool:
+                nonce += 1
+            return nonce
+
+    def submit(self, nonce, wait_for_inclusion):
+        time.sleep(RPC_LATENCY)
+        with self._cond:
+            if nonce < self.account_nonce:
+                raise SubstrateRequestException({'code': 1010, 'message': 'Invalid Transaction', 'data': 'Transaction is outdated'})
+            if nonce in self.pool:
+                raise SubstrateRequestException({'code': 1014, 'message': 'Priority is too low: (0 vs 0)'})
+            included = self.pool[nonce] = threading.Event()
+        if wait_for_inclusion:
+            included.wait()
+        return SimpleNamespace(extrinsic_hash=f'0x{nonce:064x}')
+
+
+class StandInSubstrate:
+    """The slice of SubstrateInterface that submit_signed and ContractInstance.exec rely on."""
+
+    url = 'ws://stand-in'
+
+    def __init__(self, node):
+        self.node = node
+
+    def get_account_nonce(self, address):
+        return self.node.next_index()
+
+    def create_signed_extrinsic(self, call, keypair, era=None, nonce=None):
+        return SimpleNamespace(nonce=self.get_account_nonce(keypair.ss58_address) if nonce is None else nonce)
+
+    def submit_extrinsic(self, extrinsic, wait_for_inclusion=False):
+        return self.node.submit(extrinsic.nonce, wait_for_inclusion)
+
+
+class FailingSigner(StandInSubstrate):
+    """Fails to sign the first `failures` extrinsics, as a dropped connection during signing would."""
+
+    def __init__(self, node, failures=1):
+        super().__init__(node)
+        self.failures = failures
+
+    def create_signed_extrinsic(self, call, keypair, era=None, nonce=None):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('stand-in signing failure')
+        return super().create_signed_extrinsic(call, keypair, era=era, nonce=nonce)
+
+
+def check_signing_failure():
+    """A failed signing must not leave a gap: the following submission uses the chain's next nonce."""
+    node = StandInNode()
+    substrate = FailingSigner(node)
+    keypair = SimpleNamespace(ss58_address=ADDRESS)
+    manager = chain.NonceManager()
+    try:
+        try:
+            chain.submit_signed(substrate, keypair, call=None, wait_for_inclusion=False, nonce_manager=manager)
+            raise AssertionError('signing was expected to fail')
+        except ConnectionError:
+            pass
+        receipt = chain.submit_signed(substrate, keypair, call=None, wait_for_inclusion=False, nonce_manager=manager)
+    finally:
+        node.stop()
+    submitted_nonce = int(receipt.extrinsic_hash, 16)
+    print(f'signing failure check: resubmitted with nonce {submitted_nonce}, chain expected 0')
+    return submitted_nonce == 0
+
+
+def run(label, blocks, submit, workers):
+    node = StandInNode()
+    substrate = StandInSubstrate(node)
+    keypair = SimpleNamespace(ss58_address=ADDRESS)
+    deadline = time.monotonic() + blocks * BLOCK_TIME
+    errors = []
+
+    def worker():
+        while time.monotonic() < deadline:
+            try:
+                submit(substrate, keypair)
+            except SubstrateRequestException as e:
+                errors.append(e)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in range(workers):
+            executor.submit(worker)
+    node.stop()
+
+    produced = node.blocks[:blocks] or [0]
+    print(f'{label:<8} workers={workers:<3} blocks={len(produced):<4} '
+          f'tx/block={sum(produced) / len(produced):6.2f} errors={len(errors)}')
+
+
+def main():
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+    if not check_signing_failure():
+        print('FAILED: a failed signing leaked its reserved nonce')
+        sys.exit(1)
+
+    def fetch_nonce_per_call(substrate, keypair):
+        extrinsic = substrate.create_signed_extrinsic(call=None, keypair=keypair)
+        return substrate.submit_extrinsic(extrinsic, wait_for_inclusion=True)
+
+    run('before', blocks, fetch_nonce_per_call, workers=1)
+    run('before', blocks, fetch_nonce_per_call, workers=workers)
+
+    manager = chain.NonceManager()
+    run('after', blocks, lambda substrate, keypair: chain.submit_signed(
+        substrate, keypair, call=None, nonce_manager=manager), workers=workers)
+    print(f'nonce resyncs: {manager.resyncs}')
+
+
+if __name__ == '__main__':
+    main()
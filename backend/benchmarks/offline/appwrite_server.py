@@ -0,0 +1,320 @@
+"""
+An in-memory Appwrite REST API (databases and storage) and Resend email API on one
+local HTTP server, so the functions run with their real SDK clients pointed at it.
+
+Only the endpoints and query methods the functions use are implemented. Documents get
+$id, $createdAt and $updatedAt like Appwrite documents; file downloads honour Range
+headers. Every request is delayed by `latency` to stand in for the network and the
+Appwrite server itself.
+"""
+import datetime
+import itertools
+import json
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds')
+
+
+class ApiError(Exception):
+    def __init__(self, code, message, error_type='general_argument_invalid'):
+        super().__init__(message)
+        self.code = code
+        self.body = {'message': message, 'code': code, 'type': error_type, 'version': 'offline'}
+
+
+def _compare(method, value, operand):
+    if value is None:
+        return False
+    if method == 'lessThan':
+        return value < operand
+    if method == 'lessThanEqual':
+        return value <= operand
+    if method == 'greaterThan':
+        return value > operand
+    return value >= operand
+
+
+def _matches(doc, query):
+    method = query['method']
+    if method == 'and':
+        return all(_matches(doc, q) for q in query['values'])
+    if method == 'or':
+        return any(_matches(doc, q) for q in query['values'])
+
+    value = doc.get(query.get('attribute'))
+    values = query.get('values') or []
+    if method == 'equal':
+        return value in values
+    if method == 'notEqual':
+        return value not in values
+    if method in ('lessThan', 'lessThanEqual', 'greaterThan', 'greaterThanEqual'):
+        return _compare(method, value, values[0])
+    if method == 'isNull':
+        return value is None
+    if method == 'isNotNull':
+        return value is not None
+    if method == 'startsWith':
+        return isinstance(value, str) and value.startswith(values[0])
+    raise ApiError(400, f'Query method {method!r} is not supported by the offline Appwrite server')
+
+
+class AppwriteState:
+    """Documents, files and sent emails, guarded by one lock."""
+
+    def __init__(self):
+        self.collections = {}
+        self.files = {}
+        self.emails = []
+        self.lock = threading.Lock()
+        self._email_ids = itertools.count(1)
+
+    def collection(self, database_id, collection_id):
+        return self.collections.setdefault((database_id, collection_id), {})
+
+    def seed(self, database_id, collection_id, documents):
+        """Inserts documents as if they had been created one after another, oldest first."""
+        collection = self.collection(database_id, collection_id)
+        for document in documents:
+            created = document.get('$createdAt') or _now()
+            collection[document['$id']] = {'$createdAt': created, '$updatedAt': created, **document}
+
+    def add_file(self, bucket_id, file_id, data, name=None):
+        self.files[(bucket_id, file_id)] = {
+            'meta': {'$id': file_id, 'bucketId': bucket_id, 'name': name or file_id, 'sizeOriginal': len(data),
+                     'mimeType': 'application/pdf', '$createdAt': _now(), '$updatedAt': _now()},
+            'data': data,
+        }
+
+    # --- Databases ---
+
+    def list_documents(self, database_id, collection_id, queries):
+        documents = list(self.collection(database_id, collection_id).values())
+        filters, order, limit, offset, cursor = [], [], 25, 0, None
+        for query in queries:
+            method = query['method']
+            if method in ('orderAsc', 'orderDesc'):
+                order.append((query['attribute'], method == 'orderDesc'))
+            elif method == 'limit':
+                limit = query['values'][0]
+            elif method == 'offset':
+                offset = query['values'][0]
+            elif method == 'cursorAfter':
+                cursor = query['values'][0]
+            elif method != 'select':
+                filters.append(query)
+
+        documents = [doc for doc in documents if all(_matches(doc, q) for q in filters)]
+        if cursor is not None:
+            # Like Appwrite, the cursor only has to exist; it need not match the filters any more.
+            cursor_doc = self.collection(database_id, collection_id).get(cursor)
+            if cursor_doc is None:
+                raise ApiError(400, f'Document with id "{cursor}" not found for cursor', 'general_cursor_not_found')
+            if cursor_doc not in documents:
+                documents.append(cursor_doc)
+        for attribute, descending in reversed(order or [('$createdAt', False)]):
+            documents.sort(key=lambda doc: (doc.get(attribute) is not None, doc.get(attribute)), reverse=descending)
+        if cursor is not None:
+            position = next(i for i, doc in enumerate(documents) if doc['$id'] == cursor)
+            documents = documents[position + 1:]
+        page = documents[offset:offset + limit]
+        return {'total': len(documents), 'documents': [dict(doc) for doc in page]}
+
+    def get_document(self, database_id, collection_id, document_id):
+        document = self.collection(database_id, collection_id).get(document_id)
+        if document is None:
+            raise ApiError(404, 'Document with the requested ID could not be found.', 'document_not_found')
+        return dict(document)
+
+    def create_document(self, database_id, collection_id, document_id, data):
+        collection = self.collection(database_id, collection_id)
+        if document_id == 'unique()':
+            document_id = f'{time.time_ns():x}'
+        if document_id in collection:
+            raise ApiError(409, 'Document with the requested ID already exists.', 'document_already_exists')
+        now = _now()
+        collection[document_id] = {**data, '$id': document_id, '$createdAt': now, '$updatedAt': now,
+                                   '$collectionId': collection_id, '$databaseId': database_id}
+        return dict(collection[document_id])
+
+    def update_document(self, database_id, collection_id, document_id, data):
+        document = self.collection(database_id, collection_id).get(document_id)
+        if document is None:
+            raise ApiError(404, 'Document with the requested ID could not be found.', 'document_not_found')
+        document.update(data)
+        document['$updatedAt'] = _now()
+        return dict(document)
+
+    def upsert_documents(self, database_id, collection_id, documents):
+        collection = self.collection(database_id, collection_id)
+        now = _now()
+        result = []
+        for data in documents:
+            document = collection.setdefault(data['$id'], {'$createdAt': now})
+            document.update(data)
+            document['$updatedAt'] = now
+            result.append(dict(document))
+        return {'total': len(result), 'documents': result}
+
+    def delete_document(self, database_id, collection_id, document_id):
+        if self.collection(database_id, collection_id).pop(document_id, None) is None:
+            raise ApiError(404, 'Document with the requested ID could not be found.', 'document_not_found')
+        return None
+
+    # --- Storage ---
+
+    def get_file(self, bucket_id, file_id):
+        stored = self.files.get((bucket_id, file_id))
+        if stored is None:
+            raise ApiError(404, 'The requested file could not be found.', 'storage_file_not_found')
+        return stored
+
+    # --- Resend ---
+
+    def send_emails(self, emails):
+        ids = []
+        for email in emails:
+            self.emails.append(email)
+            ids.append({'id': f'offline-{next(self._email_ids)}'})
+        return ids
+
+
+ROUTES = [
+    ('GET', r'/databases/([^/]+)/collections/([^/]+)/documents', 'list_documents'),
+    ('POST', r'/databases/([^/]+)/collections/([^/]+)/documents', 'create_document'),
+    ('PUT', r'/databases/([^/]+)/collections/([^/]+)/documents', 'upsert_documents'),
+    ('GET', r'/databases/([^/]+)/collections/([^/]+)/documents/([^/]+)', 'get_document'),
+    ('PATCH', r'/databases/([^/]+)/collections/([^/]+)/documents/([^/]+)', 'update_document'),
+    ('DELETE', r'/databases/([^/]+)/collections/([^/]+)/documents/([^/]+)', 'delete_document'),
+    ('GET', r'/storage/buckets/([^/]+)/files/([^/]+)', 'get_file'),
+    ('GET', r'/storage/buckets/([^/]+)/files/([^/]+)/download', 'download_file'),
+    ('POST', r'/emails/batch', 'send_email_batch'),
+    ('POST', r'/emails', 'send_email'),
+]
+ROUTES = [(method, re.compile(pattern + '$'), name) for method, pattern, name in ROUTES]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def _dispatch(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        url = urllib.parse.urlsplit(self.path)
+        path = url.path.removeprefix('/v1')
+        for method, pattern, name in ROUTES:
+            match = pattern.match(path)
+            if method == self.command and match:
+                break
+        else:
+            match = None
+        body = self._body()
+        if match is None:
+            return self._send(404, ApiError(404, f'Route {self.command} {path} not found', 'general_route_not_found').body)
+
+        server.record(name)
+        try:
+            with server.state.lock:
+                response = getattr(self, name)(*match.groups(), query=urllib.parse.parse_qs(url.query), body=body)
+        except ApiError as e:
+            response = (e.code, e.body)
+        self._send(*response)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _dispatch
+
+    # --- Route handlers: called with the state lock held, they return the response to send ---
+
+    def list_documents(self, database_id, collection_id, query, body):
+        queries = [json.loads(value) for key, values in sorted(query.items(), key=lambda item: _query_index(item[0]))
+                   if key.startswith('queries') for value in values]
+        return 200, self.server.state.list_documents(database_id, collection_id, queries)
+
+    def create_document(self, database_id, collection_id, query, body):
+        return 201, self.server.state.create_document(database_id, collection_id, body['documentId'], body.get('data') or {})
+
+    def upsert_documents(self, database_id, collection_id, query, body):
+        return 200, self.server.state.upsert_documents(database_id, collection_id, body['documents'])
+
+    def get_document(self, database_id, collection_id, document_id, query, body):
+        return 200, self.server.state.get_document(database_id, collection_id, document_id)
+
+    def update_document(self, database_id, collection_id, document_id, query, body):
+        return 200, self.server.state.update_document(database_id, collection_id, document_id, body.get('data') or {})
+
+    def delete_document(self, database_id, collection_id, document_id, query, body):
+        self.server.state.delete_document(database_id, collection_id, document_id)
+        return 204, b'', 'text/plain'
+
+    def get_file(self, bucket_id, file_id, query, body):
+        return 200, self.server.state.get_file(bucket_id, file_id)['meta']
+
+    def download_file(self, bucket_id, file_id, query, body):
+        data = self.server.state.get_file(bucket_id, file_id)['data']
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+        if not match:
+            return 200, data, 'application/octet-stream'
+        start = int(match.group(1))
+        end = min(int(match.group(2) or len(data) - 1), len(data) - 1)
+        return 206, data[start:end + 1], 'application/octet-stream', {'Content-Range': f'bytes {start}-{end}/{len(data)}'}
+
+    def send_email_batch(self, query, body):
+        return 200, {'data': self.server.state.send_emails(body)}
+
+    def send_email(self, query, body):
+        return 200, self.server.state.send_emails([body])[0]
+
+
+def _query_index(key):
+    match = re.search(r'\[(\d+)\]', key)
+    return int(match.group(1)) if match else 0
+
+
+class AppwriteServer(ThreadingHTTPServer):
+    """Serves an AppwriteState on http://127.0.0.1:<port>; `endpoint` is what the SDK client is pointed at."""
+
+    daemon_threads = True
+
+    def __init__(self, state=None, latency=0.002, host='127.0.0.1', port=0):
+        super().__init__((host, port), _Handler)
+        self.state = state or AppwriteState()
+        self.latency = latency
+        self.url = f'http://{host}:{self.server_address[1]}'
+        self.endpoint = self.url + '/v1'
+        self.route_counts = {}
+        self._counts_lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, name='offline-appwrite', daemon=True)
+
+    def record(self, route):
+        with self._counts_lock:
+            self.route_counts[route] = self.route_counts.get(route, 0) + 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,65 @@
+"""
+The `context` object the Appwrite Python runtime passes to main(context): the request,
+a response builder, and log/error sinks. Logs are kept so a run can be inspected.
+"""
+import json
+
+
+class Request:
+    def __init__(self, method='POST', body=b'', headers=None, query=None, path='/'):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+            headers = {'content-type': 'application/json', **(headers or {})}
+        elif isinstance(body, str):
+            body = body.encode()
+        self.method = method
+        self.headers = {name.lower(): value for name, value in (headers or {}).items()}
+        self.headers.setdefault('content-length', str(len(body)))
+        self.query = query or {}
+        self.query_string = '&'.join(f'{key}={value}' for key, value in self.query.items())
+        self.path = path
+        self.body_binary = body
+
+    @property
+    def body_raw(self):
+        return self.body_binary.decode('utf-8', errors='replace')
+
+    @property
+    def body_text(self):
+        return self.body_raw
+
+    @property
+    def body_json(self):
+        return json.loads(self.body_binary) if self.body_binary else {}
+
+    @property
+    def body(self):
+        return self.body_json if self.headers.get('content-type', '').startswith('application/json') else self.body_raw
+
+
+class Response:
+    def json(self, data, status_code=200, headers=None):
+        return {'status_code': status_code, 'body': data, 'headers': headers or {}}
+
+    def text(self, body, status_code=200, headers=None):
+        return {'status_code': status_code, 'body': body, 'headers': headers or {}}
+
+    def empty(self):
+        return {'status_code': 204, 'body': None, 'headers': {}}
+
+
+class Context:
+    def __init__(self, req=None):
+        self.req = req or Request()
+        self.res = Response()
+        self.logs = []
+        self.errors = []
+
+    def log(self, message):
+        self.logs.append(str(message))
+
+    def warn(self, message):
+        self.logs.append(str(message))
+
+    def error(self, message):
+        self.errors.append(str(message))
@@ -0,0 +1,208 @@
+"""
+A minimal V14 runtime for the stand-in node: System, Timestamp and Contracts pallets
+with the types, signed extensions and storage that SubstrateInterface needs to build,
+sign, submit and decode the ZeroID contract calls, encoded as real SCALE metadata.
+"""
+from scalecodec.base import RuntimeConfigurationObject, ScaleBytes
+from scalecodec.type_registry import load_type_registry_preset
+
+
+SPEC_VERSION = 100
+RUNTIME_VERSION = {
+    'specName': 'zeroid-stand-in',
+    'implName': 'zeroid-stand-in',
+    'authoringVersion': 1,
+    'specVersion': SPEC_VERSION,
+    'implVersion': 1,
+    'apis': [],
+    'transactionVersion': 1,
+    'stateVersion': 1,
+}
+SS58_PREFIX = 42
+
+PALLET_SYSTEM = 0
+PALLET_TIMESTAMP = 1
+PALLET_CONTRACTS = 2
+
+
+class _Types:
+    """Builds a scale-info PortableRegistry, reusing identical types."""
+
+    def __init__(self):
+        self.types = []
+        self._ids = {}
+
+    def _add(self, key, path, definition, params=()):
+        if key not in self._ids:
+            self._ids[key] = len(self.types)
+            self.types.append({'id': len(self.types), 'type': {
+                'path': path.split('::') if path else [],
+                'params': [{'name': name, 'type': type_id} for name, type_id in params],
+                'def': definition,
+                'docs': [],
+            }})
+        return self._ids[key]
+
+    @staticmethod
+    def _fields(fields):
+        # Call arguments carry their Rust type name, which call decoding relies on.
+        return [{'name': field[0], 'type': field[1], 'typeName': field[2] if len(field) > 2 else None, 'docs': []}
+                for field in fields]
+
+    def primitive(self, name):
+        return self._add(('primitive', name), None, {'primitive': name})
+
+    def sequence(self, type_id):
+        return self._add(('sequence', type_id), None, {'sequence': {'type': type_id}})
+
+    def array(self, length, type_id):
+        return self._add(('array', length, type_id), None, {'array': {'len': length, 'type': type_id}})
+
+    def compact(self, type_id):
+        return self._add(('compact', type_id), None, {'compact': {'type': type_id}})
+
+    def tuple(self, *type_ids):
+        return self._add(('tuple', type_ids), None, {'tuple': list(type_ids)})
+
+    def composite(self, path, fields, params=()):
+        return self._add(('path', path, tuple(params)), path, {'composite': {'fields': self._fields(fields)}}, params)
+
+    def variant(self, path, variants, params=()):
+        return self._add(('path', path, tuple(params)), path, {'variant': {'variants': [
+            {'name': name, 'fields': self._fields(fields), 'index': index, 'docs': []}
+            for index, (name, fields) in enumerate(variants)
+        ]}}, params)
+
+    def option(self, type_id):
+        return self.variant('Option', [('None', []), ('Some', [(None, type_id)])], params=[('T', type_id)])
+
+
+def _storage_entry(name, value, key=None, default=b''):
+    entry_type = {'Plain': value} if key is None else {'Map': {'hashers': ['Blake2_128Concat'], 'key': key, 'value': value}}
+    return {'name': name, 'modifier': 'Default', 'type': entry_type, 'default': '0x' + default.hex(), 'documentation': []}
+
+
+def metadata_v14():
+    """The runtime metadata as the value of a MetadataV14 struct."""
+    t = _Types()
+    u8, u16, u32, u64, u128 = (t.primitive(name) for name in ('u8', 'u16', 'u32', 'u64', 'u128'))
+    unit = t.tuple()
+    byte_vec = t.sequence(u8)
+    h256 = t.composite('primitive_types::H256', [(None, t.array(32, u8))])
+    account_id = t.composite('sp_core::crypto::AccountId32', [(None, t.array(32, u8))])
+    address = t.variant('sp_runtime::multiaddress::MultiAddress', [
+        ('Id', [(None, account_id)]),
+        ('Index', [(None, t.compact(unit))]),
+        ('Raw', [(None, byte_vec)]),
+        ('Address32', [(None, t.array(32, u8))]),
+        ('Address20', [(None, t.array(20, u8))]),
+    ], params=[('AccountId', account_id), ('AccountIndex', unit)])
+    signature = t.variant('sp_runtime::MultiSignature', [
+        ('Ed25519', [(None, t.composite('sp_core::ed25519::Signature', [(None, t.array(64, u8))]))]),
+        ('Sr25519', [(None, t.composite('sp_core::sr25519::Signature', [(None, t.array(64, u8))]))]),
+        ('Ecdsa', [(None, t.composite('sp_core::ecdsa::Signature', [(None, t.array(65, u8))]))]),
+    ])
+    weight = t.composite('sp_weights::weight_v2::Weight', [('ref_time', t.compact(u64)), ('proof_size', t.compact(u64))])
+    era = t.variant('sp_runtime::generic::era::Era', [('Immortal', [])] + [(f'Mortal{i}', [(None, u8)]) for i in range(1, 256)])
+
+    system_call = t.variant('frame_system::pallet::Call', [('remark', [('remark', byte_vec, 'Vec<u8>')])])
+    timestamp_call = t.variant('pallet_timestamp::pallet::Call', [('set', [('now', t.compact(u64), 'T::Moment')])])
+    contracts_call = t.variant('pallet_contracts::pallet::Call', [('call', [
+        ('dest', address, 'AccountIdLookupOf<T>'),
+        ('value', t.compact(u128), 'BalanceOf<T>'),
+        ('gas_limit', weight, 'Weight'),
+        ('storage_deposit_limit', t.option(t.compact(u128)), 'Option<<BalanceOf<T> as codec::HasCompact>::Type>'),
+        ('data', byte_vec, 'Vec<u8>'),
+    ])])
+    call = t.variant('node_runtime::RuntimeCall', [
+        ('System', [(None, system_call)]), ('Timestamp', [(None, timestamp_call)]), ('Contracts', [(None, contracts_call)]),
+    ])
+
+    dispatch_info = t.composite('frame_support::dispatch::DispatchInfo', [
+        ('weight', weight),
+        ('class', t.variant('frame_support::dispatch::DispatchClass', [('Normal', []), ('Operational', []), ('Mandatory', [])])),
+        ('pays_fee', t.variant('frame_support::dispatch::Pays', [('Yes', []), ('No', [])])),
+    ])
+    module_error = t.composite('sp_runtime::ModuleError', [('index', u8), ('error', t.array(4, u8))])
+    dispatch_error = t.variant('sp_runtime::DispatchError', [
+        ('Other', []), ('CannotLookup', []), ('BadOrigin', []), ('Module', [(None, module_error)]),
+    ])
+    system_event = t.variant('frame_system::pallet::Event', [
+        ('ExtrinsicSuccess', [('dispatch_info', dispatch_info)]),
+        ('ExtrinsicFailed', [('dispatch_error', dispatch_error), ('dispatch_info', dispatch_info)]),
+    ])
+    contracts_event = t.variant('pallet_contracts::pallet::Event', [
+        ('ContractEmitted', [('contract', account_id), ('data', byte_vec)]),
+        ('Called', [('caller', account_id), ('contract', account_id)]),
+    ])
+    event = t.variant('node_runtime::RuntimeEvent', [('System', [(None, system_event)]), ('Contracts', [(None, contracts_event)])])
+    phase = t.variant('frame_system::Phase', [('ApplyExtrinsic', [(None, u32)]), ('Finalization', []), ('Initialization', [])])
+    event_record = t.composite('frame_system::EventRecord', [('phase', phase), ('event', event), ('topics', t.sequence(h256))],
+                               params=[('E', event), ('T', h256)])
+
+    account_info = t.composite('frame_system::AccountInfo', [
+        ('nonce', u32), ('consumers', u32), ('providers', u32), ('sufficients', u32),
+        ('data', t.composite('pallet_balances::types::AccountData', [('free', u128), ('reserved', u128), ('frozen', u128), ('flags', u128)])),
+    ])
+
+    extensions = [
+        ('CheckSpecVersion', unit, u32),
+        ('CheckTxVersion', unit, u32),
+        ('CheckGenesis', unit, h256),
+        ('CheckMortality', era, h256),
+        ('CheckNonce', t.compact(u32), unit),
+        ('CheckWeight', unit, unit),
+        ('ChargeTransactionPayment', t.compact(u128), unit),
+    ]
+    extrinsic = t.composite('sp_runtime::generic::unchecked_extrinsic::UncheckedExtrinsic', [(None, byte_vec)], params=[
+        ('Address', address), ('Call', call), ('Signature', signature), ('Extra', t.tuple(*(ty for _, ty, _ in extensions))),
+    ])
+
+    pallets = [
+        {
+            'name': 'System', 'index': PALLET_SYSTEM,
+            'storage': {'prefix': 'System', 'entries': [
+                _storage_entry('Account', account_info, key=account_id, default=bytes(80)),
+                _storage_entry('Number', u32, default=bytes(4)),
+                _storage_entry('Events', t.sequence(event_record), default=b'\x00'),
+            ]},
+            'calls': {'ty': system_call},
+            'event': {'ty': system_event},
+            'constants': [{'name': 'SS58Prefix', 'type': u16, 'value': '0x' + SS58_PREFIX.to_bytes(2, 'little').hex(), 'documentation': []}],
+            'error': {'ty': t.variant('frame_system::pallet::Error', [('InvalidSpecName', [])])},
+        },
+        {
+            'name': 'Timestamp', 'index': PALLET_TIMESTAMP,
+            'storage': {'prefix': 'Timestamp', 'entries': [_storage_entry('Now', u64, default=bytes(8))]},
+            'calls': {'ty': timestamp_call}, 'event': None, 'constants': [], 'error': None,
+        },
+        {
+            # No PalletVersion entry, so ContractInstance keeps the pre-v10 ContractExecResult layout.
+            'name': 'Contracts', 'index': PALLET_CONTRACTS,
+            'storage': {'prefix': 'Contracts', 'entries': []},
+            'calls': {'ty': contracts_call},
+            'event': {'ty': contracts_event},
+            'constants': [],
+            'error': {'ty': t.variant('pallet_contracts::pallet::Error', [('OutOfGas', []), ('ContractTrapped', []), ('StorageDepositLimitExhausted', [])])},
+        },
+    ]
+    return {
+        'types': {'types': t.types},
+        'pallets': pallets,
+        'extrinsic': {'ty': extrinsic, 'version': 4, 'signed_extensions': [
+            {'identifier': name, 'ty': ty, 'additional_signed': additional} for name, ty, additional in extensions
+        ]},
+        'runtime_type': unit,
+    }
+
+
+def runtime_config():
+    """A runtime config with the stand-in metadata loaded, as a connected SubstrateInterface would have it."""
+    config = RuntimeConfigurationObject()
+    config.update_type_registry(load_type_registry_preset('core'))
+    metadata = config.create_scale_object('MetadataVersioned')
+    data = metadata.encode(['0x6d657461', {'V14': metadata_v14()}])
+    metadata = config.create_scale_object('MetadataVersioned', data=ScaleBytes(data.data))
+    metadata.decode()
+    config.add_portable_registry(metadata)
+    return config, metadata, '0x' + data.data.hex()
@@ -0,0 +1,530 @@
+"""
+A scripted Substrate node behind a real websocket JSON-RPC endpoint.
+
+It answers the RPCs that SubstrateInterface and chain.py issue (runtime version and
+metadata, headers and blocks, storage reads for System.Events and System.Account,
+nonces, ContractsApi_call dry runs, extrinsic submission with inclusion updates and
+new-head subscriptions) after a configurable latency, produces a block every
+`block_time` seconds and finalizes `finality_lag` blocks behind the head.
+
+Extrinsics are decoded with the stand-in runtime (see runtime.py) but signatures are
+not checked. Calls to the ZeroID contract update its stored hash the way the ink!
+contract does, so `get_verified_resume_data` returns the last stored hash.
+"""
+import base64
+import hashlib
+import itertools
+import json
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+from scalecodec.base import ScaleBytes
+from scalecodec.utils.ss58 import ss58_decode
+from substrateinterface.utils.hasher import xxh128
+
+from .runtime import PALLET_CONTRACTS, RUNTIME_VERSION, runtime_config
+
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OPCODE_TEXT, OPCODE_BINARY, OPCODE_CLOSE, OPCODE_PING, OPCODE_PONG = 0x1, 0x2, 0x8, 0x9, 0xA
+
+EVENTS_KEY = '0x' + (xxh128(b'System') + xxh128(b'Events')).hex()
+ACCOUNT_PREFIX = '0x' + (xxh128(b'System') + xxh128(b'Account')).hex()
+
+GAS_REQUIRED = {'ref_time': 2_000_000_000, 'proof_size': 40_000}
+ERROR_OUT_OF_GAS = 0
+
+
+def _compact(value):
+    if value < 1 << 6:
+        return bytes([value << 2])
+    if value < 1 << 14:
+        return ((value << 2) | 1).to_bytes(2, 'little')
+    if value < 1 << 30:
+        return ((value << 2) | 2).to_bytes(4, 'little')
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'little')
+    return bytes([((len(data) - 4) << 2) | 3]) + data
+
+
+def _read_compact(data, offset):
+    mode = data[offset] & 3
+    if mode == 0:
+        return data[offset] >> 2, offset + 1
+    if mode == 1:
+        return int.from_bytes(data[offset:offset + 2], 'little') >> 2, offset + 2
+    if mode == 2:
+        return int.from_bytes(data[offset:offset + 4], 'little') >> 2, offset + 4
+    length = (data[offset] >> 2) + 4
+    return int.from_bytes(data[offset + 1:offset + 1 + length], 'little'), offset + 1 + length
+
+
+def _exec_result(data):
+    """SCALE ContractExecResult (pre-v10 layout) of a successful dry run returning `data`."""
+    weight = _compact(GAS_REQUIRED['ref_time']) + _compact(GAS_REQUIRED['proof_size'])
+    return weight + weight + b'\x01' + bytes(16) + _compact(0) + b'\x00' + bytes(4) + _compact(len(data)) + data
+
+
+class RpcError(Exception):
+    def __init__(self, code, message, data=None):
+        super().__init__(message)
+        self.error = {'code': code, 'message': message}
+        if data is not None:
+            self.error['data'] = data
+
+
+class Block:
+    __slots__ = ('number', 'hash', 'header', 'extrinsics', 'events')
+
+    def __init__(self, number, parent_hash, extrinsics, events):
+        self.number = number
+        self.hash = '0x' + hashlib.blake2b(parent_hash.encode() + number.to_bytes(8, 'little'), digest_size=32).hexdigest()
+        self.header = {
+            'parentHash': parent_hash,
+            'number': hex(number),
+            'stateRoot': '0x' + '00' * 32,
+            'extrinsicsRoot': '0x' + '00' * 32,
+            'digest': {'logs': []},
+        }
+        self.extrinsics = extrinsics
+        self.events = events
+
+
+class StandInNode:
+    """Chain state and JSON-RPC methods of the stand-in node."""
+
+    def __init__(self, contract_address, store_selector, read_selector, block_time=0.2, finality_lag=2,
+                 rpc_latency=0.001, max_extrinsics_per_block=200, failure_rate=0.0):
+        self.contract_account = bytes.fromhex(ss58_decode(contract_address))
+        self.store_selector = store_selector
+        self.read_selector = read_selector
+        self.block_time = block_time
+        self.finality_lag = finality_lag
+        self.rpc_latency = rpc_latency
+        self.max_extrinsics_per_block = max_extrinsics_per_block
+        self.failure_rate = failure_rate
+
+        self.runtime_config, self.metadata, self.metadata_hex = runtime_config()
+        system = self.metadata.value[1]['V14']['pallets'][0]
+        events_type = next(e['type']['Plain'] for e in system['storage']['entries'] if e['name'] == 'Events')
+        self._events_type = f'scale_info::{events_type}'
+        self.stored_hash = bytes(32)
+        self.nonces = {}
+        self.pool = {}
+        self.watchers = {}
+        self.head_subscribers = {}
+        self.rpc_counts = {}
+        self.submitted = 0
+        self.failed = 0
+
+        self._lock = threading.RLock()
+        self._subscription_ids = itertools.count(1)
+        self._blocks = [Block(0, '0x' + '00' * 32, [], b'\x00')]
+        self._by_hash = {self._blocks[0].hash: self._blocks[0]}
+        self._stop = threading.Event()
+        self._producer = None
+
+    # --- Block production ---
+
+    def start(self):
+        self._producer = threading.Thread(target=self._produce, name='stand-in-node-producer', daemon=True)
+        self._producer.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._producer:
+            self._producer.join()
+
+    @property
+    def head(self):
+        return self._blocks[-1]
+
+    @property
+    def finalized(self):
+        return self._blocks[max(0, len(self._blocks) - 1 - self.finality_lag)]
+
+    def _timestamp_inherent(self, now_ms):
+        extrinsic = self.runtime_config.create_scale_object('Extrinsic', metadata=self.metadata)
+        extrinsic.encode({'call_module': 'Timestamp', 'call_function': 'set', 'call_args': {'now': now_ms}})
+        return '0x' + extrinsic.data.data.hex()
+
+    def _event(self, index, module, event, attributes):
+        return {'phase': {'ApplyExtrinsic': index}, 'event': {module: {event: attributes}}, 'topics': []}
+
+    def _success(self, index):
+        return self._event(index, 'System', 'ExtrinsicSuccess', {
+            'dispatch_info': {'weight': GAS_REQUIRED, 'class': 'Normal', 'pays_fee': 'Yes'},
+        })
+
+    def _ready(self):
+        """Pooled extrinsics whose nonces continue their account's nonce, like a transaction pool's ready queue."""
+        ready = []
+        for account in sorted({account for account, _ in self.pool}):
+            nonce = self.nonces.get(account, 0)
+            while (account, nonce) in self.pool and len(ready) < self.max_extrinsics_per_block:
+                ready.append((account, nonce, self.pool[(account, nonce)]))
+                nonce += 1
+        return ready
+
+    def _produce(self):
+        while not self._stop.wait(self.block_time):
+            with self._lock:
+                parent = self.head
+                extrinsics = [self._timestamp_inherent(int(time.time() * 1000))]
+                events = [self._success(0)]
+                included = []
+                for account, nonce, entry in self._ready():
+                    del self.pool[(account, nonce)]
+                    self.nonces[account] = nonce + 1
+                    index = len(extrinsics)
+                    extrinsics.append(entry['raw'])
+                    included.append(entry)
+                    if not self._apply(entry, index, events):
+                        self.failed += 1
+
+                records = self.runtime_config.create_scale_object(self._events_type).encode(events)
+                block = Block(parent.number + 1, parent.hash, extrinsics, bytes(records.data))
+                self._blocks.append(block)
+                self._by_hash[block.hash] = block
+                finalized = self.finalized
+
+                for entry in included:
+                    entry['block_hash'] = block.hash
+                    entry['block_number'] = block.number
+                    self._notify_watcher(entry, {'inBlock': block.hash})
+                for entry in [e for e in self.watchers.values() if e.get('block_number') is not None
+                              and e['block_number'] <= finalized.number and not e.get('finalized')]:
+                    entry['finalized'] = True
+                    self._notify_watcher(entry, {'finalized': entry['block_hash']})
+                for subscription, connection in list(self.head_subscribers.items()):
+                    connection.notify('chain_newHead', subscription, block.header)
+
+    def _apply(self, entry, index, events):
+        """Executes a Contracts.call against the ZeroID contract; returns False if it fails."""
+        call = entry['call']
+        if call['call_module'] != 'Contracts':
+            events.append(self._success(index))
+            return True
+        args = {arg['name']: arg['value'] for arg in call['call_args']}
+        data = bytes.fromhex(args['data'][2:])
+        gas_limit = args['gas_limit']
+        if entry['fail'] or gas_limit['ref_time'] < GAS_REQUIRED['ref_time']:
+            events.append(self._event(index, 'System', 'ExtrinsicFailed', {
+                'dispatch_error': {'Module': {'index': PALLET_CONTRACTS, 'error': '0x%02x000000' % ERROR_OUT_OF_GAS}},
+                'dispatch_info': {'weight': gas_limit, 'class': 'Normal', 'pays_fee': 'Yes'},
+            }))
+            return False
+        if data[:4] == self.store_selector:
+            self.stored_hash = data[4:36]
+        events.append(self._event(index, 'Contracts', 'Called', {
+            'caller': '0x' + entry['account'], 'contract': '0x' + self.contract_account.hex(),
+        }))
+        events.append(self._success(index))
+        return True
+
+    # --- Subscriptions ---
+
+    def _notify_watcher(self, entry, result):
+        connection = entry.get('connection')
+        if connection is not None:
+            connection.notify('author_extrinsicUpdate', entry['subscription'], result)
+
+    def drop_connection(self, connection):
+        with self._lock:
+            for subscription in [s for s, c in self.head_subscribers.items() if c is connection]:
+                del self.head_subscribers[subscription]
+            for entry in self.watchers.values():
+                if entry.get('connection') is connection:
+                    entry['connection'] = None
+
+    # --- JSON-RPC ---
+
+    def handle(self, connection, method, params):
+        if self.rpc_latency:
+            time.sleep(self.rpc_latency)
+        with self._lock:
+            self.rpc_counts[method] = self.rpc_counts.get(method, 0) + 1
+            handler = getattr(self, 'rpc_' + method, None)
+            if handler is None:
+                raise RpcError(-32601, f'Method not found: {method}')
+            return handler(connection, *params)
+
+    def _block(self, block_hash=None):
+        if block_hash is None:
+            return self.head
+        block = self._by_hash.get(block_hash)
+        if block is None:
+            raise RpcError(4003, f'Unknown block {block_hash}')
+        return block
+
+    def rpc_rpc_methods(self, connection):
+        return {'methods': sorted(name[4:] for name in dir(self) if name.startswith('rpc_'))}
+
+    def rpc_system_health(self, connection):
+        return {'peers': 1, 'isSyncing': False, 'shouldHavePeers': False}
+
+    def rpc_system_chain(self, connection):
+        return 'ZeroID Stand-in'
+
+    def rpc_system_name(self, connection):
+        return 'zeroid-stand-in'
+
+    def rpc_system_version(self, connection):
+        return '1.0.0'
+
+    def rpc_system_properties(self, connection):
+        return {'ss58Format': 42, 'tokenDecimals': 12, 'tokenSymbol': 'UNIT'}
+
+    def rpc_chain_getBlockHash(self, connection, number=None):
+        if number is None:
+            return self.head.hash
+        return self._blocks[number].hash if number < len(self._blocks) else None
+
+    def rpc_chain_getHead(self, connection):
+        return self.head.hash
+
+    def rpc_chain_getFinalisedHead(self, connection):
+        return self.finalized.hash
+
+    rpc_chain_getFinalizedHead = rpc_chain_getFinalisedHead
+
+    def rpc_chain_getHeader(self, connection, block_hash=None):
+        return self._block(block_hash).header
+
+    def rpc_chain_getBlock(self, connection, block_hash=None):
+        block = self._block(block_hash)
+        return {'block': {'header': block.header, 'extrinsics': block.extrinsics}, 'justifications': None}
+
+    def rpc_state_getRuntimeVersion(self, connection, block_hash=None):
+        return RUNTIME_VERSION
+
+    rpc_chain_getRuntimeVersion = rpc_state_getRuntimeVersion
+
+    def rpc_state_getMetadata(self, connection, block_hash=None):
+        return self.metadata_hex
+
+    def rpc_state_getStorage(self, connection, key, block_hash=None):
+        if key == EVENTS_KEY:
+            return '0x' + self._block(block_hash).events.hex()
+        if key.startswith(ACCOUNT_PREFIX):
+            account = key[len(ACCOUNT_PREFIX) + 32:]
+            nonce = self.nonces.get(account, 0)
+            return '0x' + (nonce.to_bytes(4, 'little') + bytes(12) + (10 ** 18).to_bytes(16, 'little') + bytes(48)).hex()
+        return None
+
+    rpc_state_getStorageAt = rpc_state_getStorage
+
+    def rpc_system_accountNextIndex(self, connection, address):
+        account = ss58_decode(address)
+        nonce = self.nonces.get(account, 0)
+        while (account, nonce) in self.pool:
+            nonce += 1
+        return nonce
+
+    def rpc_state_call(self, connection, name, params, block_hash=None):
+        data = bytes.fromhex(params[2:])
+        if name == 'AccountNonceApi_account_nonce':
+            return '0x' + self.nonces.get(data[:32].hex(), 0).to_bytes(4, 'little').hex()
+        if name != 'ContractsApi_call':
+            raise RpcError(4002, f'Runtime API {name} is not implemented by the stand-in node')
+        offset = 32
+        dest = data[offset:offset + 32]
+        offset += 32 + 16
+        if data[offset]:
+            offset = _read_compact(data, _read_compact(data, offset + 1)[1])[1]
+        else:
+            offset += 1
+        offset += 17 if data[offset] else 1
+        length, offset = _read_compact(data, offset)
+        input_data = data[offset:offset + length]
+
+        if dest != self.contract_account:
+            raise RpcError(4002, 'Contract not found')
+        if input_data[:4] == self.read_selector:
+            return '0x' + _exec_result(b'\x00' + self.stored_hash).hex()
+        return '0x' + _exec_result(b'\x00').hex()
+
+    def _accept(self, connection, raw, subscription=None):
+        extrinsic = self.runtime_config.create_scale_object('Extrinsic', data=ScaleBytes(raw), metadata=self.metadata)
+        extrinsic.decode()
+        value = extrinsic.value
+        account = ss58_decode(value['address']) if isinstance(value['address'], str) else value['address']['Id']
+        account = account.removeprefix('0x')
+        nonce = value['nonce']
+        if nonce < self.nonces.get(account, 0):
+            raise RpcError(1010, 'Invalid Transaction', 'Transaction is outdated')
+        if (account, nonce) in self.pool:
+            raise RpcError(1014, 'Priority is too low: (0 vs 0)', 'The transaction has too low priority to replace another transaction already in the pool.')
+
+        extrinsic_hash = '0x' + hashlib.blake2b(bytes.fromhex(raw[2:]), digest_size=32).hexdigest()
+        self.submitted += 1
+        entry = {
+            'raw': raw, 'call': value['call'], 'account': account, 'hash': extrinsic_hash,
+            'fail': self.failure_rate and (self.submitted * 2654435761 % 1000) < self.failure_rate * 1000,
+            'subscription': subscription, 'connection': connection if subscription else None,
+        }
+        self.pool[(account, nonce)] = entry
+        if subscription is not None:
+            self.watchers[subscription] = entry
+        return extrinsic_hash
+
+    def rpc_author_submitExtrinsic(self, connection, raw):
+        return self._accept(connection, raw)
+
+    def rpc_author_submitAndWatchExtrinsic(self, connection, raw):
+        subscription = f'0x{next(self._subscription_ids):016x}'
+        self._accept(connection, raw, subscription)
+        connection.notify_later('author_extrinsicUpdate', subscription, 'ready')
+        return subscription
+
+    def rpc_author_unwatchExtrinsic(self, connection, subscription):
+        return self.watchers.pop(subscription, None) is not None
+
+    def rpc_chain_subscribeNewHeads(self, connection):
+        subscription = f'0x{next(self._subscription_ids):016x}'
+        self.head_subscribers[subscription] = connection
+        return subscription
+
+    rpc_chain_subscribeNewHead = rpc_chain_subscribeNewHeads
+
+    def rpc_chain_unsubscribeNewHeads(self, connection, subscription):
+        return self.head_subscribers.pop(subscription, None) is not None
+
+    rpc_chain_unsubscribeNewHead = rpc_chain_unsubscribeNewHeads
+
+
+class _WebSocketConnection(socketserver.BaseRequestHandler):
+    """One RFC 6455 websocket connection; JSON-RPC requests on it are handled in order."""
+
+    def setup(self):
+        self._send_lock = threading.Lock()
+        self._pending = []
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self.request.makefile('rb')
+
+    def _handshake(self):
+        headers = {}
+        request_line = self._reader.readline()
+        if not request_line:
+            return False
+        while True:
+            line = self._reader.readline().decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get('sec-websocket-key')
+        if not key:
+            self.request.sendall(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+            return False
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WEBSOCKET_GUID).digest()).decode()
+        self.request.sendall(
+            'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept}\r\n\r\n'.encode()
+        )
+        return True
+
+    def _read_frame(self):
+        header = self._reader.read(2)
+        if len(header) < 2:
+            return None, None
+        fin, opcode = header[0] & 0x80, header[0] & 0x0F
+        masked, length = header[1] & 0x80, header[1] & 0x7F
+        if length == 126:
+            length = struct.unpack('>H', self._reader.read(2))[0]
+        elif length == 127:
+            length = struct.unpack('>Q', self._reader.read(8))[0]
+        mask = self._reader.read(4) if masked else None
+        payload = self._reader.read(length)
+        if mask:
+            payload = (int.from_bytes(payload, 'big') ^ int.from_bytes((mask * (length // 4 + 1))[:length], 'big')).to_bytes(length, 'big')
+        if not fin:
+            next_opcode, rest = self._read_frame()
+            payload += rest or b''
+        return opcode, payload
+
+    def _send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('>BB', 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack('>BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+        with self._send_lock:
+            self.request.sendall(header + payload)
+
+    def send_json(self, message):
+        self._send_frame(OPCODE_TEXT, json.dumps(message).encode())
+
+    def notify(self, method, subscription, result):
+        try:
+            self.send_json({'jsonrpc': '2.0', 'method': method, 'params': {'subscription': subscription, 'result': result}})
+        except OSError:
+            pass
+
+    def notify_later(self, method, subscription, result):
+        """Queues a notification to go out after the response of the current request."""
+        self._pending.append((method, subscription, result))
+
+    def handle(self):
+        node = self.server.node
+        if not self._handshake():
+            return
+        try:
+            while True:
+                opcode, payload = self._read_frame()
+                if opcode is None or opcode == OPCODE_CLOSE:
+                    with self._send_lock:
+                        self.request.sendall(b'\x88\x00')
+                    return
+                if opcode == OPCODE_PING:
+                    self._send_frame(OPCODE_PONG, payload)
+                    continue
+                if opcode not in (OPCODE_TEXT, OPCODE_BINARY):
+                    continue
+
+                request = json.loads(payload)
+                response = {'jsonrpc': '2.0', 'id': request.get('id')}
+                try:
+                    response['result'] = node.handle(self, request['method'], request.get('params') or [])
+                except RpcError as e:
+                    response['error'] = e.error
+                except Exception as e:
+                    response['error'] = {'code': -32603, 'message': f'{type(e).__name__}: {e}'}
+                self.send_json(response)
+                pending, self._pending = self._pending, []
+                for notification in pending:
+                    self.notify(*notification)
+        except OSError:
+            pass
+        finally:
+            node.drop_connection(self)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class NodeServer:
+    """Serves a StandInNode on ws://127.0.0.1:<port>."""
+
+    def __init__(self, node, host='127.0.0.1', port=0):
+        self.node = node
+        self._server = _Server((host, port), _WebSocketConnection)
+        self._server.node = node
+        self.url = f'ws://{host}:{self._server.server_address[1]}'
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stand-in-node', daemon=True)
+
+    def __enter__(self):
+        self.node.start()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+        self.node.stop()
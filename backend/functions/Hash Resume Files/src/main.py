@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import tempfile
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from appwrite.client import Client
+from appwrite.services.databases import Databases
+from appwrite.services.storage import Storage
+from appwrite.query import Query
+from appwrite.exception import AppwriteException
+
+from .hashing import PayloadTooLarge, hash_chunks
+
+
+# --- Essential Configuration ---
+APPWRITE_ENDPOINT = os.getenv("APPWRITE_FUNCTION_API_ENDPOINT")
+APPWRITE_PROJECT_ID = os.getenv("APPWRITE_FUNCTION_PROJECT_ID")
+APPWRITE_API_KEY = os.getenv("APPWRITE_FUNCTION_API_KEY")
+
+DB_ID = os.getenv("APPWRITE_DATABASE_ID")
+CANDIDATES_COLLECTION_ID = os.getenv("APPWRITE_CANDIDATES_COLLECTION_ID")
+RESUME_BUCKET_ID = os.getenv("APPWRITE_RESUME_BUCKET_ID")
+# Optional: a collection holding job checkpoints, so progress survives cold starts.
+JOB_CHECKPOINTS_COLLECTION_ID = os.getenv("APPWRITE_JOB_CHECKPOINTS_COLLECTION_ID")
+
+# --- Constants ---
+CHECKPOINT_ID = "hash-resume-files"
+CHECKPOINT_FILE = os.path.join(tempfile.gettempdir(), f"zeroid-{CHECKPOINT_ID}.json")
+CANDIDATES_PAGE_SIZE = int(os.getenv("CANDIDATES_PAGE_SIZE", "50"))
+HASH_CONCURRENCY = int(os.getenv("HASH_CONCURRENCY", "4"))
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# The resumes bucket caps files at 5 MB; anything bigger is not a file we uploaded.
+MAX_FILE_BYTES = int(os.getenv("MAX_FILE_BYTES", str(5 * 1000 * 1000)))
+# The job stops starting new pages once this much of the function timeout is used.
+RUN_TIME_BUDGET_SECONDS = float(os.getenv("RUN_TIME_BUDGET_SECONDS", "240"))
+
+
+def validate_env_vars(context):
+    required_vars = {
+        "APPWRITE_FUNCTION_API_ENDPOINT": APPWRITE_ENDPOINT,
+        "APPWRITE_FUNCTION_PROJECT_ID": APPWRITE_PROJECT_ID,
+        "APPWRITE_FUNCTION_API_KEY": APPWRITE_API_KEY,
+        "APPWRITE_DATABASE_ID": DB_ID,
+        "APPWRITE_CANDIDATES_COLLECTION_ID": CANDIDATES_COLLECTION_ID,
+        "APPWRITE_RESUME_BUCKET_ID": RESUME_BUCKET_ID,
+    }
+    missing_vars = [name for name, value in required_vars.items() if not value]
+    if missing_vars:
+        error_message = f"Error: Missing essential environment variables: {', '.join(missing_vars)}. Function cannot start."
+        context.error(error_message)
+        raise ValueError(error_message)
+    return True
+
+
+def _load_checkpoint(context, databases):
+    """Returns {"cursor": <last candidate $id of the pass so far, or None>, ...}."""
+    if JOB_CHECKPOINTS_COLLECTION_ID:
+        try:
+            doc = databases.get_document(DB_ID, JOB_CHECKPOINTS_COLLECTION_ID, CHECKPOINT_ID)
+            return json.loads(doc.get("state") or "{}")
+        except AppwriteException as e:
+            if e.code != 404:
+                raise
+            return {}
+    try:
+        with open(CHECKPOINT_FILE) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_checkpoint(context, databases, state):
+    if JOB_CHECKPOINTS_COLLECTION_ID:
+        data = {"state": json.dumps(state)}
+        try:
+            databases.update_document(DB_ID, JOB_CHECKPOINTS_COLLECTION_ID, CHECKPOINT_ID, data=data)
+        except AppwriteException as e:
+            if e.code != 404:
+                raise
+            databases.create_document(DB_ID, JOB_CHECKPOINTS_COLLECTION_ID, CHECKPOINT_ID, data=data)
+        return
+    with open(CHECKPOINT_FILE, "w") as f:
+        json.dump(state, f)
+
+
+def _needs_hash(candidate):
+    """Missing, or computed from a file the candidate has since replaced."""
+    return not candidate.get("resume_file_hash") or candidate.get("resume_file_hashed_id") != candidate.get("resume_file_id")
+
+
+def _file_chunks(client, file_id, size):
+    """
+    Downloads the file with Range requests of DOWNLOAD_CHUNK_SIZE bytes, so only one
+    chunk per file is held in memory while it is hashed.
+    """
+    path = f"/storage/buckets/{RESUME_BUCKET_ID}/files/{file_id}/download"
+    start = 0
+    while start < size:
+        end = min(start + DOWNLOAD_CHUNK_SIZE, size) - 1
+        chunk = client.call("get", path, headers={"content-type": "application/json", "range": f"bytes={start}-{end}"})
+        if start == 0 and len(chunk) == size:
+            yield chunk # The server ignored the range and sent the whole file.
+            return
+        if len(chunk) != end - start + 1:
+            raise ValueError(f"Range bytes={start}-{end} of file {file_id} returned {len(chunk)} bytes.")
+        yield chunk
+        start = end + 1
+
+
+def _hash_resume_file(client, storage, file_id):
+    """Returns the hex SHA-256 of the stored file."""
+    size = storage.get_file(RESUME_BUCKET_ID, file_id)["sizeOriginal"]
+    if size > MAX_FILE_BYTES:
+        raise PayloadTooLarge(f"File {file_id} is {size} bytes, over the {MAX_FILE_BYTES} byte limit.")
+    digest, hashed_size = hash_chunks(_file_chunks(client, file_id, size), MAX_FILE_BYTES)
+    if hashed_size != size:
+        raise ValueError(f"File {file_id} hashed {hashed_size} of {size} bytes.")
+    return digest.hex()
+
+
+def _write_hashes(context, databases, updates):
+    """Writes the page's hashes with one bulk upsert, falling back to per-document updates."""
+    if not updates:
+        return 0
+    try:
+        databases.upsert_documents(DB_ID, CANDIDATES_COLLECTION_ID, updates)
+        return len(updates)
+    except AppwriteException as e:
+        context.warn(f"Bulk write of {len(updates)} hash(es) failed ({e}); writing them one by one.")
+
+    written = 0
+    for update in updates:
+        data = {key: value for key, value in update.items() if key != "$id"}
+        try:
+            databases.update_document(DB_ID, CANDIDATES_COLLECTION_ID, update["$id"], data=data)
+            written += 1
+        except AppwriteException as e:
+            context.error(f"Failed to write resume hash for candidate {update['$id']}: {e}")
+    return written
+
+
+def _hash_page(context, client, storage, candidates):
+    """Hashes the page's stale files HASH_CONCURRENCY at a time. Returns (updates, failed_count)."""
+    def run(candidate):
+        file_id = candidate["resume_file_id"]
+        try:
+            return {
+                "$id": candidate["$id"],
+                "resume_file_hash": _hash_resume_file(client, storage, file_id),
+                "resume_file_hashed_id": file_id,
+            }
+        except Exception as e:
+            context.error(f"Failed to hash resume file {file_id} of candidate {candidate['$id']}: {str(e)}. Type: {type(e).__name__}")
+            return None
+
+    stale = [c for c in candidates if _needs_hash(c)]
+    if not stale:
+        return [], 0
+    with ThreadPoolExecutor(max_workers=min(HASH_CONCURRENCY, len(stale))) as executor:
+        results = list(executor.map(run, stale))
+    updates = [r for r in results if r]
+    return updates, len(results) - len(updates)
+
+
+def main(context):
+    try:
+        validate_env_vars(context)
+    except ValueError as e:
+        return context.res.json({"status": "failure", "message": f"Initial configuration error: {str(e)}"}, 500)
+
+    client = Client()
+    client.set_endpoint(APPWRITE_ENDPOINT)
+    client.set_project(APPWRITE_PROJECT_ID)
+    client.set_key(APPWRITE_API_KEY)
+    databases = Databases(client)
+    storage = Storage(client)
+
+    deadline = time.monotonic() + RUN_TIME_BUDGET_SECONDS
+    hashed_count = 0
+    failed_count = 0
+    pages = 0
+
+    try:
+        checkpoint = _load_checkpoint(context, databases)
+        cursor = checkpoint.get("cursor")
+        context.log(f"Resume hashing started {'from candidate ' + cursor if cursor else 'a new pass'}.")
+
+        pass_complete = False
+        while time.monotonic() < deadline:
+            queries = [Query.is_not_null("resume_file_id"), Query.order_asc("$id"), Query.limit(CANDIDATES_PAGE_SIZE)]
+            if cursor:
+                queries.append(Query.cursor_after(cursor))
+            candidates = databases.list_documents(DB_ID, CANDIDATES_COLLECTION_ID, queries=queries)["documents"]
+
+            updates, page_failed = _hash_page(context, client, storage, candidates)
+            hashed_count += _write_hashes(context, databases, updates)
+            failed_count += page_failed
+            pages += 1
+
+            # Failed files stay stale and are retried on the next pass.
+            if len(candidates) < CANDIDATES_PAGE_SIZE:
+                pass_complete = True
+                cursor = None
+            else:
+                cursor = candidates[-1]["$id"]
+            _save_checkpoint(context, databases, {"cursor": cursor})
+            if pass_complete:
+                break
+
+        summary_message = f"Resume hashing finished. Hashed: {hashed_count}, Failed: {failed_count}, Pages: {pages}, Pass complete: {pass_complete}."
+        context.log(summary_message)
+        return context.res.json({
+            "status": "success", "message": summary_message, "hashed": hashed_count, "failed": failed_count,
+            "pages": pages, "pass_complete": pass_complete, "cursor": cursor,
+        })
+
+    except AppwriteException as e:
+        context.error(f"Appwrite error during resume hashing: {repr(e)}")
+        context.error(traceback.format_exc())
+        return context.res.json({"status": "failure", "message": f"Appwrite error: {e.message}"}, 500)
+    except Exception as e:
+        context.error(f"An unexpected error occurred in resume hashing: {str(e)}")
+        context.error(traceback.format_exc())
+        return context.res.json({"status": "failure", "message": f"An unexpected server error occurred: {str(e)}"}, 500)
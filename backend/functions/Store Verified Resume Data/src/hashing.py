@@ -0,0 +1,154 @@
+"""
+Incremental SHA-256 of uploaded resume documents.
+
+Raw (application/octet-stream) and multipart/form-data uploads are hashed
+straight from the request body in fixed-size memoryview chunks: the body is never
+decoded, re-encoded or sliced into copies, so a request holds one copy of the document
+however large it is. The size cap is enforced while hashing, so the same code works for
+any iterable of chunks, e.g. a file read in blocks.
+
+The digest of a raw upload equals the digest of the same text sent as JSON `blob_text`.
+A text/plain body is hashed raw only when the request asks for it with `?raw=1`: clients
+that send JSON as text/plain still have their `blob_text` hashed.
+"""
+import hashlib
+import os
+
+
+CHUNK_SIZE = 64 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+# The multipart field holding the document; otherwise the first part with a filename is used.
+MULTIPART_FIELD = os.getenv('MULTIPART_FIELD', 'resume')
+
+RAW_CONTENT_TYPES = ('application/octet-stream', 'text/plain')
+# Raw content types that are uploads only with ?raw=1; otherwise the body is JSON.
+OPT_IN_RAW_CONTENT_TYPES = ('text/plain',)
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+class MalformedUpload(Exception):
+    pass
+
+
+def iter_chunks(buffer, chunk_size=CHUNK_SIZE):
+    """Zero-copy chunks of a bytes-like object."""
+    view = memoryview(buffer)
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
+
+
+def iter_stream(stream, chunk_size=CHUNK_SIZE):
+    """Chunks of a binary file-like object, read until EOF."""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def hash_chunks(chunks, max_bytes=MAX_UPLOAD_BYTES):
+    """Returns (sha256 digest, size in bytes); raises PayloadTooLarge as soon as the cap is passed."""
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if size > max_bytes:
+            raise PayloadTooLarge(f'Upload exceeds the {max_bytes} byte limit')
+        digest.update(chunk)
+    return digest.digest(), size
+
+
+def _parse_content_type(header):
+    media_type, _, params = (header or '').partition(';')
+    parsed = {}
+    for param in params.split(';'):
+        key, sep, value = param.strip().partition('=')
+        if sep:
+            parsed[key.lower()] = value.strip().strip('"')
+    return media_type.strip().lower(), parsed
+
+
+def _disposition_params(part_headers):
+    for line in part_headers.split(b'\r\n'):
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-disposition':
+            return _parse_content_type(value.decode('latin-1'))[1]
+    return {}
+
+
+def multipart_file(body, boundary, field=MULTIPART_FIELD):
+    """
+    Locates the document part of a multipart/form-data body and returns it as a
+    memoryview into `body`. Only part headers are decoded; the content is not copied.
+    """
+    delimiter = b'--' + boundary.encode('latin-1')
+    view = memoryview(body)
+    fallback = None
+
+    position = body.find(delimiter)
+    if position < 0:
+        raise MalformedUpload('Multipart body does not contain its boundary')
+
+    while True:
+        position += len(delimiter)
+        if body[position:position + 2] == b'--':
+            break
+        headers_end = body.find(b'\r\n\r\n', position)
+        if headers_end < 0:
+            raise MalformedUpload('Multipart part is missing its header terminator')
+        content_start = headers_end + 4
+        content_end = body.find(b'\r\n' + delimiter, content_start)
+        if content_end < 0:
+            raise MalformedUpload('Multipart part is not terminated by the boundary')
+
+        params = _disposition_params(body[position:headers_end])
+        if params.get('name') == field:
+            return view[content_start:content_end]
+        if fallback is None and 'filename' in params:
+            fallback = view[content_start:content_end]
+        position = content_end + 2
+
+    if fallback is None:
+        raise MalformedUpload(f'Multipart body has no {field!r} field or file part')
+    return fallback
+
+
+def is_upload(headers, query=None):
+    """True for requests whose body is hashed as an uploaded document instead of as JSON."""
+    media_type, _ = _parse_content_type((headers or {}).get('content-type'))
+    if media_type in OPT_IN_RAW_CONTENT_TYPES:
+        return (query or {}).get('raw') == '1'
+    return media_type in RAW_CONTENT_TYPES or media_type == 'multipart/form-data'
+
+
+def hash_upload(body, headers, max_bytes=MAX_UPLOAD_BYTES):
+    """Returns (digest, size) of a raw or multipart upload held in the bytes-like `body`."""
+    media_type, params = _parse_content_type(headers.get('content-type'))
+
+    content_length = headers.get('content-length')
+    if content_length and content_length.isdigit() and media_type in RAW_CONTENT_TYPES and int(content_length) > max_bytes:
+        raise PayloadTooLarge(f'Upload exceeds the {max_bytes} byte limit')
+
+    if media_type == 'multipart/form-data':
+        if not params.get('boundary'):
+            raise MalformedUpload('multipart/form-data request without a boundary')
+        document = multipart_file(body, params['boundary'])
+    elif media_type in RAW_CONTENT_TYPES:
+        document = body
+    else:
+        raise MalformedUpload(f'Unsupported upload content type {media_type!r}')
+
+    return hash_chunks(iter_chunks(document), max_bytes)
+
+
+def request_body(req):
+    """The raw request body as bytes, without a text round trip where the runtime allows it."""
+    body = getattr(req, 'body_binary', None)
+    if body is None:
+        body = getattr(req, 'body_raw', None) or b''
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return body
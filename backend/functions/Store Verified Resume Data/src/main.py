@@ -1,89 +1,202 @@
 import hashlib
 import os
 
+from appwrite.client import Client
 from appwrite.exception import AppwriteException
+from appwrite.id import ID
+from appwrite.services.databases import Databases
 from dotenv import load_dotenv
-from substrateinterface import ContractInstance, Keypair, SubstrateInterface
+
+from .chain import gas_estimates, get_contract, get_pool, read_cache, signers
+from .hashing import MalformedUpload, PayloadTooLarge, hash_upload, is_upload, request_body
+from .spans import NULL_SPANS, Spans
 
 
 load_dotenv()
 
 ENV = os.getenv('ENV')
-IS_LOCAL = ENV == 'local'
-IS_DEV = ENV == 'dev'
 
 POLKADOT_CONTRACT_ADDRESS = os.environ["POLKADOT_CONTRACT_ADDRESS"]  # '5EXvxAcsG2asmQjGz...LRoJsag7kV9KMu1kR6q'
 POLKADOT_SUBSTRATE_URL = os.environ["POLKADOT_SUBSTRATE_URL"]  # 'ws://127.0.0.1:9944'
 POLKADOT_KEYPAIR_ACCOUNT = os.environ["POLKADOT_KEYPAIR_ACCOUNT"]  # '//Alice'
 POLKADOT_KEYPAIR_MNEMONIC = os.environ['POLKADOT_KEYPAIR_MNEMONIC']  # "foo bar ... baz qux"
 
+CONTRACT_METADATA_PATH = os.path.join(os.path.dirname(__file__), 'zid_contract.json')
+
+# Only needed for submit-only requests ({"wait": false}), which record the pending extrinsic for the tracker.
+APPWRITE_ENDPOINT = os.getenv("APPWRITE_FUNCTION_API_ENDPOINT")
+APPWRITE_PROJECT_ID = os.getenv("APPWRITE_FUNCTION_PROJECT_ID")
+APPWRITE_API_KEY = os.getenv("APPWRITE_FUNCTION_API_KEY")
+DB_ID = os.getenv("APPWRITE_DATABASE_ID")
+CHAIN_SUBMISSIONS_COLLECTION_ID = os.getenv("APPWRITE_CHAIN_SUBMISSIONS_COLLECTION_ID")
+
+signers.register('local', uri=POLKADOT_KEYPAIR_ACCOUNT)
+signers.register('dev', mnemonic=POLKADOT_KEYPAIR_MNEMONIC)
+signers.register_from_env()
+POLKADOT_SIGNER = os.getenv('POLKADOT_SIGNER') or ENV
+
+# Derive the signing keypair at cold start instead of on the first request.
+STARTUP_TIMINGS = {'signer_derivation': signers.warm_up([POLKADOT_SIGNER])}
+_startup_reported = False
 
-def store_hash_on_chain(hash, context):
-    substrate = SubstrateInterface(
-        url=POLKADOT_SUBSTRATE_URL,
-        type_registry_preset='substrate-node-template'
-    )
 
-    if IS_LOCAL:
-        keypair = Keypair.create_from_uri(POLKADOT_KEYPAIR_ACCOUNT)
-    elif IS_DEV:
-        keypair = Keypair.create_from_mnemonic(POLKADOT_KEYPAIR_MNEMONIC)
-    else:
+def store_hash_on_chain(hash, context, spans=NULL_SPANS):
+    if POLKADOT_SIGNER not in signers:
         raise Exception(f'Failed to load valid {ENV=}')
+    with spans.span('signer'):
+        keypair = signers.get(POLKADOT_SIGNER)
 
-    contract_path = os.path.join(os.path.dirname(__file__), 'zid_contract.json')
-    context.log(f'Creating contract instance from {contract_path=}...')
-
-    contract = ContractInstance.create_from_address(
-        substrate=substrate,
-        contract_address=POLKADOT_CONTRACT_ADDRESS,
-        metadata_file=contract_path
-    )
-
-    context.log(f'Successfully created {contract=}')
-
-    result = contract.exec(
-        keypair,
-        'store_verified_resume_data',
-        args={'hash': hash},
-    )
-
-    context.log(
-        f'Successfully stored resume data, '
-        f'{result.extrinsic_hash=}, '
-        f'{result.block_hash=}, '
-        f'{result.block_number=}, '
-        f'{result.contract_address=}, '
-        f'{result.is_success=}, '
-        f'{result.contract_events=}, '
-        f'{result.contract_metadata=}'
-    )
+    pool = get_pool(POLKADOT_SUBSTRATE_URL)
+    with pool.connection(spans=spans) as substrate:
+        context.log(f'Creating contract instance from {CONTRACT_METADATA_PATH=}...')
+
+        with spans.span('contract_metadata'):
+            contract = get_contract(POLKADOT_CONTRACT_ADDRESS, CONTRACT_METADATA_PATH)
+
+        context.log(f'Successfully created {contract=}')
+
+        result = contract.exec(
+            substrate,
+            keypair,
+            'store_verified_resume_data',
+            args={'hash': hash},
+            spans=spans,
+        )
+
+        # The receipt resolves its events lazily over the connection, so log it before releasing.
+        with spans.span('receipt'):
+            context.log(
+                f'Successfully stored resume data, '
+                f'{result.extrinsic_hash=}, '
+                f'{result.block_hash=}, '
+                f'{result.block_number=}, '
+                f'{result.contract_address=}, '
+                f'{result.is_success=}, '
+                f'{result.contract_events=}, '
+                f'{result.contract_metadata=}'
+            )
+
+    context.log(f'Substrate pool stats: {pool.stats.as_dict()}')
+    context.log(f'Gas estimate cache stats: {gas_estimates.stats.as_dict()}')
 
     return result
 
 
-def main(context):
-    try:
-        body = context.req.body_json or {}
+def submit_hash_to_chain(hash, context, spans=NULL_SPANS):
+    if not all([APPWRITE_ENDPOINT, APPWRITE_PROJECT_ID, APPWRITE_API_KEY, DB_ID, CHAIN_SUBMISSIONS_COLLECTION_ID]):
+        raise Exception('Submit-only mode requires the Appwrite endpoint, project, key, database and chain submissions collection to be configured')
+    if POLKADOT_SIGNER not in signers:
+        raise Exception(f'Failed to load valid {ENV=}')
+    with spans.span('signer'):
+        keypair = signers.get(POLKADOT_SIGNER)
+
+    pool = get_pool(POLKADOT_SUBSTRATE_URL)
+    with pool.connection(spans=spans) as substrate:
+        with spans.span('contract_metadata'):
+            contract = get_contract(POLKADOT_CONTRACT_ADDRESS, CONTRACT_METADATA_PATH)
+        extrinsic_hash, submitted_at_block = contract.submit(
+            substrate,
+            keypair,
+            'store_verified_resume_data',
+            args={'hash': hash},
+            spans=spans,
+        )
 
-        blob_text = body.get("blob_text", "")
-        context.log(f"Received blob_text: {blob_text}")
+    context.log(f'Submitted resume data without waiting, {extrinsic_hash=}, {submitted_at_block=}')
+
+    client = Client()
+    client.set_endpoint(APPWRITE_ENDPOINT)
+    client.set_project(APPWRITE_PROJECT_ID)
+    client.set_key(APPWRITE_API_KEY)
+    with spans.span('record_submission'):
+        Databases(client).create_document(
+            DB_ID, CHAIN_SUBMISSIONS_COLLECTION_ID, ID.unique(),
+            data={
+                "extrinsic_hash": extrinsic_hash,
+                "resume_hash": hash.hex(),
+                "submitted_at_block": submitted_at_block,
+                "status": "pending",
+            }
+        )
+
+    return extrinsic_hash
+
+
+def read_verified_resume_data(context, spans=NULL_SPANS):
+    """The hash currently stored in the contract; lookups within one block share a single dry run."""
+    with get_pool(POLKADOT_SUBSTRATE_URL).connection(spans=spans) as substrate:
+        contract = get_contract(POLKADOT_CONTRACT_ADDRESS, CONTRACT_METADATA_PATH)
+        with spans.span('read'):
+            result = contract.read(substrate, 'get_verified_resume_data')
+
+    context.log(f'Contract read cache stats: {read_cache.stats.as_dict()}')
+
+    return result
+
+
+def _respond(context, spans, body):
+    """Logs the request's timing record and adds it to the response body as "timings" (unless disabled)."""
+    timings = spans.report(context, method=context.req.method, status_code=body.get("status_code"))
+    if timings is not None:
+        body["timings"] = timings
+    return context.res.json(body)
 
-        blob_hash = hashlib.sha256(blob_text.encode("utf-8")).digest()
-        context.log(f"Hashed blob_text: {blob_hash}")
 
-        result = store_hash_on_chain(blob_hash, context)
+def main(context):
+    global _startup_reported
+    if not _startup_reported:
+        context.log(f'Startup timings: {STARTUP_TIMINGS}')
+        _startup_reported = True
+
+    spans = Spans()
+    try:
+        if context.req.method == "GET":
+            result = read_verified_resume_data(context, spans)
+            return _respond(context, spans, {"status_code": 200, "verified_resume_data": result.get("Ok")})
+
+        headers = context.req.headers or {}
+        if is_upload(headers, context.req.query):
+            # Raw (text/plain only with ?raw=1) or multipart document: hashed in chunks straight from the request body.
+            with spans.span('hash'):
+                blob_hash, blob_size = hash_upload(request_body(context.req), headers)
+            context.log(f"Hashed {blob_size} byte upload: {blob_hash}")
+            submitted = {"submitted_bytes": blob_size}
+            wait = (context.req.query or {}).get("wait", "true").lower() != "false"
+        else:
+            body = context.req.body_json or {}
+
+            blob_text = body.get("blob_text", "")
+            context.log(f"Received blob_text: {blob_text}")
+
+            blob_hash = hashlib.sha256(blob_text.encode("utf-8")).digest()
+            context.log(f"Hashed blob_text: {blob_hash}")
+            submitted = {"submitted_value": blob_text}
+            wait = body.get("wait", True) is not False
+
+        if not wait:
+            tx_hash = submit_hash_to_chain(blob_hash, context, spans)
+            return _respond(
+                context, spans, {"status_code": 202, **submitted, "tx_hash": tx_hash, "status": "pending"}
+            )
+
+        result = store_hash_on_chain(blob_hash, context, spans)
 
         tx_hash = result.extrinsic_hash
-        result = {"status_code": 200, "submitted_value": blob_text, "tx_hash": tx_hash}
+        result = {"status_code": 200, **submitted, "tx_hash": tx_hash}
 
-        return context.res.json(result)
+        return _respond(context, spans, result)
 
+    except PayloadTooLarge as e:
+        context.error("Rejected upload: " + str(e))
+        return _respond(context, spans, {"error": str(e), "status_code": 413})
+    except MalformedUpload as e:
+        context.error("Rejected upload: " + str(e))
+        return _respond(context, spans, {"error": str(e), "status_code": 400})
     except AppwriteException as err:
         context.error("Appwrite error: " + repr(err))
-        return context.res.json(
-            {"error": "Appwrite-related issue occurred.", "status_code": 500}
+        return _respond(
+            context, spans, {"error": "Appwrite-related issue occurred.", "status_code": 500}
         )
     except Exception as e:
         context.error("Unhandled error: " + str(e))
-        return context.res.json({"error": str(e), "status_code": 500})
+        return _respond(context, spans, {"error": str(e), "status_code": 500})
@@ -0,0 +1,132 @@
+"""
+Local index of hashes that have already been anchored on chain.
+
+A CONFIRM_EMPLOYMENT action can be retried after its extrinsic was included but the
+job history update failed; the index lets the retry reuse the earlier extrinsic
+instead of paying for the same hash again. The contract only keeps the last stored
+hash, so the chain itself cannot answer "was this hash anchored?".
+
+Records live in SQLite (ANCHOR_INDEX_PATH, by default in the temp directory, which
+lasts as long as the warm runtime; point it at a persistent volume to keep it across
+deployments). In front of it, a Bloom filter answers most misses without touching
+the database and an LRU keeps recently anchored records in memory.
+"""
+import collections
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), "zeroid-anchor-index.sqlite3")
+BLOOM_BITS = 1 << 20
+BLOOM_HASHES = 7
+LRU_SIZE = 1024
+
+
+class BloomFilter:
+    """Keys are SHA-256 digests, so their own bytes serve as the independent hash values."""
+
+    def __init__(self, bits=BLOOM_BITS, hashes=BLOOM_HASHES):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = bytearray(bits // 8)
+
+    def _positions(self, key):
+        for i in range(self.hashes):
+            yield int.from_bytes(key[i * 4:i * 4 + 4], "big") % self.bits
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class AnchorIndex:
+    def __init__(self, path=DEFAULT_PATH, lru_size=LRU_SIZE):
+        self.path = path
+        self.lru_size = lru_size
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self._lru = collections.OrderedDict()
+        self._bloom = BloomFilter()
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS anchors ("
+            " hash BLOB PRIMARY KEY, details TEXT NOT NULL, anchored_at REAL NOT NULL)"
+        )
+        for (key,) in self._db.execute("SELECT hash FROM anchors"):
+            self._bloom.add(key)
+
+    def _remember(self, key, details):
+        self._lru[key] = details
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def lookup(self, key):
+        """Returns the details recorded when `key` (32-byte hash) was anchored, or None."""
+        key = bytes(key)
+        with self._lock:
+            if key not in self._bloom:
+                self.stats["bloom_misses"] += 1
+                return None
+            details = self._lru.get(key)
+            if details is not None:
+                self._lru.move_to_end(key)
+                self.stats["lru_hits"] += 1
+                return details
+            row = self._db.execute("SELECT details FROM anchors WHERE hash = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["false_positives"] += 1
+                return None
+            details = json.loads(row[0])
+            self._remember(key, details)
+            self.stats["db_hits"] += 1
+            return details
+
+    def record(self, key, details):
+        """Records that `key` is anchored; `details` holds at least extrinsic_hash and block_hash."""
+        key = bytes(key)
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO anchors (hash, details, anchored_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(details), time.time()),
+                )
+            self._bloom.add(key)
+            self._remember(key, details)
+
+    def record_many(self, items):
+        """Records several (key, details) pairs in one transaction."""
+        items = [(bytes(key), details) for key, details in items]
+        now = time.time()
+        with self._lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO anchors (hash, details, anchored_at) VALUES (?, ?, ?)",
+                    [(key, json.dumps(details), now) for key, details in items],
+                )
+            for key, details in items:
+                self._bloom.add(key)
+                self._remember(key, details)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(path=None):
+    """The process-wide index for `path` (default: ANCHOR_INDEX_PATH or the temp directory)."""
+    path = path or os.getenv("ANCHOR_INDEX_PATH") or DEFAULT_PATH
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = AnchorIndex(path)
+        return index
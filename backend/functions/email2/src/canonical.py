@@ -0,0 +1,142 @@
+"""
+Versioned canonical encodings of the job_history confirmation blob.
+
+The bytes produced here are hashed and anchored on chain, so an encoding must never
+change once released; changes get a new version. Version 1 is a schema-driven
+binary encoding:
+
+    b"ZIDJH" u8(version)
+    then for every field, in the fixed schema order:
+        u8(len(name)) name  tag  value
+
+    tag 0x00  null      (no value)
+    tag 0x01  string    u32 big-endian byte length, UTF-8 of the NFC-normalized text
+    tag 0x02  boolean   0x00 / 0x01
+    tag 0x03  datetime  i64 big-endian microseconds since the Unix epoch, UTC
+
+Field prefixes (name and its length) are precomputed, so encoding is a handful of
+appends and one join, and the output does not depend on JSON library details such
+as float or unicode formatting. Version 0 is the original sorted-key JSON, kept so confirmations
+anchored before version 1 can still be recomputed.
+"""
+import datetime
+import json
+import unicodedata
+
+
+STRING = "string"
+BOOLEAN = "boolean"
+DATETIME = "datetime"
+
+MAGIC = b"ZIDJH"
+TAG_NULL = b"\x00"
+TAG_STRING = 0x01
+TAG_FALSE = b"\x02\x00"
+TAG_TRUE = b"\x02\x01"
+TAG_DATETIME = 0x03
+
+_DATETIME_TAG = bytes([TAG_DATETIME])
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# (blob field, job_history document key, type), in encoding order.
+JOB_HISTORY_FIELDS_V1 = (
+    ("company_name", "company_name", STRING),
+    ("description", "description", STRING),
+    ("document_id", "$id", STRING),
+    ("end_date", "end_date", DATETIME),
+    ("is_current_job", "is_current_job", BOOLEAN),
+    ("job_title", "job_title", STRING),
+    ("start_date", "start_date", DATETIME),
+    ("verification_message", "verification_message", STRING),
+    ("verification_processed_at", "verification_processed_at", DATETIME),
+    ("verification_status", "verification_status", STRING),
+    ("verifier_email", "verifier_email", STRING),
+)
+
+
+_STRING_TAG_BIT = TAG_STRING << 32
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def _datetime_micros(value):
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if not isinstance(value, datetime.datetime):
+        raise TypeError(f"Expected an ISO 8601 datetime, got {type(value).__name__}.")
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+class CanonicalEncoder:
+    def __init__(self, version, fields):
+        self.version = version
+        self.label = f"job-history-v{version}"
+        self.fields = tuple(fields)
+        self._header = MAGIC + bytes([version])
+        self._plan = []
+        for name, key, kind in self.fields:
+            if kind not in (STRING, BOOLEAN, DATETIME):
+                raise ValueError(f"Unknown field type {kind!r} for field '{name}'.")
+            prefix = bytes([len(name.encode("utf-8"))]) + name.encode("utf-8")
+            self._plan.append((name, key, prefix, prefix + TAG_NULL, kind))
+
+    def encode(self, job_doc):
+        out = [self._header]
+        append = out.append
+        get = job_doc.get
+        for name, key, prefix, null, kind in self._plan:
+            value = get(key)
+            if value is None:
+                append(null)
+                continue
+            append(prefix)
+            if kind is STRING:
+                if type(value) is not str:
+                    raise ValueError(f"Cannot encode job history field '{name}': expected a string, got {type(value).__name__}.")
+                if not value.isascii():
+                    value = unicodedata.normalize("NFC", value)
+                data = value.encode("utf-8")
+                # Tag byte and 32-bit length in one 5-byte big-endian integer.
+                append((_STRING_TAG_BIT | len(data)).to_bytes(5, "big"))
+                append(data)
+            elif kind is BOOLEAN:
+                if type(value) is not bool:
+                    raise ValueError(f"Cannot encode job history field '{name}': expected a boolean, got {type(value).__name__}.")
+                append(TAG_TRUE if value else TAG_FALSE)
+            else:
+                try:
+                    micros = _datetime_micros(value)
+                except (TypeError, ValueError) as e:
+                    raise ValueError(f"Cannot encode job history field '{name}': {e}") from None
+                append(_DATETIME_TAG)
+                append(micros.to_bytes(8, "big", signed=True))
+        return b"".join(out)
+
+
+class LegacyJsonEncoder:
+    """Version 0: sorted-key compact JSON of the blob, as anchored before version 1."""
+
+    version = 0
+    label = "job-history-v0"
+
+    def __init__(self, fields=JOB_HISTORY_FIELDS_V1):
+        self.fields = tuple(fields)
+
+    def encode(self, job_doc):
+        blob_data = {name: job_doc.get(key) for name, key, _ in self.fields}
+        return json.dumps(blob_data, sort_keys=True, separators=(',', ':')).encode("utf-8")
+
+
+ENCODERS = {
+    0: LegacyJsonEncoder(),
+    1: CanonicalEncoder(1, JOB_HISTORY_FIELDS_V1),
+}
+CURRENT_VERSION = 1
+
+
+def get_encoder(version=CURRENT_VERSION):
+    try:
+        return ENCODERS[int(version)]
+    except (KeyError, ValueError):
+        raise ValueError(f"Unknown job history encoding version {version!r}. Known: {sorted(ENCODERS)}.") from None
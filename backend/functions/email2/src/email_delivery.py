@@ -0,0 +1,121 @@
+"""
+Email delivery providers for the server_actions cron.
+
+A provider takes a list of Resend-style message dicts ("from", "to", "subject",
+"html", "text") and returns one result per message, in the same order:
+{"id": <provider message id>, "error": None} or {"id": None, "error": <message>}.
+A failure of one message never hides the outcome of the others, so every
+server action can be marked completed or failed individually.
+
+EMAIL_PROVIDER selects the provider: "resend" (default) or "stub", which sends
+nothing and records the messages, for running the cron offline. The resend SDK is
+imported by the first send, so runs with nothing to send never load it.
+"""
+import hashlib
+import itertools
+import threading
+
+
+# Resend accepts at most 100 messages per batch call.
+RESEND_BATCH_LIMIT = 100
+
+
+def _failed(error):
+    return {"id": None, "error": error}
+
+
+class ResendProvider:
+    name = "resend"
+
+    def __init__(self, api_key=None, batch_limit=RESEND_BATCH_LIMIT):
+        self.api_key = api_key
+        self.batch_limit = batch_limit
+
+    def send_batch(self, messages, idempotency_key=None):
+        import resend
+
+        if self.api_key:
+            resend.api_key = self.api_key
+
+        results = []
+        for start in range(0, len(messages), self.batch_limit):
+            chunk = messages[start:start + self.batch_limit]
+            options = {"batch_validation": "permissive"}
+            if idempotency_key:
+                options["idempotency_key"] = f"{idempotency_key}-{start // self.batch_limit}"
+            try:
+                response = resend.Batch.send(chunk, options)
+            except Exception as e:
+                # The whole call failed (auth, rate limit, network): every message in it failed.
+                error = f"Resend batch call failed: {str(e)}. Type: {type(e).__name__}"
+                results.extend(_failed(error) for _ in chunk)
+                continue
+            results.extend(self._map_response(chunk, response))
+        return results
+
+    @staticmethod
+    def _map_response(chunk, response):
+        """
+        In permissive mode Resend returns ids for the accepted messages, in order, and
+        {"index", "message"} entries for the rejected ones.
+        """
+        response = response or {}
+        errors = {e.get("index"): e.get("message") or "Rejected by Resend." for e in response.get("errors") or []}
+        accepted = iter(response.get("data") or [])
+
+        results = []
+        for index in range(len(chunk)):
+            if index in errors:
+                results.append(_failed(f"Resend rejected the message: {errors[index]}"))
+                continue
+            sent = next(accepted, None)
+            if sent and sent.get("id"):
+                results.append({"id": sent["id"], "error": None})
+            else:
+                results.append(_failed(f"Resend returned no id for the message, response: {response}"))
+        return results
+
+
+class StubProvider:
+    """Sends nothing. Messages to `fail_recipients` fail, every other one gets a stub id."""
+
+    name = "stub"
+
+    def __init__(self, fail_recipients=()):
+        self.fail_recipients = set(fail_recipients)
+        self.sent = []
+        self.batches = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def send_batch(self, messages, idempotency_key=None):
+        results = []
+        with self._lock:
+            self.batches += 1
+            for message in messages:
+                if self.fail_recipients.intersection(message.get("to") or []):
+                    results.append(_failed(f"Stub transport rejected {message.get('to')}."))
+                    continue
+                self.sent.append(message)
+                results.append({"id": f"stub-{next(self._ids)}", "error": None})
+        return results
+
+
+PROVIDERS = {
+    ResendProvider.name: ResendProvider,
+    StubProvider.name: StubProvider,
+}
+
+
+def get_provider(name, **kwargs):
+    try:
+        provider_class = PROVIDERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown email provider '{name}'. Expected one of: {', '.join(PROVIDERS)}.") from None
+    return provider_class(**kwargs)
+
+
+def batch_idempotency_key(action_ids):
+    """The same set of actions always maps to the same key, so a retried batch is not delivered twice."""
+    digest = hashlib.sha256("\n".join(sorted(action_ids)).encode("utf-8")).hexdigest()
+    return f"verification-emails-{digest[:32]}"
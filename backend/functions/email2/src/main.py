@@ -1,8 +1,15 @@
 import os
 import json
-import resend # Make sure the resend library is included in your function's dependencies
 import datetime
+import importlib.util
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
 import traceback # For detailed error logging
+from concurrent.futures import ThreadPoolExecutor
 import hashlib # For SHA256 hashing
 
 from appwrite.client import Client
@@ -10,17 +17,24 @@ from appwrite.services.databases import Databases
 from appwrite.query import Query
 from appwrite.exception import AppwriteException
 
-# Attempt to import Polkadot related libraries
+from . import templates
+from .anchor_index import get_index
+from .canonical import get_encoder
+from .email_delivery import batch_idempotency_key, get_provider
+from .merkle import MerkleTree
+from .metrics import empty_state, merge, queue_metrics, to_prometheus
+from .retries import DEAD_LETTER_STATUS, PermanentActionError, failure_update, policy_warnings
+from .scheduling import plan_page, timings
+from .spans import NULL_SPANS, Spans
+
+# substrateinterface (imported by chain.py) dominates the cold start, and resend is imported by
+# email_delivery.py only when it sends: runs that just send email, or find the queue empty, never
+# load the chain libraries. See _get_chain() and benchmarks/import_profile.py.
 try:
     from dotenv import load_dotenv
-    from substrateinterface import ContractInstance, Keypair, SubstrateInterface
-    POLKADOT_LIBS_AVAILABLE = True
 except ImportError:
-    POLKADOT_LIBS_AVAILABLE = False
-    SubstrateInterface = None
-    Keypair = None
-    ContractInstance = None
     load_dotenv = None
+POLKADOT_LIBS_AVAILABLE = bool(load_dotenv) and importlib.util.find_spec("substrateinterface") is not None
 
 
 # --- Essential Configuration ---
@@ -31,7 +45,12 @@ APPWRITE_API_KEY = os.getenv("APPWRITE_FUNCTION_API_KEY")
 DB_ID = os.getenv("APPWRITE_DATABASE_ID")
 JOB_HISTORY_COLLECTION_ID = os.getenv("APPWRITE_JOB_HISTORY_ID")
 SERVER_ACTIONS_COLLECTION_ID = os.getenv("APPWRITE_SERVER_ACTIONS_COLLECTION_ID")
+CHAIN_SUBMISSIONS_COLLECTION_ID = os.getenv("APPWRITE_CHAIN_SUBMISSIONS_COLLECTION_ID") # Optional: enables the finality tracker
+METRICS_COLLECTION_ID = os.getenv("APPWRITE_METRICS_COLLECTION_ID") # Optional: enables the queue metrics document and GET /metrics
+ACTION_CLAIMS_COLLECTION_ID = os.getenv("APPWRITE_ACTION_CLAIMS_COLLECTION_ID") # Optional: makes claiming an action atomic across workers
 RESEND_API_KEY = os.getenv("RESEND_API_KEY") # Uppercase global variable
+# "resend" (default), or "stub" to run the cron without sending any email.
+EMAIL_PROVIDER = os.getenv("EMAIL_PROVIDER", "resend").lower()
 
 # --- Application URL for Verification Links ---
 VERIFICATION_BASE_URL = "https://zeroid.me" # As per specific request
@@ -42,11 +61,44 @@ POLKADOT_SUBSTRATE_URL = os.getenv("POLKADOT_SUBSTRATE_URL")
 POLKADOT_KEYPAIR_ACCOUNT = os.getenv("POLKADOT_KEYPAIR_ACCOUNT")
 POLKADOT_KEYPAIR_MNEMONIC = os.getenv('POLKADOT_KEYPAIR_MNEMONIC')
 ENV = os.getenv('ENV', 'prod')
+CONTRACT_METADATA_PATH = os.path.join(os.path.dirname(__file__), 'zid_contract.json')
+
+# --- Anchoring Mode ---
+# "merkle": CONFIRM_EMPLOYMENT actions of one run are anchored together under a single Merkle root.
+ANCHOR_BATCH_MODE = os.getenv("ANCHOR_BATCH_MODE", "").lower()
+
+# --- Confirmation Hash Encoding ---
+# Version of the canonical job history encoding that new confirmations are hashed with (see canonical.py).
+# Resolved on use, so a bad value only holds CONFIRM_EMPLOYMENT back (see _action_config_error).
+CONFIRMATION_ENCODING_VERSION = os.getenv("CONFIRMATION_ENCODING_VERSION", "1")
 
 # --- Constants ---
-MAX_TASKS_PER_RUN = 5
+ACTIONS_PAGE_SIZE = int(os.getenv("ACTIONS_PAGE_SIZE", "25"))
+# The cron stops starting new work once this much of the run (15s function timeout) is used.
+RUN_TIME_BUDGET_SECONDS = float(os.getenv("RUN_TIME_BUDGET_SECONDS", "12"))
+# How long a claimed action belongs to the run that claimed it. Must outlast the function timeout,
+# so a lease only expires once its owner can no longer be running.
+ACTION_LEASE_SECONDS = float(os.getenv("ACTION_LEASE_SECONDS", "60"))
+MAX_LEASES_SWEPT_PER_RUN = 100
+# Identifies this runtime in lease_owner; each run appends its own id.
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+MAX_SUBMISSIONS_PER_RECONCILE = 100
+METRICS_DOCUMENT_ID = "server_actions"
+FINALITY_TRACKER_BUDGET_SECONDS = float(os.getenv("FINALITY_TRACKER_BUDGET_SECONDS", "4"))
 ACTION_TYPE_SEND_VERIFICATION_EMAIL = "SEND_VERIFICATION_EMAIL"
 ACTION_TYPE_CONFIRM_EMPLOYMENT = "CONFIRM_EMPLOYMENT"
+# Timing keys for the once-per-run batch work, budgeted separately from the per-action part.
+EMAIL_BATCH_TIMING_KEY = "SEND_VERIFICATION_EMAIL_BATCH"
+ANCHOR_BATCH_TIMING_KEY = "CONFIRM_EMPLOYMENT_BATCH"
+if ANCHOR_BATCH_MODE == "merkle":
+    # Per action, batch mode only hashes the job history; the chain write is budgeted as the batch.
+    timings.defaults[ACTION_TYPE_CONFIRM_EMPLOYMENT] = 1.0
+
+# Max actions of each type processed at the same time within one run; unknown types run one at a time.
+ACTION_CONCURRENCY = {
+    ACTION_TYPE_SEND_VERIFICATION_EMAIL: int(os.getenv("EMAIL_CONCURRENCY", "8")),
+    ACTION_TYPE_CONFIRM_EMPLOYMENT: int(os.getenv("CHAIN_WRITE_CONCURRENCY", "2")),
+}
 
 if load_dotenv:
     if os.path.exists(".env"):
@@ -54,6 +106,25 @@ if load_dotenv:
     elif os.path.exists(os.path.join(os.path.dirname(__file__), '.env')):
         load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 
+POLKADOT_SIGNER = os.getenv('POLKADOT_SIGNER') or ENV
+
+_chain = None
+_chain_lock = threading.Lock()
+
+def _get_chain():
+    """Imports chain.py, and with it substrateinterface, on first use and registers the signers."""
+    global _chain
+    if _chain is None:
+        with _chain_lock:
+            if _chain is None:
+                from . import chain
+                chain.signers.register('local', uri=POLKADOT_KEYPAIR_ACCOUNT)
+                chain.signers.register('dev', mnemonic=POLKADOT_KEYPAIR_MNEMONIC)
+                chain.signers.register('prod', mnemonic=POLKADOT_KEYPAIR_MNEMONIC)
+                chain.signers.register_from_env()
+                _chain = chain
+    return _chain
+
 
 def validate_env_vars(context):
     """Validates essential Appwrite environment variables for basic script operation."""
@@ -72,7 +143,10 @@ def validate_env_vars(context):
         context.error(error_message)
         raise ValueError(error_message)
 
-    if not RESEND_API_KEY:
+    _get_email_provider()
+    for warning in policy_warnings:
+        context.warn(f"Warning: {warning}")
+    if EMAIL_PROVIDER == "resend" and not RESEND_API_KEY:
         context.warn("Warning: RESEND_API_KEY is not set. SEND_VERIFICATION_EMAIL actions will fail if attempted.")
     
     if POLKADOT_LIBS_AVAILABLE:
@@ -82,21 +156,136 @@ def validate_env_vars(context):
         context.warn("Warning: Polkadot libraries (substrateinterface, python-dotenv) are not available. CONFIRM_EMPLOYMENT actions cannot be processed.")
     return True
 
-def _send_verification_email(context, databases, job_history_id_to_fetch):
+_email_provider = None
+
+def _get_email_provider():
+    """The process-wide provider selected by EMAIL_PROVIDER; raises ValueError for an unknown name."""
+    global _email_provider
+    if _email_provider is None:
+        options = {"api_key": RESEND_API_KEY} if EMAIL_PROVIDER == "resend" else {}
+        _email_provider = get_provider(EMAIL_PROVIDER, **options)
+    return _email_provider
+
+_anchor_index_disabled = False
+
+def _get_anchor_index(context):
+    """The process-wide anchored-hash index, or None (deduplication off) if it cannot be opened."""
+    global _anchor_index_disabled
+    if _anchor_index_disabled:
+        return None
+    try:
+        return get_index()
+    except (sqlite3.Error, OSError) as e:
+        context.warn(f"Warning: anchored-hash index unavailable ({e}); duplicate hashes will be written to the chain again.")
+        _anchor_index_disabled = True
+        return None
+
+
+def _payload_job_history_id(action_type, payload_str):
+    """The job_history_id of an action's JSON payload; a PermanentActionError if there is none."""
+    if not payload_str:
+        raise PermanentActionError(f"Payload missing for {action_type}.")
+    try:
+        payload = json.loads(payload_str)
+    except json.JSONDecodeError as e:
+        raise PermanentActionError(f"Payload of {action_type} is not valid JSON: {e}") from None
+    job_history_id = payload.get("job_history_id") if isinstance(payload, dict) else None
+    if not job_history_id:
+        raise PermanentActionError("'job_history_id' missing in payload.")
+    return job_history_id
+
+
+def _action_config_error(action_type):
+    """
+    Why actions of `action_type` cannot run with this deployment's configuration, or None.
+    Checked before any action of the type is claimed: a misconfigured deploy leaves them
+    pending and untouched, so they run as soon as the configuration is fixed.
+    """
+    if action_type == ACTION_TYPE_SEND_VERIFICATION_EMAIL:
+        try:
+            _get_email_provider()
+        except ValueError as e:
+            return str(e)
+        if EMAIL_PROVIDER == "resend" and not RESEND_API_KEY:
+            return "RESEND_API_KEY not configured."
+    elif action_type == ACTION_TYPE_CONFIRM_EMPLOYMENT:
+        try:
+            get_encoder(CONFIRMATION_ENCODING_VERSION)
+        except ValueError as e:
+            return str(e)
+        if not POLKADOT_LIBS_AVAILABLE:
+            return "Polkadot libraries not available for CONFIRM_EMPLOYMENT."
+        if not all([POLKADOT_CONTRACT_ADDRESS, POLKADOT_SUBSTRATE_URL, ENV]):
+            return "Polkadot config (CONTRACT_ADDRESS, SUBSTRATE_URL, ENV) incomplete."
+        if ENV not in ['local', 'dev', 'prod']:
+            return f"Invalid ENV value '{ENV}'."
+        if ENV == 'local' and not POLKADOT_KEYPAIR_ACCOUNT:
+            return "POLKADOT_KEYPAIR_ACCOUNT required for ENV=local."
+        if ENV in ['dev', 'prod'] and not POLKADOT_KEYPAIR_MNEMONIC:
+            return f"POLKADOT_KEYPAIR_MNEMONIC required for ENV={ENV}."
+        try:
+            signers = _get_chain().signers
+        except ValueError as e:
+            return str(e)
+        if POLKADOT_SIGNER not in signers:
+            return f"No signer registered under '{POLKADOT_SIGNER}'."
+    return None
+
+
+def _prefetch_job_histories(context, databases, actions):
+    """
+    Fetches every job history document referenced by `actions` in one list_documents
+    call per 100 ids. Returns a per-run {document_id: document} cache for the handlers;
+    anything missing from it is fetched individually by _get_job_history.
+    """
+    job_history_ids = []
+    for action_doc in actions:
+        try:
+            job_history_id = json.loads(action_doc.get('payload') or '{}').get("job_history_id")
+        except (json.JSONDecodeError, AttributeError):
+            continue # The action's handler reports the malformed payload.
+        if job_history_id and job_history_id not in job_history_ids:
+            job_history_ids.append(job_history_id)
+
+    job_cache = {}
+    try:
+        for i in range(0, len(job_history_ids), 100):
+            chunk = job_history_ids[i:i + 100]
+            response = databases.list_documents(
+                DB_ID, JOB_HISTORY_COLLECTION_ID,
+                queries=[Query.equal("$id", chunk), Query.limit(len(chunk))]
+            )
+            job_cache.update({doc['$id']: doc for doc in response['documents']})
+    except AppwriteException as e:
+        context.warn(f"Prefetching job history documents failed, falling back to per-action fetches: {e}")
+
+    context.log(f"Prefetched {len(job_cache)} of {len(job_history_ids)} job history document(s).")
+    return job_cache
+
+
+def _get_job_history(databases, job_history_id, job_cache=None):
+    """Returns the job history document from the run's prefetch cache, or fetches it."""
+    document = job_cache.get(job_history_id) if job_cache else None
+    if document is None:
+        document = databases.get_document(
+            database_id=DB_ID,
+            collection_id=JOB_HISTORY_COLLECTION_ID,
+            document_id=job_history_id
+        )
+    return document
+
+
+def _build_verification_email(context, databases, job_history_id_to_fetch, job_cache=None):
     """
-    Handles the logic for fetching job history and sending the verification email
-    with styled ACCEPT/REJECT links.
+    Fetches the job history and renders the verification email with styled ACCEPT/REJECT
+    links. Returns the message; delivery happens for the whole run in _deliver_email_batch.
     """
     context.log(f"Fetching document for email from database '{DB_ID}', collection '{JOB_HISTORY_COLLECTION_ID}', document '{job_history_id_to_fetch}'")
-    document = databases.get_document(
-        database_id=DB_ID,
-        collection_id=JOB_HISTORY_COLLECTION_ID,
-        document_id=job_history_id_to_fetch
-    )
+    document = _get_job_history(databases, job_history_id_to_fetch, job_cache)
     
     verifier_email_str = document.get("verifier_email")
     if not verifier_email_str:
-        raise ValueError(f"Critical: Verifier email is missing for job history ID: {job_history_id_to_fetch}.")
+        raise PermanentActionError(f"Critical: Verifier email is missing for job history ID: {job_history_id_to_fetch}.")
 
     verification_message_str = document.get("verification_message") or "A candidate has requested employment verification."
     company_name_str = document.get("company_name") or "N/A"
@@ -104,105 +293,24 @@ def _send_verification_email(context, databases, job_history_id_to_fetch):
     start_date_str = document.get("start_date") or "N/A" 
     end_date_str = document.get("end_date") or "N/A"
     description_str = document.get("description") or "No additional description provided."
-    current_year = datetime.datetime.now().year
 
     # Construct verification links using the specified base URL
     accept_link = f"{VERIFICATION_BASE_URL}/verify-employment/{job_history_id_to_fetch}/accept"
     reject_link = f"{VERIFICATION_BASE_URL}/verify-employment/{job_history_id_to_fetch}/reject"
 
-    html_body = f"""
-<!DOCTYPE html>
-<html>
-<head>
-  <meta charset="utf-8">
-  <meta http-equiv="x-ua-compatible" content="ie=edge">
-  <title>Employment Verification Request</title>
-  <meta name="viewport" content="width=device-width, initial-scale=1">
-  <style type="text/css">
-    body, table, td, a {{ -ms-text-size-adjust: 100%; -webkit-text-size-adjust: 100%; }}
-    table, td {{ mso-table-lspace: 0pt; mso-table-rspace: 0pt; }}
-    img {{ -ms-interpolation-mode: bicubic; border: 0; height: auto; line-height: 100%; outline: none; text-decoration: none; }}
-    table {{ border-collapse: collapse !important; }}
-    body {{ height: 100% !important; margin: 0 !important; padding: 0 !important; width: 100% !important; font-family: Arial, sans-serif; line-height: 1.6; color: #333333; background-color: #f4f4f4; padding: 20px; }}
-    .container {{ background-color: #ffffff; padding: 30px; border-radius: 8px; max-width: 600px; margin: 0 auto; box-shadow: 0 0 10px rgba(0,0,0,0.1); }}
-    .header {{ text-align: center; padding-bottom: 20px; border-bottom: 1px solid #eeeeee; }}
-    .header h1 {{ margin: 0; font-size: 24px; color: #007bff; }}
-    .content p {{ margin: 15px 0; }}
-    .content strong {{ color: #555555; }}
-    .data-item {{ margin-bottom: 10px; padding-left: 10px; }}
-    .data-item span {{ font-weight: bold; }}
-    .verification-links p {{ margin-top: 20px; margin-bottom: 20px; text-align: center; }} /* Centered paragraph for links */
-    .verification-links a {{ text-decoration: none; padding: 0 10px; }}
-    .accept-link {{ font-weight: bold; color: green; }}
-    .reject-link {{ font-weight: bold; color: red; }}
-    .footer {{ text-align: center; padding-top: 20px; border-top: 1px solid #eeeeee; font-size: 12px; color: #777777; }}
-    .footer p {{ margin: 5px 0; }}
-  </style>
-</head>
-<body>
-  <div class="container">
-    <div class="header"><h1>Employment Verification Request</h1></div>
-    <div class="content">
-      <p>Dear Recipient,</p>
-      <p><strong>{verification_message_str}</strong></p>
-      <p>Please verify the following employment details for a candidate:</p>
-      <div class="data-item"><span>Company:</span> {company_name_str}</div>
-      <div class="data-item"><span>Job Title:</span> {job_title_str}</div>
-      <div class="data-item"><span>Employment Duration:</span> {start_date_str} to {end_date_str}</div>
-      <div class="data-item"><span>Job Description:</span></div>
-      <p style="padding-left: 10px;">{description_str}</p>
-      <p>Your timely response is greatly appreciated.</p>
-      
-      <div class="verification-links">
-        <p>
-          <a href="{accept_link}" class="accept-link" target="_blank">ACCEPT</a>
-          <span style="color: #cccccc;">&nbsp;|&nbsp;</span>
-          <a href="{reject_link}" class="reject-link" target="_blank">REJECT</a>
-        </p>
-      </div>
-
-      <p style="font-size:12px; color: #555555;">If you are unable to click the links above, please copy and paste the appropriate URL into your browser:</p>
-      <p style="font-size:12px; color: #555555;">Accept: {accept_link}</p>
-      <p style="font-size:12px; color: #555555;">Reject: {reject_link}</p>
-    </div>
-    <div class="footer">
-      <p>This email was sent from Zero ID.</p>
-      <p>If you received this email in error, you can safely delete it. Please do not reply if you are not the intended recipient.</p>
-      <p>&copy; {current_year} Zero ID. All rights reserved.</p>
-    </div>
-  </div>
-</body>
-</html>
-"""
-    text_body = f"""
-Dear Recipient,
-
-{verification_message_str}
-
-Please verify the following employment details for a candidate:
-
-Company: {company_name_str}
-Job Title: {job_title_str}
-Employment Duration: {start_date_str} to {end_date_str}
-
-Job Description:
-{description_str}
-
-Your timely response is greatly appreciated.
-
-To process this request, please use the links below:
-
-ACCEPT:
-{accept_link}
-
-REJECT:
-{reject_link}
-
----
-This email was sent from Zero ID.
-If you received this email in error, you can safely delete it. Please do not reply if you are not the intended recipient.
-© {current_year} Zero ID. All rights reserved.
-"""
+    fields = {
+        "verification_message": verification_message_str,
+        "company_name": company_name_str,
+        "job_title": job_title_str,
+        "start_date": start_date_str,
+        "end_date": end_date_str,
+        "description": description_str,
+        "accept_link": accept_link,
+        "reject_link": reject_link,
+        "current_year": templates.current_year(),
+    }
+    html_body = templates.load("verification_email.html").render(fields)
+    text_body = templates.load("verification_email.txt").render(fields)
     context.log(f"Preparing to send email to: {verifier_email_str} for job history {job_history_id_to_fetch}")
     context.log(f"Accept link: {accept_link}")
     context.log(f"Reject link: {reject_link}")
@@ -214,16 +322,9 @@ If you received this email in error, you can safely delete it. Please do not rep
         "text": text_body,
     }
 
-    email_response = resend.Emails.send(params)
-    context.log(f"Resend API Response for job {job_history_id_to_fetch}: {email_response}")
+    return params
 
-    if not (isinstance(email_response, dict) and email_response.get('id')):
-        context.warn(f"Email send to {verifier_email_str} for job {job_history_id_to_fetch} may not have succeeded, response: {email_response}")
-
-    context.log(f"Verification email sent successfully for job history {job_history_id_to_fetch} to {verifier_email_str}.")
-    return True
-
-def _store_hash_on_chain(context, hash_to_store):
+def _store_hash_on_chain(context, hash_to_store, spans=NULL_SPANS):
     """
     Stores a given hash on the Polkadot chain.
     Returns a dictionary with 'extrinsic_hash' and 'block_hash' on success.
@@ -232,35 +333,51 @@ def _store_hash_on_chain(context, hash_to_store):
         raise RuntimeError("Polkadot libraries are not available. Cannot call _store_hash_on_chain.")
 
     context.log(f"Attempting to store hash on chain: {hash_to_store.hex()}")
-    substrate = SubstrateInterface(url=POLKADOT_SUBSTRATE_URL, type_registry_preset='substrate-node-template')
-    context.log(f"Substrate interface initialized for URL: {POLKADOT_SUBSTRATE_URL}")
 
     if ENV == 'local':
         if not POLKADOT_KEYPAIR_ACCOUNT:
             raise ValueError("POLKADOT_KEYPAIR_ACCOUNT is not set for ENV=local")
-        keypair = Keypair.create_from_uri(POLKADOT_KEYPAIR_ACCOUNT)
     elif ENV in ['dev', 'prod']:
         if not POLKADOT_KEYPAIR_MNEMONIC:
             raise ValueError(f"POLKADOT_KEYPAIR_MNEMONIC is not set for ENV={ENV}")
-        keypair = Keypair.create_from_mnemonic(POLKADOT_KEYPAIR_MNEMONIC)
     else:
         raise ValueError(f'Invalid ENV value: {ENV}. Must be "local", "dev", or "prod".')
 
-    contract_path = os.path.join(os.path.dirname(__file__), 'zid_contract.json')
-    if not os.path.exists(contract_path):
-        raise FileNotFoundError(f"Contract metadata file not found: {contract_path}.")
-    
-    contract = ContractInstance.create_from_address(
-        substrate=substrate,
-        contract_address=POLKADOT_CONTRACT_ADDRESS,
-        metadata_file=contract_path
-    )
-    context.log(f'Successfully created contract instance for address: {POLKADOT_CONTRACT_ADDRESS}')
-    
-    receipt = contract.exec(keypair, 'store_verified_resume_data', args={'hash': hash_to_store})
-    context.log(f"Contract exec submitted. Extrinsic hash: {receipt.extrinsic_hash if receipt else 'No receipt'}")
-    
-    if receipt and receipt.is_success:
+    chain = _get_chain()
+    signers = chain.signers
+
+    # Derived once per process; only the first action of a warm runtime pays for it.
+    already_derived = POLKADOT_SIGNER in signers.derivation_times
+    with spans.span("signer"):
+        keypair = signers.get(POLKADOT_SIGNER)
+    if not already_derived and POLKADOT_SIGNER in signers.derivation_times:
+        context.log(f"Derived signer '{POLKADOT_SIGNER}' in {signers.derivation_times[POLKADOT_SIGNER]:.3f}s.")
+
+    # Parsed once per process; a missing metadata file surfaces here as FileNotFoundError.
+    with spans.span("contract_metadata"):
+        compiled_contract = chain.get_contract(POLKADOT_CONTRACT_ADDRESS, CONTRACT_METADATA_PATH)
+
+    pool = chain.get_pool(POLKADOT_SUBSTRATE_URL)
+    write_started = time.perf_counter()
+    try:
+        with pool.connection(spans=spans) as substrate:
+            context.log(f"Substrate connection acquired for URL: {POLKADOT_SUBSTRATE_URL}")
+
+            receipt = compiled_contract.exec(substrate, keypair, 'store_verified_resume_data', args={'hash': hash_to_store}, spans=spans)
+            context.log(f"Contract exec submitted. Extrinsic hash: {receipt.extrinsic_hash if receipt else 'No receipt'}")
+
+            # Resolve the receipt's events while the connection is still held.
+            with spans.span("receipt"):
+                is_success = bool(receipt and receipt.is_success)
+    except Exception:
+        queue_metrics.observe("chain_write_duration_seconds", time.perf_counter() - write_started, status="error")
+        raise
+    queue_metrics.observe("chain_write_duration_seconds", time.perf_counter() - write_started, status="success" if is_success else "failure")
+
+    context.log(f"Substrate pool stats: {pool.stats.as_dict()}")
+    context.log(f"Gas estimate cache stats: {chain.gas_estimates.stats.as_dict()}")
+
+    if is_success:
         block_hash = receipt.block_hash if hasattr(receipt, "block_hash") else None
         context.log(
             f'Successfully stored hash on chain. '
@@ -279,40 +396,47 @@ def _store_hash_on_chain(context, hash_to_store):
         raise RuntimeError("Contract execution did not return a receipt.")
 
 
-def _handle_confirm_employment(context, databases, payload_str):
+def _compute_confirmation_hash(context, databases, job_history_id, job_cache=None):
     """
-    Handles the CONFIRM_EMPLOYMENT action: fetches job history, hashes data, stores on chain,
-    and updates job history with confirmation details.
-    This function is now triggered AFTER a verifier has clicked "accept".
-    The job_history item should already have verification_status = 'VERIFIED_BY_RECIPIENT' (or similar).
+    Fetches the job history document and returns the SHA256 digest of its canonical
+    confirmation blob, encoded with the CONFIRMATION_ENCODING_VERSION encoder.
     """
-    context.log("Executing CONFIRM_EMPLOYMENT action (post-verifier acceptance).")
-    payload = json.loads(payload_str) 
-    job_history_id = payload.get("job_history_id")
-
     context.log(f"Fetching job history document ID: {job_history_id} for on-chain confirmation.")
-    job_doc = databases.get_document(DB_ID, JOB_HISTORY_COLLECTION_ID, job_history_id)
+    job_doc = _get_job_history(databases, job_history_id, job_cache)
     context.log(f"Retrieved job history document: {job_doc.get('$id')}, current status: {job_doc.get('verification_status')}")
 
     if job_doc.get('verification_status') != 'VERIFIED_BY_RECIPIENT':
          context.warn(f"Job history {job_history_id} is being processed for on-chain confirmation, but its status is '{job_doc.get('verification_status')}', not 'VERIFIED_BY_RECIPIENT'. Proceeding with hash based on current data.")
 
-    blob_data = {
-        "document_id": job_doc.get("$id"), "job_title": job_doc.get("job_title"),
-        "company_name": job_doc.get("company_name"), "start_date": job_doc.get("start_date"),
-        "end_date": job_doc.get("end_date"), "description": job_doc.get("description"),
-        "is_current_job": job_doc.get("is_current_job"),
-        "verification_status": job_doc.get("verification_status"), 
-        "verifier_email": job_doc.get("verifier_email"),
-        "verification_processed_at": job_doc.get("verification_processed_at"),
-        "verification_message": job_doc.get("verification_message"), 
-    }
-    blob_text = json.dumps(blob_data, sort_keys=True, separators=(',', ':'))
-    context.log(f"Constructed blob_text for hashing (first 100 chars): {blob_text[:100]}...")
-    blob_hash_bytes = hashlib.sha256(blob_text.encode("utf-8")).digest()
+    encoder = get_encoder(CONFIRMATION_ENCODING_VERSION)
+    blob_bytes = encoder.encode(job_doc)
+    context.log(f"Encoded confirmation blob with {encoder.label} ({len(blob_bytes)} bytes).")
+    blob_hash_bytes = hashlib.sha256(blob_bytes).digest()
     context.log(f"Hashed blob_text (bytes): {blob_hash_bytes.hex()}")
+    return blob_hash_bytes
+
+
+def _handle_confirm_employment(context, databases, payload_str, job_cache=None, spans=NULL_SPANS):
+    """
+    Handles the CONFIRM_EMPLOYMENT action: fetches job history, hashes data, stores on chain,
+    and updates job history with confirmation details.
+    This function is now triggered AFTER a verifier has clicked "accept".
+    The job_history item should already have verification_status = 'VERIFIED_BY_RECIPIENT' (or similar).
+    """
+    context.log("Executing CONFIRM_EMPLOYMENT action (post-verifier acceptance).")
+    job_history_id = _payload_job_history_id(ACTION_TYPE_CONFIRM_EMPLOYMENT, payload_str)
 
-    onchain_result = _store_hash_on_chain(context, blob_hash_bytes)
+    with spans.span("confirmation_hash"):
+        blob_hash_bytes = _compute_confirmation_hash(context, databases, job_history_id, job_cache)
+
+    anchor_index = _get_anchor_index(context)
+    onchain_result = anchor_index.lookup(blob_hash_bytes) if anchor_index else None
+    if onchain_result:
+        context.log(f"Hash {blob_hash_bytes.hex()} is already anchored in extrinsic {onchain_result.get('extrinsic_hash')}; reusing it instead of writing again.")
+    else:
+        onchain_result = _store_hash_on_chain(context, blob_hash_bytes, spans)
+        if anchor_index:
+            anchor_index.record(blob_hash_bytes, onchain_result)
     tx_hash = onchain_result.get("extrinsic_hash")
     block_hash = onchain_result.get("block_hash")
     
@@ -320,17 +444,578 @@ def _handle_confirm_employment(context, databases, payload_str):
         "onchain_confirmation_tx_hash": tx_hash,
         "onchain_confirmation_block_hash": block_hash,
         "onchain_confirmed_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "onchain_blob_encoding": get_encoder(CONFIRMATION_ENCODING_VERSION).label,
         "verification_status": "CONFIRMED_ONCHAIN" 
     }
+    if onchain_result.get("merkle_root"):
+        # Reused from a merkle-mode batch: the tx anchors the root, so the proof must go along.
+        update_data.update({
+            "onchain_leaf_hash": blob_hash_bytes.hex(),
+            "onchain_merkle_root": onchain_result["merkle_root"],
+            "onchain_merkle_leaf_index": onchain_result["leaf_index"],
+            "onchain_merkle_proof": json.dumps(onchain_result["proof"]),
+        })
     try:
-        databases.update_document(DB_ID, JOB_HISTORY_COLLECTION_ID, job_history_id, data=update_data)
+        with spans.span("job_history_update"):
+            databases.update_document(DB_ID, JOB_HISTORY_COLLECTION_ID, job_history_id, data=update_data)
         context.log(f"Updated job history {job_history_id} with on-chain details and status CONFIRMED_ONCHAIN. TxHash: {tx_hash}, BlockHash: {block_hash}")
     except AppwriteException as e:
+        # Fails the action; its retry finds the hash in the anchor index and writes this anchor again.
         context.error(f"Failed to update job history {job_history_id} to CONFIRMED_ONCHAIN: {e}. Ensure attributes exist.")
+        raise
 
     return {"tx_hash": tx_hash, "block_hash": block_hash}
 
 
+def _prepare_batched_confirmation(context, databases, action_id, payload_str, job_cache=None):
+    """
+    First half of CONFIRM_EMPLOYMENT in merkle batch mode: hashes the job history now,
+    anchoring happens once for the whole run in _anchor_confirmation_batch.
+    """
+    context.log(f"Preparing CONFIRM_EMPLOYMENT action {action_id} for batched anchoring.")
+    job_history_id = _payload_job_history_id(ACTION_TYPE_CONFIRM_EMPLOYMENT, payload_str)
+
+    blob_hash_bytes = _compute_confirmation_hash(context, databases, job_history_id, job_cache)
+    return {"action_id": action_id, "job_history_id": job_history_id, "leaf": blob_hash_bytes}
+
+
+def _complete_batched_confirmation(context, databases, item, anchor, confirmed_at):
+    """
+    Writes one batched confirmation's anchor to its job history document and completes
+    its action. `anchor` carries extrinsic_hash and block_hash, plus merkle_root,
+    leaf_index and proof when the leaf was anchored under a Merkle root.
+    If the job history cannot be written the action fails instead; its retry finds the
+    leaf in the anchor index and writes the same anchor without anchoring again.
+    Returns True when the action completed.
+    """
+    job_history_id = item["job_history_id"]
+    tx_hash = anchor.get("extrinsic_hash")
+    block_hash = anchor.get("block_hash")
+    update_data = {
+        "onchain_confirmation_tx_hash": tx_hash,
+        "onchain_confirmation_block_hash": block_hash,
+        "onchain_confirmed_at": confirmed_at,
+        "onchain_blob_encoding": get_encoder(CONFIRMATION_ENCODING_VERSION).label,
+        "onchain_leaf_hash": item["leaf"].hex(),
+        "verification_status": "CONFIRMED_ONCHAIN"
+    }
+    if anchor.get("merkle_root"):
+        update_data.update({
+            "onchain_merkle_root": anchor["merkle_root"],
+            "onchain_merkle_leaf_index": anchor["leaf_index"],
+            "onchain_merkle_proof": json.dumps(anchor["proof"]),
+        })
+        action_result_details_str = f"Employment confirmed in Merkle batch. Root: {anchor['merkle_root']}, LeafIndex: {anchor['leaf_index']}, TxHash: {tx_hash}, BlockHash: {block_hash}"
+    else:
+        action_result_details_str = f"Employment confirmed. TxHash: {tx_hash}, BlockHash: {block_hash}"
+
+    try:
+        databases.update_document(DB_ID, JOB_HISTORY_COLLECTION_ID, job_history_id, data=update_data)
+        context.log(f"Updated job history {job_history_id} with on-chain details and status CONFIRMED_ONCHAIN. {action_result_details_str}")
+    except AppwriteException as e:
+        error_message = f"Error processing action {item['action_id']} ({ACTION_TYPE_CONFIRM_EMPLOYMENT}): failed to update job history {job_history_id} with its anchor ({tx_hash}): {e}. Ensure attributes exist."
+        context.error(error_message)
+        _fail_action(context, databases, item["action_doc"], item["action_doc"].get('attempts', 0) + 1, error_message)
+        return False
+
+    try:
+        databases.update_document(
+            DB_ID, SERVER_ACTIONS_COLLECTION_ID, item["action_id"],
+            data={"status": "completed", "last_error": None, "action_result_details": action_result_details_str}
+        )
+    except AppwriteException as db_update_err:
+        context.error(f"CRITICAL: Failed to update action {item['action_id']} status to 'completed': {db_update_err}")
+    context.log(f"Action ID: {item['action_id']} completed. Details: {action_result_details_str}")
+    return True
+
+
+def _anchor_confirmation_batch(context, databases, batch, spans=NULL_SPANS):
+    """
+    Anchors the Merkle root of every prepared confirmation with one extrinsic, then writes
+    each job history document with its leaf index and inclusion proof. Leaves that the
+    anchor index already knows, such as retries of actions whose job history write
+    failed, reuse their earlier anchor and stay out of the tree.
+    Returns (processed_count, failed_count).
+    """
+    confirmed_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    anchor_index = _get_anchor_index(context)
+
+    completed = 0
+    fresh = []
+    for item in batch:
+        previous = anchor_index.lookup(item["leaf"]) if anchor_index else None
+        if previous:
+            context.log(f"Leaf {item['leaf'].hex()} of action {item['action_id']} is already anchored in extrinsic {previous.get('extrinsic_hash')}; reusing it.")
+            completed += _complete_batched_confirmation(context, databases, item, previous, confirmed_at)
+        else:
+            fresh.append(item)
+    if not fresh:
+        return completed, len(batch) - completed
+
+    tree = MerkleTree([item["leaf"] for item in fresh])
+    root_hex = tree.root.hex()
+    context.log(f"Anchoring Merkle root {root_hex} for {len(fresh)} confirmation(s).")
+
+    try:
+        onchain_result = _store_hash_on_chain(context, tree.root, spans)
+    except Exception as e:
+        error_message = f"Error anchoring Merkle root {root_hex} for batch of {len(fresh)}: {str(e)}. Type: {type(e).__name__}"
+        context.error(error_message)
+        context.error(traceback.format_exc())
+        for item in fresh:
+            _fail_action(context, databases, item["action_doc"], item["action_doc"].get('attempts', 0) + 1, error_message)
+        return completed, len(batch) - completed
+
+    anchors = [
+        {
+            "extrinsic_hash": onchain_result.get("extrinsic_hash"),
+            "block_hash": onchain_result.get("block_hash"),
+            "merkle_root": root_hex,
+            "leaf_index": index,
+            "proof": tree.proof(index),
+        }
+        for index in range(len(fresh))
+    ]
+    if anchor_index:
+        anchor_index.record_many([(item["leaf"], anchor) for item, anchor in zip(fresh, anchors)])
+
+    for item, anchor in zip(fresh, anchors):
+        completed += _complete_batched_confirmation(context, databases, item, anchor, confirmed_at)
+
+    return completed, len(batch) - completed
+
+
+def _deliver_email_batch(context, databases, batch):
+    """
+    Sends every verification email queued in this run through the configured provider,
+    then marks each action completed, or schedules its retry, from its own delivery result.
+    Returns (processed_count, failed_count).
+    """
+    provider = _get_email_provider()
+    context.log(f"Delivering {len(batch)} verification email(s) through the '{provider.name}' provider.")
+    results = provider.send_batch(
+        [item["message"] for item in batch],
+        idempotency_key=batch_idempotency_key([item["action_id"] for item in batch]),
+    )
+
+    processed_count = 0
+    failed_count = 0
+    for item, result in zip(batch, results):
+        action_id = item["action_id"]
+        recipients = ", ".join(item["message"]["to"])
+        if result["error"]:
+            error_message = f"Error processing action {action_id} ({ACTION_TYPE_SEND_VERIFICATION_EMAIL}): {result['error']}"
+            context.error(error_message)
+            _fail_action(context, databases, item["action_doc"], item["action_doc"].get('attempts', 0) + 1, error_message)
+            failed_count += 1
+            continue
+
+        action_result_details_str = f"Email sent successfully. EmailId: {result['id']}"
+        context.log(f"Verification email sent successfully for job history {item['job_history_id']} to {recipients}.")
+        data = {"status": "completed", "last_error": None, "action_result_details": action_result_details_str}
+        processed_count += 1
+        try:
+            databases.update_document(DB_ID, SERVER_ACTIONS_COLLECTION_ID, action_id, data=data)
+        except AppwriteException as db_update_err:
+            context.error(f"CRITICAL: Failed to update action {action_id} status to '{data['status']}': {db_update_err}")
+        context.log(f"Action ID: {action_id} {data['status']}.")
+
+    return processed_count, failed_count
+
+
+def _reconcile_chain_submissions(context, databases):
+    """
+    Resolves inclusion and finality for extrinsics submitted without waiting (see the
+    Store Verified Resume Data function's submit-only mode) and writes the outcome back.
+    One pass over new blocks serves every pending submission, within
+    FINALITY_TRACKER_BUDGET_SECONDS. Pending submissions keep `next_scan_block`, where the
+    pass stopped, so the next tick resumes there instead of rescanning from their
+    submission; included ones are only checked for finality, once per tick.
+    Returns the number of submission documents whose status changed.
+    """
+    if not (CHAIN_SUBMISSIONS_COLLECTION_ID and POLKADOT_LIBS_AVAILABLE and POLKADOT_SUBSTRATE_URL):
+        return 0
+
+    submissions_response = databases.list_documents(
+        DB_ID, CHAIN_SUBMISSIONS_COLLECTION_ID,
+        queries=[Query.equal("status", ["pending", "included"]), Query.order_asc("$createdAt"), Query.limit(MAX_SUBMISSIONS_PER_RECONCILE)]
+    )
+    submission_docs = submissions_response['documents']
+    if not submission_docs:
+        return 0
+
+    context.log(f"Tracking {len(submission_docs)} submitted extrinsic(s) for inclusion and finality.")
+    deadline = time.monotonic() + FINALITY_TRACKER_BUDGET_SECONDS
+    included = {
+        doc["extrinsic_hash"]: {
+            "block_hash": doc.get("block_hash"), "block_number": doc.get("block_number"),
+            "is_success": doc.get("is_success"), "error_message": doc.get("last_error"),
+        }
+        for doc in submission_docs if doc.get("status") == "included"
+    }
+    resume_points = [doc.get("next_scan_block") or doc["submitted_at_block"] for doc in submission_docs if doc.get("status") == "pending"]
+    try:
+        chain = _get_chain()
+        with chain.get_pool(POLKADOT_SUBSTRATE_URL).connection() as substrate:
+            tracker = chain.FinalityTracker(substrate)
+            results = tracker.track(
+                {doc["extrinsic_hash"]: doc["submitted_at_block"] for doc in submission_docs}, deadline,
+                included=included, scan_from=min(resume_points) if resume_points else None,
+            )
+    except Exception as e:
+        # Tracking is retried on the next tick; it must not fail the run's action processing.
+        context.error(f"Finality tracking failed: {str(e)}. Type: {type(e).__name__}")
+        return 0
+
+    updated_count = 0
+    for doc in submission_docs:
+        result = results.get(doc["extrinsic_hash"])
+        if not result:
+            continue
+        changed = result["status"] != doc.get("status") or result["block_hash"] != doc.get("block_hash")
+        data = {}
+        if changed:
+            if result["is_success"] is False and chain.gas_estimates.invalidate_for_error(result["error_message"]):
+                context.log(f"Submission {doc['extrinsic_hash']} ran out of gas or storage deposit; the next call re-estimates.")
+            data.update({
+                "status": result["status"],
+                "block_hash": result["block_hash"],
+                "block_number": result["block_number"],
+                "is_success": result["is_success"],
+                "last_error": str(result["error_message"])[:2048] if result["error_message"] else None,
+            })
+        if result["status"] == "pending" and doc.get("next_scan_block") != tracker.next_block:
+            data["next_scan_block"] = tracker.next_block
+        if not data:
+            continue
+        try:
+            databases.update_document(DB_ID, CHAIN_SUBMISSIONS_COLLECTION_ID, doc["$id"], data=data)
+        except AppwriteException as e:
+            context.error(f"Failed to update chain submission {doc['$id']}: {e}")
+            continue
+        if changed:
+            updated_count += 1
+            context.log(f"Submission {doc['extrinsic_hash']} is now {result['status']} (block {result['block_hash']}, success: {result['is_success']}).")
+    return updated_count
+
+
+def _record_backlog(pending_actions_response):
+    """Backlog gauges from the run's first page of pending actions, which is ordered oldest first."""
+    documents = pending_actions_response['documents']
+    queue_metrics.set("server_actions_backlog", pending_actions_response.get('total', len(documents)))
+    oldest_age = 0.0
+    if documents:
+        try:
+            created_at = datetime.datetime.fromisoformat(documents[0]['$createdAt'])
+            oldest_age = max(0.0, (datetime.datetime.now(datetime.timezone.utc) - created_at).total_seconds())
+        except (KeyError, TypeError, ValueError):
+            return
+    queue_metrics.set("server_actions_oldest_pending_age_seconds", round(oldest_age, 3))
+
+
+def _load_metrics_state(databases):
+    """The cumulative metrics held in the metrics document, or an empty state if there is none yet."""
+    try:
+        doc = databases.get_document(DB_ID, METRICS_COLLECTION_ID, METRICS_DOCUMENT_ID)
+    except AppwriteException as e:
+        if e.code != 404:
+            raise
+        return None
+    return json.loads(doc.get("state") or "{}") or empty_state()
+
+
+def _publish_metrics(context, databases):
+    """
+    Merges what this run recorded into the metrics document: one read and one write per
+    run. Two runs publishing at the same moment can lose one run's increments; the
+    metrics must never fail the run, so errors are only logged.
+    """
+    delta = queue_metrics.drain()
+    if not METRICS_COLLECTION_ID:
+        return
+    try:
+        state = _load_metrics_state(databases)
+        data = {"state": json.dumps(merge(state or empty_state(), delta))}
+        if state is None:
+            databases.create_document(DB_ID, METRICS_COLLECTION_ID, METRICS_DOCUMENT_ID, data=data)
+        else:
+            databases.update_document(DB_ID, METRICS_COLLECTION_ID, METRICS_DOCUMENT_ID, data=data)
+    except (AppwriteException, ValueError) as e:
+        context.warn(f"Warning: publishing queue metrics failed: {e}")
+
+
+def _metrics_response(context, databases):
+    """GET /metrics: the cumulative queue metrics in the Prometheus text format."""
+    if not METRICS_COLLECTION_ID:
+        return context.res.text("Queue metrics are disabled; set APPWRITE_METRICS_COLLECTION_ID.\n", 404)
+    state = _load_metrics_state(databases) or empty_state()
+    return context.res.text(to_prometheus(state), 200, {"content-type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+def _utc_now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _fail_action(context, databases, action_doc, attempt, error_message, permanent=False):
+    """
+    Records failed attempt number `attempt` of `action_doc` as listed: the action goes back
+    to pending with a backoff `next_attempt_at`, or to dead_letter once its retry policy is
+    used up or the error is `permanent`. Returns the new status.
+    """
+    action_id = action_doc['$id']
+    action_type = action_doc.get('action_type')
+    data = failure_update(action_type, attempt, action_doc.get('error_history'), error_message, permanent=permanent)
+    try:
+        databases.update_document(DB_ID, SERVER_ACTIONS_COLLECTION_ID, action_id, data=data)
+    except AppwriteException as db_update_err:
+        context.error(f"CRITICAL: Failed to update action {action_id} status to '{data['status']}': {db_update_err}")
+        return data["status"]
+
+    if data["status"] == DEAD_LETTER_STATUS:
+        queue_metrics.inc("server_actions_dead_lettered_total", action_type=action_type)
+        context.error(f"Action ID: {action_id} moved to {DEAD_LETTER_STATUS} after attempt {attempt}.")
+    else:
+        queue_metrics.inc("server_action_retries_scheduled_total", action_type=action_type)
+        context.log(f"Action ID: {action_id} failed attempt {attempt}; next attempt at {data['next_attempt_at']}.")
+    return data["status"]
+
+
+def _claim_action(context, databases, action_doc, lease_owner):
+    """
+    Moves a listed pending action to processing under `lease_owner`'s lease. Returns False
+    when another worker claimed it first, in which case this run must leave it alone, and
+    likewise when claiming fails for any other reason: the action is left for a later run
+    (a half-made claim expires and is swept), and never failed by a worker that may not hold it.
+
+    The transition only happens from the version of the action that was listed. With
+    ACTION_CLAIMS_COLLECTION_ID, the claim is a document whose ID is the action ID plus its
+    `attempts` count, which every claim bumps: creating it is atomic, so exactly one worker
+    gets each version and the rest see a 409. Without it, the action is re-read and claimed
+    only if its `$updatedAt` is still the listed one, then read back to check that the lease
+    is still ours. That catches most overlaps but not all, since Appwrite has no conditional
+    update; run a single worker in that setup.
+    """
+    try:
+        claimed = _try_claim_action(context, databases, action_doc, lease_owner)
+        if not claimed:
+            queue_metrics.inc("server_action_claim_conflicts_total", action_type=action_doc.get('action_type'))
+        return claimed
+    except Exception as e:
+        context.error(f"Could not claim action ID: {action_doc['$id']}; leaving it for a later run: {repr(e)}")
+        queue_metrics.inc("server_action_claim_errors_total", action_type=action_doc.get('action_type'))
+        return False
+
+
+def _try_claim_action(context, databases, action_doc, lease_owner):
+    action_id = action_doc['$id']
+    attempts = action_doc.get('attempts', 0)
+    now = _utc_now()
+    lease_expires_at = (now + datetime.timedelta(seconds=ACTION_LEASE_SECONDS)).isoformat()
+
+    if ACTION_CLAIMS_COLLECTION_ID:
+        try:
+            databases.create_document(
+                DB_ID, ACTION_CLAIMS_COLLECTION_ID, f"{action_id}_{attempts}",
+                data={"action_id": action_id, "lease_owner": lease_owner, "lease_expires_at": lease_expires_at}
+            )
+        except AppwriteException as e:
+            if e.code != 409:
+                raise
+            context.log(f"Action ID: {action_id} was already claimed at attempt {attempts}; skipping it.")
+            return False
+    else:
+        current = databases.get_document(DB_ID, SERVER_ACTIONS_COLLECTION_ID, action_id)
+        if current.get('status') != "pending" or current.get('$updatedAt') != action_doc.get('$updatedAt'):
+            context.log(f"Action ID: {action_id} changed since it was listed (now '{current.get('status')}'); skipping it.")
+            return False
+
+    databases.update_document(
+        DB_ID, SERVER_ACTIONS_COLLECTION_ID, action_id,
+        data={
+            "status": "processing", "attempts": attempts + 1, "last_attempt_at": now.isoformat(),
+            "lease_owner": lease_owner, "lease_expires_at": lease_expires_at,
+        }
+    )
+    if not ACTION_CLAIMS_COLLECTION_ID:
+        # The last writer wins; whoever reads back someone else's lease backs off.
+        current = databases.get_document(DB_ID, SERVER_ACTIONS_COLLECTION_ID, action_id)
+        if current.get('lease_owner') != lease_owner:
+            context.log(f"Action ID: {action_id} was claimed by {current.get('lease_owner')} at the same time; skipping it.")
+            return False
+    return True
+
+
+def _sweep_expired_leases(context, databases):
+    """
+    Releases processing actions whose lease has expired, left behind by runs that crashed or
+    timed out: they are retried with backoff like any failed attempt (see _fail_action). With ACTION_CLAIMS_COLLECTION_ID it
+    also deletes expired claim documents; a claim whose run died before marking the action
+    processing bumps the action's `attempts`, freeing the next claim ID.
+    Returns the number of actions released.
+    """
+    now = _utc_now().isoformat()
+    expired = databases.list_documents(
+        DB_ID, SERVER_ACTIONS_COLLECTION_ID,
+        queries=[Query.equal("status", "processing"), Query.less_than("lease_expires_at", now), Query.limit(MAX_LEASES_SWEPT_PER_RUN)]
+    )['documents']
+
+    released = 0
+    for action_doc in expired:
+        try:
+            # Only release the version that was listed; the owner may have finished in between.
+            current = databases.get_document(DB_ID, SERVER_ACTIONS_COLLECTION_ID, action_doc['$id'])
+            if current.get('$updatedAt') != action_doc.get('$updatedAt'):
+                continue
+            # The attempt that held the lease counts as failed, so an action that keeps crashing runs ends up dead-lettered.
+            _fail_action(context, databases, action_doc, action_doc.get('attempts', 0),
+                         f"Lease of {action_doc.get('lease_owner')} expired at {action_doc.get('lease_expires_at')}.")
+            released += 1
+            context.log(f"Action ID: {action_doc['$id']} released; the lease of {action_doc.get('lease_owner')} expired.")
+        except AppwriteException as e:
+            context.error(f"Failed to release expired lease of action {action_doc['$id']}: {e}")
+
+    if not ACTION_CLAIMS_COLLECTION_ID:
+        return released
+
+    expired_claims = databases.list_documents(
+        DB_ID, ACTION_CLAIMS_COLLECTION_ID,
+        queries=[Query.less_than("lease_expires_at", now), Query.limit(MAX_LEASES_SWEPT_PER_RUN)]
+    )['documents']
+    for claim in expired_claims:
+        try:
+            action_doc = databases.get_document(DB_ID, SERVER_ACTIONS_COLLECTION_ID, claim['action_id'])
+            if action_doc.get('status') == "pending" and claim['$id'] == f"{action_doc['$id']}_{action_doc.get('attempts', 0)}":
+                databases.update_document(
+                    DB_ID, SERVER_ACTIONS_COLLECTION_ID, action_doc['$id'],
+                    data={"attempts": action_doc.get('attempts', 0) + 1,
+                          "last_error": f"Claim by {claim.get('lease_owner')} was abandoned before processing started."}
+                )
+                context.log(f"Action ID: {action_doc['$id']} had an abandoned claim; it can be claimed again.")
+        except AppwriteException as e:
+            if e.code != 404:
+                context.error(f"Failed to check abandoned claim {claim['$id']}: {e}")
+                continue
+        try:
+            databases.delete_document(DB_ID, ACTION_CLAIMS_COLLECTION_ID, claim['$id'])
+        except AppwriteException as e:
+            if e.code != 404:
+                context.error(f"Failed to delete expired claim {claim['$id']}: {e}")
+    return released
+
+
+def _process_action(context, databases, action_doc, confirmation_batch, email_batch, job_cache=None, spans=NULL_SPANS, lease_owner=None):
+    """
+    Claims a single server action, runs it and records its outcome on the action document.
+    Returns "completed", "failed" (retry scheduled or dead-lettered, see _fail_action),
+    "batched" (a verification email queued for batch delivery, or CONFIRM_EMPLOYMENT
+    deferred to the Merkle batch), or "skipped" when this worker did not claim the action.
+    """
+    action_id = action_doc['$id']
+    action_type = action_doc.get('action_type')
+    payload_str = action_doc.get('payload')
+    current_attempts = action_doc.get('attempts', 0)
+    action_result_details_str = None 
+
+    context.log(f"Processing action ID: {action_id}, Type: {action_type}, Attempts: {current_attempts}")
+
+    # Outside the try below: only an action this worker holds may be failed.
+    with spans.span("claim"):
+        if not _claim_action(context, databases, action_doc, lease_owner):
+            return "skipped"
+
+    try:
+        # Configuration was checked before claiming (see _action_config_error).
+        if action_type == ACTION_TYPE_SEND_VERIFICATION_EMAIL:
+            job_history_id = _payload_job_history_id(action_type, payload_str)
+            with spans.span("build_email"):
+                message = _build_verification_email(context, databases, job_history_id, job_cache)
+            email_batch.append({"action_id": action_id, "action_doc": action_doc, "job_history_id": job_history_id, "message": message})
+            context.log(f"Action ID: {action_id} (SEND_VERIFICATION_EMAIL) queued for batch delivery.")
+            return "batched"
+
+        elif action_type == ACTION_TYPE_CONFIRM_EMPLOYMENT:
+            if ANCHOR_BATCH_MODE == "merkle":
+                with spans.span("confirmation_hash"):
+                    confirmation_batch.append({**_prepare_batched_confirmation(context, databases, action_id, payload_str, job_cache), "action_doc": action_doc})
+                context.log(f"Action ID: {action_id} (CONFIRM_EMPLOYMENT) queued for batched anchoring.")
+                return "batched"
+
+            confirmation_details = _handle_confirm_employment(context, databases, payload_str, job_cache, spans)
+            action_result_details_str = f"Employment confirmed. TxHash: {confirmation_details.get('tx_hash')}, BlockHash: {confirmation_details.get('block_hash')}"
+            context.log(f"Action ID: {action_id} (CONFIRM_EMPLOYMENT) result: {action_result_details_str}")
+
+        else:
+            raise PermanentActionError(f"Unknown action_type: '{action_type}' for action ID: {action_id}")
+
+        with spans.span("mark_completed"):
+            databases.update_document(
+                DB_ID, SERVER_ACTIONS_COLLECTION_ID, action_id,
+                data={"status": "completed", "last_error": None, "action_result_details": action_result_details_str}
+            )
+        context.log(f"Action ID: {action_id} completed. Details: {action_result_details_str}")
+        return "completed"
+
+    except (PermanentActionError, AppwriteException, ValueError, RuntimeError, FileNotFoundError) as e:
+        resend = sys.modules.get("resend")
+        resend_error_type = getattr(resend.exceptions, 'ResendError', None) if resend and RESEND_API_KEY else None
+        if resend_error_type and isinstance(e, resend_error_type):
+            error_message = f"Resend API error processing action {action_id} ({action_type}): {str(e)}. Type: {type(e).__name__}"
+        else:
+            error_message = f"Error processing action {action_id} ({action_type}): {str(e)}. Type: {type(e).__name__}"
+
+        context.error(error_message)
+        context.error(traceback.format_exc())
+        # Only a malformed action is dead-lettered at once; anything else, a configuration
+        # mistake included, is retried until its policy's attempts run out.
+        _fail_action(context, databases, action_doc, current_attempts + 1, error_message, permanent=isinstance(e, PermanentActionError))
+        return "failed"
+    except Exception as e:
+        error_message = f"Unexpected error processing action {action_id} ({action_type}): {str(e)}. Type: {type(e).__name__}"
+        context.error(error_message)
+        context.error(traceback.format_exc())
+        _fail_action(context, databases, action_doc, current_attempts + 1, error_message)
+        return "failed"
+
+
+def _run_actions(context, databases, pending_actions, confirmation_batch, email_batch, job_cache=None, spans=NULL_SPANS, lease_owner=None):
+    """
+    Processes the actions concurrently. Each action type gets its own thread pool, sized to
+    its concurrency limit, so a slow chain write never holds a thread that an email send
+    could use, and chain writes stay capped.
+    Returns one {"action_id", "action_type", "status", "latency_ms"} entry per action, in order.
+    """
+    def run(action_doc):
+        started = time.perf_counter()
+        status = _process_action(context, databases, action_doc, confirmation_batch, email_batch, job_cache, spans, lease_owner)
+        if status != "skipped":
+            timings.record(action_doc.get('action_type'), time.perf_counter() - started)
+            queue_metrics.observe("server_action_duration_seconds", time.perf_counter() - started, action_type=action_doc.get('action_type'))
+        if status not in ("batched", "skipped"):
+            queue_metrics.inc("server_actions_total", action_type=action_doc.get('action_type'), status=status)
+        return {
+            "action_id": action_doc['$id'],
+            "action_type": action_doc.get('action_type'),
+            "status": status,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    by_type = {}
+    for action_doc in pending_actions:
+        by_type.setdefault(action_doc.get('action_type'), []).append(action_doc)
+
+    executors = {
+        action_type: ThreadPoolExecutor(max_workers=min(len(docs), ACTION_CONCURRENCY.get(action_type, 1)),
+                                        thread_name_prefix=f"actions-{action_type}")
+        for action_type, docs in by_type.items()
+    }
+    try:
+        futures = [executors[action_doc.get('action_type')].submit(run, action_doc) for action_doc in pending_actions]
+        return [future.result() for future in futures]
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+
+
 def main(context):
     try:
         validate_env_vars(context)
@@ -343,122 +1028,157 @@ def main(context):
     client.set_key(APPWRITE_API_KEY)
     databases = Databases(client)
 
-    if RESEND_API_KEY: 
-        resend.api_key = RESEND_API_KEY
+    if context.req.method == "GET" and (context.req.path or "").rstrip("/").endswith("/metrics"):
+        try:
+            return _metrics_response(context, databases)
+        except AppwriteException as e:
+            context.error(f"Appwrite error reading queue metrics: {repr(e)}")
+            return context.res.text(f"Appwrite error: {e.message}\n", 500)
 
     context.log("Cron job started: Looking for pending server actions.")
 
     processed_count = 0
     failed_count = 0
+    confirmation_batch = []
+    email_batch = []
+    spans = Spans()
+    lease_owner = f"{WORKER_ID}/{uuid.uuid4().hex[:12]}"
+
+    run_started = time.perf_counter()
+    run_outcome = "failure"
+    action_deadline = run_started + RUN_TIME_BUDGET_SECONDS
+    # Work that happens after the drain loop still has to fit in the budget.
+    action_deadline -= timings.estimate(EMAIL_BATCH_TIMING_KEY)
+    if ANCHOR_BATCH_MODE == "merkle":
+        action_deadline -= timings.estimate(ANCHOR_BATCH_TIMING_KEY)
+    if CHAIN_SUBMISSIONS_COLLECTION_ID:
+        action_deadline -= FINALITY_TRACKER_BUDGET_SECONDS
 
     try:
-        pending_actions_response = databases.list_documents(
-            DB_ID, SERVER_ACTIONS_COLLECTION_ID,
-            queries=[Query.equal("status", "pending"), Query.order_asc("$createdAt"), Query.limit(MAX_TASKS_PER_RUN)]
-        )
-        pending_actions = pending_actions_response['documents']
+        with spans.span("sweep_leases"):
+            released_count = _sweep_expired_leases(context, databases)
+        if released_count:
+            queue_metrics.inc("server_action_leases_expired_total", released_count)
 
-        if not pending_actions:
-            context.log("No pending server actions found.")
-            return context.res.json({"status": "success", "message": "No pending actions to process."})
+        action_results = []
+        seen_action_ids = set()
+        config_errors = {}
+        pages = 0
+        cursor = None
 
-        context.log(f"Found {len(pending_actions)} pending action(s) to process.")
+        while True:
+            remaining = action_deadline - time.perf_counter()
+            if remaining <= 0:
+                break
 
-        for action_doc in pending_actions:
-            action_id = action_doc['$id']
-            action_type = action_doc.get('action_type')
-            payload_str = action_doc.get('payload')
-            current_attempts = action_doc.get('attempts', 0)
-            action_result_details_str = None 
+            with spans.span("list_pending"):
+                pending_actions_response = databases.list_documents(
+                    DB_ID, SERVER_ACTIONS_COLLECTION_ID,
+                    queries=[
+                        Query.equal("status", "pending"),
+                        # Retries wait for their backoff; new actions have no next_attempt_at.
+                        Query.or_queries([Query.is_null("next_attempt_at"), Query.less_than_equal("next_attempt_at", _utc_now().isoformat())]),
+                        Query.order_asc("$createdAt"), Query.limit(ACTIONS_PAGE_SIZE),
+                    ] + ([Query.cursor_after(cursor)] if cursor else [])
+                )
+            listed = pending_actions_response['documents']
+            if cursor is None:
+                _record_backlog(pending_actions_response)
+            if not listed:
+                break
+            # Later pages start after this one, so actions deferred here never hide the ones behind them.
+            cursor = listed[-1]['$id']
+            # Actions whose status update failed come back as pending; never run them twice in one run.
+            pending_actions = [a for a in listed if a['$id'] not in seen_action_ids]
+            seen_action_ids.update(a['$id'] for a in pending_actions)
 
-            context.log(f"Processing action ID: {action_id}, Type: {action_type}, Attempts: {current_attempts}")
+            for action_type in {a.get('action_type') for a in pending_actions} - config_errors.keys():
+                config_errors[action_type] = _action_config_error(action_type)
+                if config_errors[action_type]:
+                    context.error(f"Leaving {action_type} actions pending: {config_errors[action_type]}")
+            blocked = [a for a in pending_actions if config_errors[a.get('action_type')]]
+            if blocked:
+                # Never claimed, so they cost no attempt and run once the configuration is fixed.
+                queue_metrics.inc("server_actions_blocked_by_config_total", len(blocked))
+                pending_actions = [a for a in pending_actions if not config_errors[a.get('action_type')]]
 
-            try:
-                databases.update_document(
-                    DB_ID, SERVER_ACTIONS_COLLECTION_ID, action_id,
-                    data={
-                        "status": "processing", "attempts": current_attempts + 1,
-                        "last_attempt_at": datetime.datetime.now(datetime.timezone.utc).isoformat()
-                    }
-                )
+            admitted, deferred = plan_page(pending_actions, remaining, ACTION_CONCURRENCY)
+            if deferred:
+                queue_metrics.inc("server_actions_deferred_total", len(deferred))
+                context.log(f"Deferring {len(deferred)} action(s) to the next run; {remaining:.1f}s of the run budget left.")
 
-                if action_type == ACTION_TYPE_SEND_VERIFICATION_EMAIL:
-                    if not RESEND_API_KEY:
-                        raise ValueError("RESEND_API_KEY not configured.")
-                    if not payload_str: raise ValueError("Payload missing for SEND_VERIFICATION_EMAIL.")
-                    payload = json.loads(payload_str)
-                    job_history_id = payload.get("job_history_id")
-                    if not job_history_id: raise ValueError("'job_history_id' missing in payload.")
-                    _send_verification_email(context, databases, job_history_id)
-                    action_result_details_str = "Email sent successfully."
-
-                elif action_type == ACTION_TYPE_CONFIRM_EMPLOYMENT:
-                    if not POLKADOT_LIBS_AVAILABLE:
-                         raise RuntimeError("Polkadot libraries not available for CONFIRM_EMPLOYMENT.")
-                    if not all([POLKADOT_CONTRACT_ADDRESS, POLKADOT_SUBSTRATE_URL, ENV]):
-                        raise ValueError("Polkadot config (CONTRACT_ADDRESS, SUBSTRATE_URL, ENV) incomplete.")
-                    if ENV == 'local' and not POLKADOT_KEYPAIR_ACCOUNT:
-                        raise ValueError("POLKADOT_KEYPAIR_ACCOUNT required for ENV=local.")
-                    if ENV in ['dev', 'prod'] and not POLKADOT_KEYPAIR_MNEMONIC:
-                        raise ValueError(f"POLKADOT_KEYPAIR_MNEMONIC required for ENV={ENV}.")
-                    if ENV not in ['local', 'dev', 'prod']:
-                        raise ValueError(f"Invalid ENV value '{ENV}'.")
-                    if not payload_str: raise ValueError("Payload missing for CONFIRM_EMPLOYMENT.")
-                    
-                    confirmation_details = _handle_confirm_employment(context, databases, payload_str)
-                    action_result_details_str = f"Employment confirmed. TxHash: {confirmation_details.get('tx_hash')}, BlockHash: {confirmation_details.get('block_hash')}"
-                    context.log(f"Action ID: {action_id} (CONFIRM_EMPLOYMENT) result: {action_result_details_str}")
-
-                else:
-                    raise ValueError(f"Unknown action_type: '{action_type}' for action ID: {action_id}")
+            if admitted:
+                pages += 1
+                context.log(f"Processing page {pages}: {len(admitted)} pending action(s).")
+                with spans.span("prefetch_job_histories"):
+                    job_cache = _prefetch_job_histories(context, databases, admitted)
+                action_results.extend(_run_actions(context, databases, admitted, confirmation_batch, email_batch, job_cache, spans, lease_owner))
+            elif remaining < min(timings.estimate(t) for t in {a.get('action_type') for a in pending_actions} | set(ACTION_CONCURRENCY)):
+                # Not even the quickest action type fits in what is left; later pages cannot either.
+                break
 
-                databases.update_document(
-                    DB_ID, SERVER_ACTIONS_COLLECTION_ID, action_id,
-                    data={"status": "completed", "last_error": None, "action_result_details": action_result_details_str}
-                )
-                context.log(f"Action ID: {action_id} completed. Details: {action_result_details_str}")
-                processed_count += 1
-
-            except (AppwriteException, json.JSONDecodeError, ValueError, RuntimeError, FileNotFoundError) as e:
-                resend_error_type = getattr(resend.exceptions, 'ResendError', None) if 'resend' in globals() and RESEND_API_KEY else None
-                if resend_error_type and isinstance(e, resend_error_type):
-                    error_message = f"Resend API error processing action {action_id} ({action_type}): {str(e)}. Type: {type(e).__name__}"
-                else:
-                    error_message = f"Error processing action {action_id} ({action_type}): {str(e)}. Type: {type(e).__name__}"
-                
-                context.error(error_message)
-                context.error(traceback.format_exc())
-                failed_count += 1
-                try:
-                    databases.update_document(
-                        DB_ID, SERVER_ACTIONS_COLLECTION_ID, action_id,
-                        data={ "status": "failed", "last_error": error_message[:2048] } 
-                    )
-                except AppwriteException as db_update_err:
-                    context.error(f"CRITICAL: Failed to update action {action_id} status to 'failed': {db_update_err}")
-            except Exception as e: 
-                error_message = f"Unexpected error processing action {action_id} ({action_type}): {str(e)}. Type: {type(e).__name__}"
-                context.error(error_message)
-                context.error(traceback.format_exc())
-                failed_count += 1
-                try:
-                    databases.update_document(
-                        DB_ID, SERVER_ACTIONS_COLLECTION_ID, action_id,
-                        data={ "status": "failed", "last_error": error_message[:2048] }
-                    )
-                except AppwriteException as db_update_err:
-                     context.error(f"CRITICAL: Failed to update action {action_id} status to 'failed': {db_update_err}")
-
-        summary_message = f"Cron job finished. Processed: {processed_count}, Failed: {failed_count}."
+            if len(listed) < ACTIONS_PAGE_SIZE:
+                break
+
+        if not action_results:
+            context.log("No pending server actions found.")
+            with spans.span("reconcile"):
+                reconciled_count = _reconcile_chain_submissions(context, databases)
+            run_outcome = "success"
+            return context.res.json({
+                "status": "success", "message": "No pending actions to process.", "reconciled": reconciled_count,
+                "timings": spans.report(context, processed=0, failed=0),
+            })
+
+        processed_count += sum(1 for r in action_results if r["status"] == "completed")
+        failed_count += sum(1 for r in action_results if r["status"] == "failed")
+
+        if email_batch:
+            delivery_started = time.perf_counter()
+            with spans.span("email_delivery"):
+                batch_processed, batch_failed = _deliver_email_batch(context, databases, email_batch)
+            queue_metrics.inc("server_actions_total", batch_processed, action_type=ACTION_TYPE_SEND_VERIFICATION_EMAIL, status="completed")
+            queue_metrics.inc("server_actions_total", batch_failed, action_type=ACTION_TYPE_SEND_VERIFICATION_EMAIL, status="failed")
+            timings.record(EMAIL_BATCH_TIMING_KEY, time.perf_counter() - delivery_started)
+            processed_count += batch_processed
+            failed_count += batch_failed
+
+        if confirmation_batch:
+            anchor_started = time.perf_counter()
+            with spans.span("anchor_batch"):
+                batch_processed, batch_failed = _anchor_confirmation_batch(context, databases, confirmation_batch, spans)
+            queue_metrics.inc("server_actions_total", batch_processed, action_type=ACTION_TYPE_CONFIRM_EMPLOYMENT, status="completed")
+            queue_metrics.inc("server_actions_total", batch_failed, action_type=ACTION_TYPE_CONFIRM_EMPLOYMENT, status="failed")
+            timings.record(ANCHOR_BATCH_TIMING_KEY, time.perf_counter() - anchor_started)
+            processed_count += batch_processed
+            failed_count += batch_failed
+
+        with spans.span("reconcile"):
+            reconciled_count = _reconcile_chain_submissions(context, databases)
+
+        wall_time_ms = round((time.perf_counter() - run_started) * 1000, 1)
+        summary_message = f"Cron job finished. Processed: {processed_count}, Failed: {failed_count}, Reconciled: {reconciled_count}, Pages: {pages}, Wall time: {wall_time_ms}ms."
         context.log(summary_message)
-        return context.res.json({"status": "success", "message": summary_message, "processed": processed_count, "failed": failed_count})
+        for r in action_results:
+            context.log(f"Action ID: {r['action_id']} ({r['action_type']}) {r['status']} in {r['latency_ms']}ms.")
+        run_outcome = "success"
+        return context.res.json({
+            "status": "success", "message": summary_message, "processed": processed_count, "failed": failed_count,
+            "reconciled": reconciled_count, "pages": pages, "wall_time_ms": wall_time_ms, "actions": action_results,
+            "timings": spans.report(context, processed=processed_count, failed=failed_count),
+        })
 
     except AppwriteException as e:
         context.error(f"Appwrite error during cron job execution: {repr(e)}")
         context.error(traceback.format_exc())
-        return context.res.json({"status": "failure", "message": f"Appwrite error: {e.message}"}, 500)
+        return context.res.json({"status": "failure", "message": f"Appwrite error: {e.message}", "timings": spans.report(context)}, 500)
     except Exception as e:
         context.error(f"An unexpected error occurred in cron job: {str(e)}")
         context.error(traceback.format_exc())
-        return context.res.json({"status": "failure", "message": f"An unexpected server error occurred: {str(e)}"}, 500)
+        return context.res.json({"status": "failure", "message": f"An unexpected server error occurred: {str(e)}", "timings": spans.report(context)}, 500)
+    finally:
+        queue_metrics.inc("cron_runs_total", outcome=run_outcome)
+        queue_metrics.observe("cron_run_duration_seconds", time.perf_counter() - run_started)
+        queue_metrics.set("cron_last_run_timestamp_seconds", round(time.time(), 3))
+        _publish_metrics(context, databases)
 
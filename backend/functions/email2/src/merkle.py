@@ -0,0 +1,80 @@
+"""
+Binary SHA-256 Merkle trees for anchoring many resume hashes with one extrinsic.
+
+Leaves and interior nodes are hashed with distinct one-byte prefixes so a leaf can
+never be passed off as an interior node. A node without a sibling is carried up to
+the next level unchanged instead of being paired with itself.
+
+Proofs are lists of "L:<hex>" / "R:<hex>" strings, naming the side of the running
+hash on which each sibling is concatenated, so they can be stored as-is in a
+document attribute.
+"""
+import hashlib
+
+
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+
+def hash_leaf(data):
+    return hashlib.sha256(LEAF_PREFIX + data).digest()
+
+
+def hash_node(left, right):
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+class MerkleTree:
+    def __init__(self, leaves):
+        """`leaves` are the raw 32-byte resume hashes, in leaf-index order."""
+        if not leaves:
+            raise ValueError("A Merkle tree needs at least one leaf.")
+
+        self.levels = [[hash_leaf(leaf) for leaf in leaves]]
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            parents = [hash_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+            if len(level) % 2:
+                parents.append(level[-1])
+            self.levels.append(parents)
+
+    @property
+    def root(self):
+        return self.levels[-1][0]
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    def proof(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError(f"Leaf index {index} out of range for {len(self)} leaves.")
+
+        proof = []
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            if sibling < len(level):
+                side = 'L' if sibling < index else 'R'
+                proof.append(f"{side}:{level[sibling].hex()}")
+            index //= 2
+        return proof
+
+
+def verify_proof(leaf, proof, root):
+    """
+    Checks that the raw resume hash `leaf` is included under the anchored `root`.
+    `root` may be bytes or a hex string (with or without 0x).
+    """
+    if isinstance(root, str):
+        root = bytes.fromhex(root[2:] if root.startswith('0x') else root)
+
+    node = hash_leaf(leaf)
+    for step in proof:
+        side, _, sibling_hex = step.partition(':')
+        sibling = bytes.fromhex(sibling_hex)
+        if side == 'L':
+            node = hash_node(sibling, node)
+        elif side == 'R':
+            node = hash_node(node, sibling)
+        else:
+            raise ValueError(f"Malformed proof step: {step!r}")
+    return node == root
@@ -0,0 +1,152 @@
+"""
+Queue-health metrics for the server_actions cron.
+
+Like the run-time estimates in scheduling.py, metrics are collected at module level
+while a run executes; at the end of the run the collected deltas are drained and
+merged into the cumulative state held in the metrics document (see main.py). Counters
+and histograms add up across runs, gauges keep the latest value. State is a plain
+JSON-able dict keyed by Prometheus series names, e.g.
+
+    {"counters": {'server_actions_total{action_type="CONFIRM_EMPLOYMENT",status="completed"}':
+                  {"name": ..., "labels": {...}, "value": 12}},
+     "histograms": {...: {"name": ..., "labels": {...}, "bounds": [...], "buckets": [...], "sum": 3.2, "count": 12}},
+     "gauges": {...: {"name": ..., "labels": {...}, "value": 40}}}
+
+and to_prometheus renders it in the Prometheus text exposition format.
+"""
+import bisect
+import math
+import threading
+
+
+# Upper bounds in seconds: an email send takes well under a second, a chain write a block or two.
+LATENCY_BUCKETS_SECONDS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    "server_actions_total": "Server actions finished by the cron, by action type and final status.",
+    "server_actions_deferred_total": "Pending actions left for a later run because the run budget was used up.",
+    "server_action_claim_conflicts_total": "Listed actions skipped because another worker claimed them first.",
+    "server_actions_blocked_by_config_total": "Listed actions left pending because their type is misconfigured on this deploy.",
+    "server_action_claim_errors_total": "Listed actions skipped because claiming them failed; they stay for a later run.",
+    "server_action_leases_expired_total": "Processing actions released after their lease expired.",
+    "server_action_retries_scheduled_total": "Failed attempts put back to pending with a backoff next_attempt_at.",
+    "server_actions_dead_lettered_total": "Actions moved to dead_letter after a permanent error or their last attempt.",
+    "server_action_duration_seconds": "Time to process one server action, excluding batched delivery.",
+    "chain_write_duration_seconds": "Time from acquiring a connection to the included contract call.",
+    "cron_runs_total": "Cron runs, by outcome.",
+    "cron_run_duration_seconds": "Wall time of one cron run.",
+    "server_actions_backlog": "Pending server actions due at the start of the latest run.",
+    "server_actions_oldest_pending_age_seconds": "Age of the oldest due pending server action at the start of the latest run.",
+    "cron_last_run_timestamp_seconds": "Unix time the latest run finished.",
+}
+PROMETHEUS_TYPES = {"counters": "counter", "histograms": "histogram", "gauges": "gauge"}
+
+
+def _series(name, labels, le=None):
+    pairs = sorted(labels.items()) + ([("le", le)] if le is not None else [])
+    if not pairs:
+        return name
+    return name + "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def empty_state():
+    return {"counters": {}, "histograms": {}, "gauges": {}}
+
+
+class QueueMetrics:
+    """Counters, latency histograms and gauges recorded during a run; safe to use from the action threads."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_SECONDS):
+        self.buckets = tuple(buckets)
+        self._state = empty_state()
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = _series(name, labels)
+        with self._lock:
+            entry = self._state["counters"].setdefault(key, {"name": name, "labels": labels, "value": 0})
+            entry["value"] += value
+
+    def observe(self, name, seconds, **labels):
+        key = _series(name, labels)
+        with self._lock:
+            entry = self._state["histograms"].get(key)
+            if entry is None:
+                entry = self._state["histograms"][key] = {
+                    "name": name, "labels": labels, "bounds": list(self.buckets),
+                    "buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0,
+                }
+            # buckets[i] counts observations in (bounds[i-1], bounds[i]]; the last one is +Inf.
+            entry["buckets"][bisect.bisect_left(self.buckets, seconds)] += 1
+            entry["sum"] += seconds
+            entry["count"] += 1
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._state["gauges"][_series(name, labels)] = {"name": name, "labels": labels, "value": value}
+
+    def drain(self):
+        """Returns everything recorded since the last drain and starts over."""
+        with self._lock:
+            state, self._state = self._state, empty_state()
+        return state
+
+
+def merge(state, delta):
+    """Adds `delta` (from QueueMetrics.drain) into the cumulative `state` in place and returns it."""
+    for kind in ("counters", "histograms", "gauges"):
+        state.setdefault(kind, {})
+    for key, entry in delta["counters"].items():
+        state["counters"].setdefault(key, {**entry, "value": 0})["value"] += entry["value"]
+    for key, entry in delta["histograms"].items():
+        current = state["histograms"].get(key)
+        if current is None or current.get("bounds") != entry["bounds"]:
+            # New series, or the buckets changed: the old counts cannot be combined, so restart it.
+            state["histograms"][key] = {**entry, "buckets": list(entry["buckets"])}
+            continue
+        current["buckets"] = [a + b for a, b in zip(current["buckets"], entry["buckets"])]
+        current["sum"] += entry["sum"]
+        current["count"] += entry["count"]
+    state["gauges"].update(delta["gauges"])
+    return state
+
+
+def _number(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def to_prometheus(state):
+    """Renders a metrics state in the Prometheus text exposition format (version 0.0.4)."""
+    by_name = {}
+    for kind in ("counters", "histograms", "gauges"):
+        for key in sorted(state.get(kind, {})):
+            entry = state[kind][key]
+            by_name.setdefault(entry["name"], []).append((kind, entry))
+
+    lines = []
+    for name in sorted(by_name):
+        if name in HELP:
+            lines.append(f"# HELP {name} {HELP[name]}")
+        lines.append(f"# TYPE {name} {PROMETHEUS_TYPES[by_name[name][0][0]]}")
+        for kind, entry in by_name[name]:
+            if kind != "histograms":
+                lines.append(f"{_series(name, entry['labels'])} {_number(entry['value'])}")
+                continue
+            cumulative = 0
+            for bound, count in zip(entry["bounds"] + [math.inf], entry["buckets"]):
+                cumulative += count
+                lines.append(f"{_series(name + '_bucket', entry['labels'], le=_number(float(bound)))} {cumulative}")
+            lines.append(f"{_series(name + '_sum', entry['labels'])} {_number(float(entry['sum']))}")
+            lines.append(f"{_series(name + '_count', entry['labels'])} {entry['count']}")
+    return "\n".join(lines) + "\n"
+
+
+queue_metrics = QueueMetrics()
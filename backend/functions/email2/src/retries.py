@@ -0,0 +1,113 @@
+"""
+Retry scheduling for failed server actions.
+
+A failed attempt puts the action back to pending with `next_attempt_at` set by its
+type's RetryPolicy: exponential backoff with jitter, so transient Resend or RPC errors
+are retried without a run hot-looping on them, and actions that failed together do
+not all come due in the same run. The pending query skips actions that are not due
+yet. Once an action has used its attempts, or fails with a PermanentActionError,
+it moves to DEAD_LETTER_STATUS. Every failed attempt is appended to the action's
+`error_history`, a JSON list of {"attempt", "at", "error"}.
+"""
+import datetime
+import json
+import os
+import random
+from dataclasses import dataclass
+
+
+DEAD_LETTER_STATUS = "dead_letter"
+# Each error is cut to this length in error_history; last_error keeps the Appwrite attribute size.
+MAX_HISTORY_ERROR_LENGTH = 512
+MAX_LAST_ERROR_LENGTH = 2048
+
+
+class PermanentActionError(Exception):
+    """The action's payload or the data it refers to is malformed or missing; retrying cannot fix it."""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int
+    base_delay_seconds: float
+    max_delay_seconds: float
+
+    def backoff_seconds(self, attempt, rng=random):
+        """
+        Delay before the attempt after `attempt` (1-based): base * 2^(attempt - 1), capped,
+        of which the upper half is random ("equal jitter"), so a retry is never immediate.
+        """
+        ceiling = min(self.max_delay_seconds, self.base_delay_seconds * 2 ** max(attempt - 1, 0))
+        return ceiling / 2 + rng.uniform(0, ceiling / 2)
+
+
+# Emails are cheap to retry and Resend outages are short; a chain write may wait out a node
+# restart or a congested pool, so it gets more attempts at a shorter base delay.
+DEFAULT_POLICIES = {
+    "SEND_VERIFICATION_EMAIL": RetryPolicy(max_attempts=5, base_delay_seconds=60, max_delay_seconds=3600),
+    "CONFIRM_EMPLOYMENT": RetryPolicy(max_attempts=8, base_delay_seconds=30, max_delay_seconds=1800),
+}
+FALLBACK_POLICY = RetryPolicy(max_attempts=3, base_delay_seconds=60, max_delay_seconds=3600)
+
+
+# Malformed RETRY_POLICY_* values found at import; email2 logs them as warnings on every run.
+policy_warnings = []
+
+
+def _policy_from_env(action_type, default):
+    """
+    RETRY_POLICY_<ACTION_TYPE>="max_attempts,base_delay_seconds,max_delay_seconds" overrides a default.
+    A malformed value keeps the default and is recorded in policy_warnings, so a bad deploy
+    never stops the module from importing.
+    """
+    name = f"RETRY_POLICY_{action_type}"
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        max_attempts, base_delay, max_delay = (part.strip() for part in value.split(","))
+        policy = RetryPolicy(int(max_attempts), float(base_delay), float(max_delay))
+    except ValueError:
+        policy = None
+    if policy is None or policy.max_attempts < 1 or not 0 <= policy.base_delay_seconds <= policy.max_delay_seconds:
+        policy_warnings.append(f"Ignoring {name}={value!r}: expected \"max_attempts,base_delay_seconds,max_delay_seconds\"; using {default}.")
+        return default
+    return policy
+
+
+policies = {action_type: _policy_from_env(action_type, policy) for action_type, policy in DEFAULT_POLICIES.items()}
+
+
+def policy_for(action_type):
+    return policies.get(action_type, FALLBACK_POLICY)
+
+
+def _history(error_history):
+    if not error_history:
+        return []
+    try:
+        history = json.loads(error_history)
+    except ValueError:
+        # Not written by us; keep it rather than losing it.
+        return [{"attempt": None, "at": None, "error": str(error_history)[:MAX_HISTORY_ERROR_LENGTH]}]
+    return history if isinstance(history, list) else []
+
+
+def failure_update(action_type, attempt, error_history, error_message, permanent=False, now=None, rng=random):
+    """
+    The action document fields recording failed attempt number `attempt`: back to pending
+    with `next_attempt_at`, or DEAD_LETTER_STATUS when `permanent` or the policy's attempts
+    are used up. `error_history` is the document's current value.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    policy = policy_for(action_type)
+    history = _history(error_history)
+    history.append({"attempt": attempt, "at": now.isoformat(), "error": error_message[:MAX_HISTORY_ERROR_LENGTH]})
+
+    data = {"last_error": error_message[:MAX_LAST_ERROR_LENGTH], "error_history": json.dumps(history)}
+    if permanent or attempt >= policy.max_attempts:
+        data.update(status=DEAD_LETTER_STATUS, next_attempt_at=None)
+    else:
+        next_attempt_at = now + datetime.timedelta(seconds=policy.backoff_seconds(attempt, rng))
+        data.update(status="pending", next_attempt_at=next_attempt_at.isoformat())
+    return data
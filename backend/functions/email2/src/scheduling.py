@@ -0,0 +1,66 @@
+"""
+Run-time budgeting for the server_actions cron.
+
+Timings are kept at module level, so a warm runtime starts each run with the
+latencies it observed in earlier runs instead of the conservative defaults.
+"""
+import collections
+import math
+import threading
+
+
+# Used until an action type has been observed in this process.
+DEFAULT_ESTIMATES_SECONDS = {
+    "SEND_VERIFICATION_EMAIL": 1.0,
+    "CONFIRM_EMPLOYMENT": 8.0,
+    # Once-per-run batch work, timed as a whole.
+    "SEND_VERIFICATION_EMAIL_BATCH": 2.0,
+    "CONFIRM_EMPLOYMENT_BATCH": 8.0,
+}
+FALLBACK_ESTIMATE_SECONDS = 5.0
+SAMPLES_PER_TYPE = 20
+
+
+class ActionTimings:
+    """Recent per-action-type latencies; an estimate is the slowest of the recent samples."""
+
+    def __init__(self, defaults=DEFAULT_ESTIMATES_SECONDS, samples_per_type=SAMPLES_PER_TYPE):
+        self.defaults = dict(defaults)
+        self._samples = collections.defaultdict(lambda: collections.deque(maxlen=samples_per_type))
+        self._lock = threading.Lock()
+
+    def record(self, action_type, seconds):
+        with self._lock:
+            self._samples[action_type].append(seconds)
+
+    def estimate(self, action_type):
+        with self._lock:
+            samples = self._samples.get(action_type)
+            if samples:
+                return max(samples)
+        return self.defaults.get(action_type, FALLBACK_ESTIMATE_SECONDS)
+
+
+timings = ActionTimings()
+
+
+def plan_page(actions, remaining_seconds, concurrency, timings=timings):
+    """
+    Picks, in queue order, the actions of one page that are expected to finish within
+    `remaining_seconds` when each type runs `concurrency[type]` at a time. Returns
+    (admitted, deferred); deferred actions stay pending for the next run.
+    """
+    admitted, deferred = [], []
+    per_type = collections.Counter()
+
+    for action_doc in actions:
+        action_type = action_doc.get("action_type")
+        lanes = concurrency.get(action_type, 1)
+        rounds = math.ceil((per_type[action_type] + 1) / lanes)
+        if rounds * timings.estimate(action_type) <= remaining_seconds:
+            per_type[action_type] += 1
+            admitted.append(action_doc)
+        else:
+            deferred.append(action_doc)
+
+    return admitted, deferred
@@ -0,0 +1,1017 @@
+"""
+Shared Substrate helpers for the ZeroID functions.
+
+Appwrite keeps a function's Python process warm between executions, so state held
+at module level here (open websocket connections, caches) is reused by every
+invocation that lands on the same runtime.
+"""
+import contextlib
+import copy
+import hashlib
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from dataclasses import dataclass, asdict
+
+from scalecodec.base import ScaleBytes
+from substrateinterface import ContractInstance, ExtrinsicReceipt, Keypair, SubstrateInterface
+from substrateinterface.contracts import ContractExecutionReceipt, ContractMetadata
+from substrateinterface.exceptions import ContractReadFailedException
+from substrateinterface.exceptions import SubstrateRequestException
+from websocket import WebSocketException
+
+
+TYPE_REGISTRY_PRESET = 'substrate-node-template'
+
+POOL_MAX_SIZE = int(os.getenv('POLKADOT_POOL_MAX_SIZE', '4'))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv('POLKADOT_POOL_ACQUIRE_TIMEOUT', '10'))
+METADATA_CACHE_DIR = os.getenv('POLKADOT_METADATA_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'zeroid-metadata')
+# Submit-only extrinsics are mortal, so one that is not included within this many blocks is known to be dropped.
+SUBMIT_ERA_PERIOD = int(os.getenv('POLKADOT_SUBMIT_ERA_PERIOD', '64'))
+
+# How long a fetched chain head is trusted before contract reads ask the node for it again.
+READ_HEAD_TTL = float(os.getenv('POLKADOT_READ_HEAD_TTL', '1'))
+READ_CACHE_MAX_ENTRIES = int(os.getenv('POLKADOT_READ_CACHE_MAX_ENTRIES', '1024'))
+
+# How long a dry-run gas and storage-deposit estimate is reused before the next call re-estimates
+# (0 dry-runs every call), and the factor applied to it so small variations between calls still fit.
+GAS_ESTIMATE_TTL = float(os.getenv('POLKADOT_GAS_ESTIMATE_TTL', '600'))
+GAS_ESTIMATE_MARGIN = float(os.getenv('POLKADOT_GAS_ESTIMATE_MARGIN', '1.2'))
+# Dispatch errors of a call whose limits were too tight; the estimate is dropped and made again.
+ESTIMATE_ERRORS = ('OutOfGas', 'StorageDepositLimitExhausted')
+
+# Errors after which a connection can no longer be trusted and is dropped from the pool.
+CONNECTION_ERRORS = (ConnectionError, OSError, WebSocketException)
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+def _span(spans, name):
+    """`spans.span(name)` for the caller's optional spans.Spans; a no-op context manager without one."""
+    return spans.span(name) if spans is not None else _NO_SPAN
+
+
+@dataclass
+class MetadataCacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    stores: int = 0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+class RuntimeMetadataCache:
+    """
+    Runtime metadata cache keyed by (genesis hash, spec_version).
+
+    Raw SCALE metadata is persisted under `directory` so a cold runtime never has to
+    download it again, and decoded metadata is shared between every connection of
+    the process so it is decoded at most once per runtime version. Entries for older
+    spec versions of a chain are pruned when a runtime upgrade is stored.
+    """
+
+    def __init__(self, directory=METADATA_CACHE_DIR):
+        self.directory = directory
+        self.stats = MetadataCacheStats()
+        self._decoded = {}
+        self._lock = threading.Lock()
+
+    def _path(self, genesis_hash, spec_version):
+        return os.path.join(self.directory, f'{genesis_hash}-{spec_version}.scale')
+
+    def load(self, substrate, genesis_hash, spec_version):
+        key = (genesis_hash, spec_version)
+        with self._lock:
+            metadata = self._decoded.get(key)
+        if metadata is not None:
+            self.stats.memory_hits += 1
+            return metadata
+
+        try:
+            with open(self._path(genesis_hash, spec_version), 'rb') as fp:
+                raw = fp.read()
+        except OSError:
+            self.stats.misses += 1
+            return None
+
+        metadata = substrate.runtime_config.create_scale_object('MetadataVersioned', data=ScaleBytes(raw))
+        metadata.decode()
+        self.stats.disk_hits += 1
+        with self._lock:
+            self._decoded[key] = metadata
+        return metadata
+
+    def store(self, genesis_hash, spec_version, metadata):
+        with self._lock:
+            self._decoded[(genesis_hash, spec_version)] = metadata
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(bytes(metadata.data.data))
+            os.replace(tmp_path, self._path(genesis_hash, spec_version))
+            self.stats.stores += 1
+
+            for name in os.listdir(self.directory):
+                if name.startswith(f'{genesis_hash}-') and name != f'{genesis_hash}-{spec_version}.scale':
+                    os.remove(os.path.join(self.directory, name))
+        except OSError:
+            # A read-only or full filesystem only costs us the warm start, never the request.
+            pass
+
+    def region_for(self, substrate, genesis_hash):
+        return _MetadataCacheRegion(self, substrate, genesis_hash)
+
+
+class _MetadataCacheRegion:
+    """Adapts RuntimeMetadataCache to the dogpile-style `cache_region` SubstrateInterface accepts."""
+
+    PREFIX = 'METADATA_'
+
+    def __init__(self, cache, substrate, genesis_hash):
+        self.cache = cache
+        self.substrate = substrate
+        self.genesis_hash = genesis_hash
+
+    def get(self, key):
+        if not key.startswith(self.PREFIX):
+            return None
+        return self.cache.load(self.substrate, self.genesis_hash, key[len(self.PREFIX):])
+
+    def set(self, key, value):
+        if key.startswith(self.PREFIX):
+            self.cache.store(self.genesis_hash, key[len(self.PREFIX):], value)
+
+
+metadata_cache = RuntimeMetadataCache()
+
+
+@dataclass
+class PoolStats:
+    created: int = 0
+    hits: int = 0
+    reconnects: int = 0
+    discarded: int = 0
+    acquisitions: int = 0
+    wait_time: float = 0.0
+    max_wait_time: float = 0.0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+class SubstratePool:
+    """
+    A bounded pool of live SubstrateInterface connections to a single node.
+
+    Connections are pinged before they are handed out; a connection that fails the
+    ping is reconnected in place (keeping its decoded runtime metadata), and replaced
+    entirely if the reconnect fails too. New connections take their runtime metadata
+    from `metadata_cache` instead of downloading and decoding it again.
+    """
+
+    def __init__(self, url, max_size=POOL_MAX_SIZE, acquire_timeout=POOL_ACQUIRE_TIMEOUT,
+                 type_registry_preset=TYPE_REGISTRY_PRESET, metadata_cache=metadata_cache):
+        self.url = url
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.type_registry_preset = type_registry_preset
+        self.metadata_cache = metadata_cache
+        self.genesis_hash = None
+        self.stats = PoolStats()
+
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def _create(self, spans=None):
+        with _span(spans, 'connect'):
+            substrate = SubstrateInterface(url=self.url, type_registry_preset=self.type_registry_preset)
+
+        if self.metadata_cache is not None:
+            with _span(spans, 'runtime_metadata'):
+                if self.genesis_hash is None:
+                    self.genesis_hash = substrate.get_block_hash(0)
+                substrate.cache_region = self.metadata_cache.region_for(substrate, self.genesis_hash)
+                # Resolves the current spec_version and loads its metadata from the cache when possible.
+                substrate.init_runtime()
+
+        self.stats.created += 1
+        return substrate
+
+    @staticmethod
+    def _ping(substrate):
+        try:
+            substrate.rpc_request('system_health', [])
+            return True
+        except Exception:
+            return False
+
+    def _revive(self, substrate, spans=None):
+        self.stats.reconnects += 1
+        try:
+            with _span(spans, 'reconnect'):
+                substrate.connect_websocket()
+                if self._ping(substrate):
+                    return substrate
+        except Exception:
+            pass
+
+        with contextlib.suppress(Exception):
+            substrate.close()
+        return self._create(spans)
+
+    def acquire(self, timeout=None, spans=None):
+        """Hands out a live connection; `spans` (a spans.Spans) times the wait, ping and any (re)connect."""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        substrate = None
+
+        with _span(spans, 'pool_wait'), self._cond:
+            while True:
+                if self._idle:
+                    substrate = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    raise TimeoutError(f'Timed out after {timeout}s waiting for a connection to {self.url}')
+
+        waited = time.monotonic() - started
+        self.stats.acquisitions += 1
+        self.stats.wait_time += waited
+        self.stats.max_wait_time = max(self.stats.max_wait_time, waited)
+
+        try:
+            if substrate is None:
+                substrate = self._create(spans)
+            else:
+                with _span(spans, 'ping'):
+                    alive = self._ping(substrate)
+                if alive:
+                    self.stats.hits += 1
+                else:
+                    substrate = self._revive(substrate, spans)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        return substrate
+
+    def release(self, substrate, discard=False):
+        with self._cond:
+            if discard:
+                self._size -= 1
+                self.stats.discarded += 1
+            else:
+                self._idle.append(substrate)
+            self._cond.notify()
+
+        if discard:
+            with contextlib.suppress(Exception):
+                substrate.close()
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None, spans=None):
+        substrate = self.acquire(timeout, spans)
+        try:
+            yield substrate
+        except CONNECTION_ERRORS:
+            self.release(substrate, discard=True)
+            raise
+        except BaseException:
+            self.release(substrate)
+            raise
+        else:
+            self.release(substrate)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for substrate in idle:
+            with contextlib.suppress(Exception):
+                substrate.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(url):
+    """Returns the process-wide connection pool for `url`, creating it on first use."""
+    with _pools_lock:
+        pool = _pools.get(url)
+        if pool is None:
+            pool = _pools[url] = SubstratePool(url)
+        return pool
+
+
+_PRIMITIVE_SIZES = {'u8': 1, 'u16': 2, 'u32': 4, 'u64': 8, 'u128': 16}
+
+
+def _byte_array_encoder(length):
+    def encode(value):
+        if isinstance(value, str):
+            value = bytes.fromhex(value[2:] if value.startswith('0x') else value)
+        if len(value) != length:
+            raise ValueError(f'Expected {length} bytes, got {len(value)}')
+        return bytes(value)
+    return encode
+
+
+def _uint_encoder(size):
+    def encode(value):
+        return int(value).to_bytes(size, 'little')
+    return encode
+
+
+def _encode_bool(value):
+    return b'\x01' if value else b'\x00'
+
+
+def _build_encoder(types, type_id):
+    """Returns a direct SCALE encoder for the ink! type `type_id`, or None if only the generic path can encode it."""
+    type_def = types[type_id]['def']
+
+    if 'primitive' in type_def:
+        primitive = type_def['primitive']
+        if primitive == 'bool':
+            return _encode_bool
+        if primitive in _PRIMITIVE_SIZES:
+            return _uint_encoder(_PRIMITIVE_SIZES[primitive])
+    elif 'array' in type_def:
+        element = types[type_def['array']['type']]['def']
+        if element.get('primitive') == 'u8':
+            return _byte_array_encoder(type_def['array']['len'])
+    elif 'composite' in type_def:
+        fields = type_def['composite'].get('fields', [])
+        if len(fields) == 1:
+            return _build_encoder(types, fields[0]['type'])
+
+    return None
+
+
+@dataclass(frozen=True)
+class CompiledMessage:
+    label: str
+    selector: bytes
+    args: tuple  # ((label, encoder or None), ...)
+
+    @property
+    def is_direct(self):
+        return all(encoder is not None for _, encoder in self.args)
+
+    def encode(self, args=None):
+        args = args or {}
+        data = [self.selector]
+        for label, encoder in self.args:
+            if label not in args:
+                raise ValueError(f'Argument "{label}" is missing')
+            data.append(encoder(args[label]))
+        return b''.join(data)
+
+
+class _CompiledContractMetadata(ContractMetadata):
+    """ContractMetadata that encodes messages through pre-resolved selectors and encoders."""
+
+    def __init__(self, metadata_dict, substrate, messages):
+        self._messages = messages
+        super().__init__(metadata_dict, substrate)
+
+    def generate_message_data(self, name, args=None):
+        message = self._messages.get(name)
+        if message is not None and message.is_direct:
+            return ScaleBytes(message.encode(args))
+        return super().generate_message_data(name, args)
+
+
+def _with_margin(amount, margin):
+    if isinstance(amount, dict):
+        return {key: _with_margin(value, margin) for key, value in amount.items()}
+    return math.ceil(amount * margin)
+
+
+def _deposit_charge(storage_deposit):
+    """The amount a dry run's StorageDeposit charges; refunds charge nothing."""
+    if isinstance(storage_deposit, dict):
+        return storage_deposit.get('Charge', 0)
+    return 0
+
+
+def is_estimate_error(error_message):
+    """Whether a dispatch error (ExtrinsicReceipt.error_message) means the call's gas or deposit limit was too low."""
+    name = error_message.get('name') if isinstance(error_message, dict) else error_message
+    return bool(name) and any(error in str(name) for error in ESTIMATE_ERRORS)
+
+
+@dataclass(frozen=True)
+class GasEstimate:
+    gas_limit: object  # WeightV2 {'ref_time': ..., 'proof_size': ...}, margin included
+    storage_deposit_limit: object  # None (no limit) when the dry run charged no deposit
+    estimated_at: float
+
+
+@dataclass
+class GasEstimateStats:
+    hits: int = 0
+    misses: int = 0
+    refreshes: int = 0
+    invalidations: int = 0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+class GasEstimateCache:
+    """
+    Gas and storage-deposit limits per (contract code hash, message).
+
+    Composing a contract call otherwise dry-runs it first to learn the gas it needs,
+    which doubles the round trips of every write. The messages written from here take
+    fixed-size arguments, so the estimate hardly changes between calls: it is kept for
+    `ttl` seconds with `margin` applied, and dropped as soon as a call fails with one
+    of ESTIMATE_ERRORS.
+    """
+
+    def __init__(self, ttl=GAS_ESTIMATE_TTL, margin=GAS_ESTIMATE_MARGIN):
+        self.ttl = ttl
+        self.margin = margin
+        self.stats = GasEstimateStats()
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_or_estimate(self, key, estimate):
+        """
+        Returns the GasEstimate for `key`, calling `estimate()` -> (gas_required, storage_deposit)
+        when there is none or it is older than `ttl`.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.estimated_at < self.ttl:
+                self.stats.hits += 1
+                return entry
+            if entry is None:
+                self.stats.misses += 1
+            else:
+                self.stats.refreshes += 1
+
+        gas_required, storage_deposit = estimate()
+        charge = _deposit_charge(storage_deposit)
+        entry = GasEstimate(
+            gas_limit=_with_margin(gas_required, self.margin),
+            storage_deposit_limit=_with_margin(charge, self.margin) if charge else None,
+            estimated_at=time.monotonic(),
+        )
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[key] = entry
+        return entry
+
+    def invalidate(self, key=None):
+        """Drops the estimate for `key`, or every estimate."""
+        with self._lock:
+            dropped = len(self._entries) if key is None else int(self._entries.pop(key, None) is not None)
+            if key is None:
+                self._entries.clear()
+            self.stats.invalidations += dropped
+
+    def invalidate_for_error(self, error_message, key=None):
+        """
+        Drops estimates after a call failed with `error_message`, if it is one of ESTIMATE_ERRORS.
+        Returns whether it was; use it for calls that were only submitted, once their outcome is known.
+        """
+        if not is_estimate_error(error_message):
+            return False
+        self.invalidate(key)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+gas_estimates = GasEstimateCache()
+
+
+class CompiledContract:
+    """
+    An ink! contract ABI parsed once per (address, metadata hash).
+
+    Message selectors and argument encoders are resolved up front, so encoding a call
+    to `store_verified_resume_data` is a byte concatenation. The SubstrateInterface
+    bound ContractInstance is built once per pooled connection, because the contract
+    types are registered in that connection's runtime config.
+    """
+
+    def __init__(self, contract_address, metadata_dict, metadata_hash):
+        self.contract_address = contract_address
+        self.metadata_dict = metadata_dict
+        self.metadata_hash = metadata_hash
+        # The Wasm code hash recorded by cargo-contract; calls into the same code share gas estimates.
+        self.code_hash = (metadata_dict.get('source') or {}).get('hash') or metadata_hash
+
+        self.messages = {}
+        if str(metadata_dict.get('version')) in ('4', '5'):
+            self.messages = self._compile_messages(metadata_dict)
+
+        self._instances = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _compile_messages(metadata_dict):
+        types = {entry['id']: entry['type'] for entry in metadata_dict['types']}
+        return {
+            message['label']: CompiledMessage(
+                label=message['label'],
+                selector=bytes.fromhex(message['selector'][2:]),
+                args=tuple((arg['label'], _build_encoder(types, arg['type']['type'])) for arg in message['args']),
+            )
+            for message in metadata_dict['spec']['messages']
+        }
+
+    def encode_call(self, message, args=None):
+        compiled = self.messages.get(message)
+        if compiled is None or not compiled.is_direct:
+            raise ValueError(f'Message "{message}" has no pre-resolved encoder')
+        return compiled.encode(args)
+
+    def _compose_call(self, substrate, keypair, message, args, value, gas_limit, storage_deposit_limit, spans=None):
+        """
+        The Contracts.call for `message`. Without a `gas_limit`, the gas and storage-deposit
+        limits come from gas_estimates, which dry-runs the message only when it has no fresh
+        estimate. Returns (call, estimate_key), estimate_key being None for caller-given limits.
+        """
+        contract = self.instance(substrate)
+        estimate_key = None
+        if gas_limit is None:
+            estimate_key = (self.code_hash, message)
+
+            def dry_run():
+                with _span(spans, 'dry_run'):
+                    result = contract.read(keypair, message, args, value)
+                return result.gas_required, result.value.get('storage_deposit')
+
+            estimate = gas_estimates.get_or_estimate(estimate_key, dry_run)
+            gas_limit = estimate.gas_limit
+            if storage_deposit_limit is None:
+                storage_deposit_limit = estimate.storage_deposit_limit
+
+        call = substrate.compose_call(
+            call_module='Contracts',
+            call_function='call',
+            call_params={
+                'dest': self.contract_address,
+                'value': value,
+                'gas_limit': gas_limit,
+                'storage_deposit_limit': storage_deposit_limit,
+                'data': contract.metadata.generate_message_data(message, args).to_hex()
+            }
+        )
+        return call, estimate_key
+
+    def exec(self, substrate, keypair, message, args=None, value=0, gas_limit=None, storage_deposit_limit=None, spans=None):
+        """
+        Same as ContractInstance.exec, but the nonce comes from the process-wide NonceManager,
+        so several calls from one account can wait for inclusion at the same time.
+
+        If a call using estimated limits fails with OutOfGas or StorageDepositLimitExhausted,
+        the estimate is dropped and the call is made once more with a fresh dry run.
+        """
+        for attempt in (1, 2):
+            call, estimate_key = self._compose_call(substrate, keypair, message, args, value, gas_limit, storage_deposit_limit, spans)
+            receipt = ContractExecutionReceipt.create_from_extrinsic_receipt(
+                submit_signed(substrate, keypair, call, wait_for_inclusion=True, spans=spans),
+                self.instance(substrate).metadata, self.contract_address
+            )
+            if estimate_key is None or receipt.is_success:
+                return receipt
+            if not gas_estimates.invalidate_for_error(receipt.error_message, estimate_key) or attempt == 2:
+                return receipt
+
+    def submit(self, substrate, keypair, message, args=None, value=0, gas_limit=None, storage_deposit_limit=None, spans=None):
+        """
+        Signs and submits a call to `message` without waiting for inclusion.
+
+        Returns (extrinsic_hash, submitted_at_block); hand both to FinalityTracker later to
+        learn where the extrinsic landed, and its error to gas_estimates.invalidate_for_error
+        if it failed.
+        """
+        call, _ = self._compose_call(substrate, keypair, message, args, value, gas_limit, storage_deposit_limit, spans)
+        submitted_at_block = _header_number(substrate)
+        receipt = submit_signed(substrate, keypair, call, era={'period': SUBMIT_ERA_PERIOD}, wait_for_inclusion=False, spans=spans)
+        return receipt.extrinsic_hash, submitted_at_block
+
+    def read(self, substrate, message, args=None, block_hash=None, cache=None):
+        """
+        Dry-runs the getter `message` and returns its decoded MessageResult, e.g.
+        {'Ok': '0x…'} for get_verified_resume_data.
+
+        Reads run against a pinned block (the current head unless `block_hash` is given)
+        and are memoized per (contract, message, args, block hash) in `cache` (the
+        process-wide read_cache by default), so any number of lookups within one block
+        cost a single runtime call.
+        """
+        cache = cache or read_cache
+        if block_hash is None:
+            block_hash = cache.head(substrate)
+
+        def dry_run():
+            origin = Keypair(ss58_address=self.contract_address)
+            result = self.instance(substrate).read(origin, message, args, block_hash=block_hash)
+            if 'Ok' not in result.value['result']:
+                raise ContractReadFailedException(result.value['result'])
+            return result.value['result']['Ok']['data']
+
+        key = (self.contract_address, self.metadata_hash, message, _args_key(args), block_hash)
+        return cache.get_or_load(key, block_hash, dry_run)
+
+    def instance(self, substrate):
+        with self._lock:
+            contract = self._instances.get(substrate)
+        if contract is None:
+            metadata = _CompiledContractMetadata(copy.deepcopy(self.metadata_dict), substrate, self.messages)
+            contract = ContractInstance(contract_address=self.contract_address, metadata=metadata, substrate=substrate)
+            with self._lock:
+                self._instances[substrate] = contract
+        return contract
+
+
+def _args_key(args):
+    return tuple(sorted((label, value.hex() if isinstance(value, (bytes, bytearray)) else repr(value))
+                        for label, value in (args or {}).items()))
+
+
+@dataclass
+class ReadCacheStats:
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    invalidations: int = 0
+    head_fetches: int = 0
+
+    def as_dict(self):
+        return asdict(self)
+
+
+class ContractReadCache:
+    """
+    Block-scoped memo for contract reads.
+
+    Entries are keyed by block hash; as soon as a newer head is seen, entries for every
+    other block are dropped. Concurrent reads of the same key while the first one is
+    still running wait for its result instead of issuing their own runtime call.
+    """
+
+    def __init__(self, head_ttl=READ_HEAD_TTL, max_entries=READ_CACHE_MAX_ENTRIES):
+        self.head_ttl = head_ttl
+        self.max_entries = max_entries
+        self.stats = ReadCacheStats()
+        self._entries = {}
+        self._heads = {}
+        self._current_block = None
+        self._lock = threading.Lock()
+
+    def head(self, substrate):
+        """The chain head hash, fetched at most once per `head_ttl` per node."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._heads.get(substrate.url)
+            if cached and now - cached[1] < self.head_ttl:
+                return cached[0]
+        block_hash = substrate.get_chain_head()
+        with self._lock:
+            self._heads[substrate.url] = (block_hash, now)
+            self.stats.head_fetches += 1
+        return block_hash
+
+    def _move_to(self, block_hash):
+        if block_hash != self._current_block:
+            if self._current_block is not None:
+                self.stats.invalidations += 1
+            self._current_block = block_hash
+            # Keep only this block's entries (and any still in flight for other blocks).
+            self._entries = {k: f for k, f in self._entries.items() if k[-1] == block_hash or not f.done()}
+
+    def get_or_load(self, key, block_hash, load):
+        with self._lock:
+            self._move_to(block_hash)
+            future = self._entries.get(key)
+            if future is None:
+                self.stats.misses += 1
+                if len(self._entries) >= self.max_entries:
+                    self._entries = {k: f for k, f in self._entries.items() if not f.done()}
+                future = self._entries[key] = Future()
+                loading = True
+            else:
+                if future.done():
+                    self.stats.hits += 1
+                else:
+                    self.stats.coalesced += 1
+                loading = False
+
+        if loading:
+            try:
+                future.set_result(load())
+            except BaseException as e:
+                # Failed reads are not cached: waiters get the error, later callers retry.
+                with self._lock:
+                    if self._entries.get(key) is future:
+                        del self._entries[key]
+                future.set_exception(e)
+        return future.result()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._heads.clear()
+            self._current_block = None
+
+
+read_cache = ContractReadCache()
+
+
+_contracts = {}
+_contracts_by_file = {}
+_contracts_lock = threading.Lock()
+
+
+def get_contract(contract_address, metadata_file):
+    """Returns the process-wide CompiledContract for `contract_address`, reading `metadata_file` only once."""
+    key = (contract_address, metadata_file)
+    contract = _contracts_by_file.get(key)
+    if contract is not None:
+        return contract
+
+    with open(metadata_file, 'rb') as fp:
+        raw = fp.read()
+    metadata_hash = hashlib.sha256(raw).hexdigest()
+
+    with _contracts_lock:
+        contract = _contracts.get((contract_address, metadata_hash))
+        if contract is None:
+            contract = CompiledContract(contract_address, json.loads(raw), metadata_hash)
+            _contracts[(contract_address, metadata_hash)] = contract
+        _contracts_by_file[key] = contract
+    return contract
+
+
+class SignerRegistry:
+    """
+    Named signing keypairs, each derived once per process.
+
+    `Keypair.create_from_mnemonic` runs BIP39 PBKDF2 plus sr25519 derivation, so the
+    derived keypair is kept in memory and shared by every signer name that points at
+    the same secret. Besides the names registered by the entry points, any
+    POLKADOT_SIGNER_<NAME>_URI / POLKADOT_SIGNER_<NAME>_MNEMONIC variable adds a signer.
+    """
+
+    ENV_PREFIX = 'POLKADOT_SIGNER_'
+
+    def __init__(self):
+        self._sources = {}
+        self._keypairs = {}
+        self.derivation_times = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, uri=None, mnemonic=None):
+        if uri and mnemonic:
+            raise ValueError(f'Signer {name!r} takes either a uri or a mnemonic, not both')
+        if uri or mnemonic:
+            self._sources[name] = ('uri', uri) if uri else ('mnemonic', mnemonic)
+
+    def register_from_env(self, environ=os.environ):
+        for key, value in environ.items():
+            if not (key.startswith(self.ENV_PREFIX) and value):
+                continue
+            name, _, kind = key[len(self.ENV_PREFIX):].rpartition('_')
+            if name and kind in ('URI', 'MNEMONIC'):
+                self.register(name.lower(), **{kind.lower(): value})
+
+    def __contains__(self, name):
+        return name in self._sources
+
+    def get(self, name):
+        source = self._sources.get(name)
+        if source is None:
+            raise ValueError(f'No signer registered under {name!r}')
+
+        keypair = self._keypairs.get(source)
+        if keypair is not None:
+            return keypair
+
+        with self._lock:
+            keypair = self._keypairs.get(source)
+            if keypair is None:
+                started = time.perf_counter()
+                kind, secret = source
+                if kind == 'uri':
+                    keypair = Keypair.create_from_uri(secret)
+                else:
+                    keypair = Keypair.create_from_mnemonic(secret)
+                self.derivation_times[name] = time.perf_counter() - started
+                self._keypairs[source] = keypair
+        return keypair
+
+    def warm_up(self, names):
+        """Derives `names` ahead of the first request; returns {name: seconds or error string}."""
+        report = {}
+        for name in names:
+            try:
+                self.get(name)
+                report[name] = round(self.derivation_times.get(name, 0.0), 6)
+            except Exception as e:
+                report[name] = f'error: {e}'
+        return report
+
+
+signers = SignerRegistry()
+
+
+def _header_number(substrate, block_hash=None):
+    header = substrate.rpc_request('chain_getHeader', [block_hash] if block_hash else [])['result']
+    return int(header['number'], 16)
+
+
+class FinalityTracker:
+    """
+    Resolves inclusion and finality for many submitted extrinsics in one pass.
+
+    Blocks from the oldest pending submission, or from `scan_from` where an earlier pass
+    stopped, up to the current head are scanned once, hashing the raw extrinsics of each
+    block instead of decoding them. While a submission is still pending the tracker then
+    polls for new heads every `poll_interval` seconds. Every block scanned and every poll
+    checks `deadline` first, so a pass overruns it by at most one RPC; `next_block` is
+    where the next pass resumes. Submissions already included are checked for finality
+    once per pass and never waited on. Submissions are mortal (SUBMIT_ERA_PERIOD), so
+    anything not included once the scanned head is past that window is reported as dropped.
+    """
+
+    def __init__(self, substrate, era_period=SUBMIT_ERA_PERIOD, poll_interval=1.0):
+        self.substrate = substrate
+        self.era_period = era_period
+        self.poll_interval = poll_interval
+        self.results = {}
+        self._submitted_at = {}
+        self._next_block = None
+
+    @property
+    def next_block(self):
+        """The first block the next pass still has to scan."""
+        return self._next_block
+
+    def _result(self, extrinsic_hash):
+        return self.results.setdefault(extrinsic_hash, {
+            'status': 'pending', 'block_hash': None, 'block_number': None,
+            'is_success': None, 'error_message': None,
+        })
+
+    def _scan_block(self, number):
+        block_hash = self.substrate.get_block_hash(number)
+        block = self.substrate.rpc_request('chain_getBlock', [block_hash])['result']['block']
+        for raw in block['extrinsics']:
+            extrinsic_hash = '0x' + hashlib.blake2b(bytes.fromhex(raw[2:]), digest_size=32).hexdigest()
+            if extrinsic_hash not in self._submitted_at:
+                continue
+
+            receipt = ExtrinsicReceipt(self.substrate, extrinsic_hash=extrinsic_hash, block_hash=block_hash)
+            result = self._result(extrinsic_hash)
+            result.update(status='included', block_hash=block_hash, block_number=number,
+                          is_success=receipt.is_success, error_message=receipt.error_message)
+
+    def _scan_to(self, head, deadline):
+        while self._next_block <= head and time.monotonic() < deadline:
+            self._scan_block(self._next_block)
+            self._next_block += 1
+
+    def _update_finality(self):
+        # Only what has been scanned counts: a submission is dropped once a scanned block is past its era.
+        scanned_head = self._next_block - 1
+        finalized_number = _header_number(self.substrate, self.substrate.get_chain_finalised_head())
+        for extrinsic_hash, submitted_at in self._submitted_at.items():
+            result = self._result(extrinsic_hash)
+            if result['status'] == 'included' and result['block_number'] <= finalized_number:
+                if self.substrate.get_block_hash(result['block_number']) == result['block_hash']:
+                    result['status'] = 'finalized'
+                else:
+                    # The including block was re-organised away; the extrinsic may land again later.
+                    result.update(status='pending', block_hash=None, block_number=None, is_success=None)
+                    self._next_block = min(self._next_block, submitted_at)
+            elif result['status'] == 'pending' and scanned_head > submitted_at + self.era_period:
+                result['status'] = 'dropped'
+
+    def _pending(self):
+        return [h for h in self._submitted_at if self._result(h)['status'] == 'pending']
+
+    def track(self, submissions, deadline, included=None, scan_from=None):
+        """
+        `submissions` maps extrinsic hash to the block number it was submitted at;
+        `deadline` is a time.monotonic() value. `included` maps the hashes an earlier pass
+        found to its result dict, so they are only checked for finality; `scan_from` is
+        that pass's `next_block`. Returns {extrinsic_hash: result dict}.
+        """
+        self._submitted_at = dict(submissions)
+        if not self._submitted_at:
+            return self.results
+        for extrinsic_hash, result in (included or {}).items():
+            self._result(extrinsic_hash).update(result, status='included')
+
+        head = _header_number(self.substrate)
+        pending_since = [self._submitted_at[h] for h in self._pending()]
+        if scan_from is not None:
+            self._next_block = scan_from
+        else:
+            self._next_block = min(pending_since) if pending_since else head + 1
+        self._scan_to(head, deadline)
+        self._update_finality()
+
+        while self._pending() and time.monotonic() < deadline:
+            time.sleep(max(min(self.poll_interval, deadline - time.monotonic()), 0))
+            if time.monotonic() >= deadline:
+                break
+            new_head = _header_number(self.substrate)
+            if new_head >= self._next_block:
+                self._scan_to(new_head, deadline)
+                self._update_finality()
+
+        return self.results
+
+
+# Fragments of the transaction-pool errors a node returns for a nonce it will not accept.
+NONCE_ERROR_MARKERS = ('outdated', 'stale', 'future', 'priority is too low', 'already imported', 'nonce')
+
+
+def _is_nonce_error(error):
+    message = str(error).lower()
+    return any(marker in message for marker in NONCE_ERROR_MARKERS)
+
+
+class NonceManager:
+    """
+    Allocates account nonces from memory so one signer can have many extrinsics in flight.
+
+    The first allocation for an account reads `system_accountNextIndex` (which counts the
+    node's transaction pool); after that nonces are handed out sequentially without a
+    round trip. A failed submission invalidates the account, so the next allocation
+    resyncs from the chain instead of leaving a gap that would stall later nonces.
+    """
+
+    def __init__(self):
+        self._next = {}
+        self._lock = threading.Lock()
+        self.resyncs = 0
+
+    def next(self, substrate, address):
+        key = (substrate.url, address)
+        with self._lock:
+            nonce = self._next.get(key)
+            if nonce is None:
+                nonce = substrate.get_account_nonce(address)
+                self.resyncs += 1
+            self._next[key] = nonce + 1
+            return nonce
+
+    def invalidate(self, substrate, address):
+        with self._lock:
+            self._next.pop((substrate.url, address), None)
+
+
+nonces = NonceManager()
+
+
+def submit_signed(substrate, keypair, call, era=None, wait_for_inclusion=True, nonce_manager=nonces, spans=None):
+    """
+    Signs `call` with a managed nonce and submits it, resyncing and retrying once on a nonce error.
+    With wait_for_inclusion the 'inclusion' span covers both the submission and the wait.
+    Any failure after the nonce is reserved, signing included, invalidates it, so the next
+    call resyncs instead of signing past a nonce the chain never saw.
+    """
+    for attempt in (1, 2):
+        with _span(spans, 'nonce'):
+            nonce = nonce_manager.next(substrate, keypair.ss58_address)
+        try:
+            with _span(spans, 'sign'):
+                extrinsic = substrate.create_signed_extrinsic(call=call, keypair=keypair, era=era, nonce=nonce)
+            with _span(spans, 'inclusion' if wait_for_inclusion else 'submit'):
+                return substrate.submit_extrinsic(extrinsic, wait_for_inclusion=wait_for_inclusion)
+        except SubstrateRequestException as e:
+            nonce_manager.invalidate(substrate, keypair.ss58_address)
+            if attempt == 2 or not _is_nonce_error(e):
+                raise
+        except Exception:
+            nonce_manager.invalidate(substrate, keypair.ss58_address)
+            raise
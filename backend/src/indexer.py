@@ -0,0 +1,292 @@
+"""
+Indexes `store_verified_resume_data` calls to the ZeroID contract into SQLite.
+
+The contract only keeps the last stored hash and emits no events, so the index is
+built from the extrinsics themselves: every Contracts.call to POLKADOT_CONTRACT_ADDRESS
+whose input starts with the message selector is recorded with its block, extrinsic,
+signer, block timestamp and dispatch outcome.
+
+Only finalized blocks are indexed, so an indexed row is never re-organised away.
+Backfill splits a block range into chunks fetched in parallel over pooled
+connections; each chunk is committed together with its checkpoint, so an
+interrupted backfill resumes with the chunks that are still missing. Live mode
+follows the finalized head from where it (or the backfill) left off.
+
+    python -m src.indexer backfill [--start N] [--end M] [--workers 4] [--chunk-size 100]
+    python -m src.indexer live [--poll-interval 6]
+    python -m src.indexer lookup <resume hash hex>
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from scalecodec.utils.ss58 import ss58_decode
+
+from .chain import POOL_MAX_SIZE, _header_number, get_contract, get_pool
+
+
+CONTRACT_METADATA_PATH = os.path.join(os.path.dirname(__file__), 'zid_contract.json')
+STORE_MESSAGE = 'store_verified_resume_data'
+DEFAULT_DB_PATH = os.getenv('INDEXER_DB_PATH', 'zeroid-index.sqlite3')
+DEFAULT_CHUNK_SIZE = 100
+DEFAULT_POLL_INTERVAL = 6.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS anchors (
+    resume_hash TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    block_hash TEXT NOT NULL,
+    extrinsic_index INTEGER NOT NULL,
+    extrinsic_hash TEXT,
+    signer TEXT,
+    timestamp_ms INTEGER,
+    is_success INTEGER,
+    PRIMARY KEY (block_hash, extrinsic_index)
+);
+CREATE INDEX IF NOT EXISTS anchors_resume_hash ON anchors (resume_hash);
+CREATE TABLE IF NOT EXISTS indexed_chunks (
+    start_block INTEGER PRIMARY KEY,
+    end_block INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name TEXT PRIMARY KEY,
+    block_number INTEGER NOT NULL
+);
+"""
+
+
+class AnchorStore:
+    """The SQLite side of the indexer. Only the thread that opened it writes to it."""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+
+    def save_chunk(self, start, end, rows):
+        """Stores the anchors of blocks start..end (inclusive) and marks the chunk indexed, atomically."""
+        with self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO anchors VALUES (:resume_hash, :block_number, :block_hash, :extrinsic_index,'
+                ' :extrinsic_hash, :signer, :timestamp_ms, :is_success)',
+                rows,
+            )
+            self.db.execute('INSERT OR REPLACE INTO indexed_chunks VALUES (?, ?)', (start, end))
+
+    def missing_chunks(self, start, end, chunk_size):
+        """Splits start..end into chunks, leaving out blocks already indexed by earlier chunks or live mode."""
+        indexed = self.db.execute(
+            'SELECT start_block, end_block FROM indexed_chunks WHERE end_block >= ? AND start_block <= ? ORDER BY start_block',
+            (start, end),
+        ).fetchall()
+
+        gaps = []
+        position = start
+        for done_start, done_end in indexed:
+            if done_start > position:
+                gaps.append((position, min(done_start - 1, end)))
+            position = max(position, done_end + 1)
+        if position <= end:
+            gaps.append((position, end))
+
+        return [
+            (chunk_start, min(chunk_start + chunk_size - 1, gap_end))
+            for gap_start, gap_end in gaps
+            for chunk_start in range(gap_start, gap_end + 1, chunk_size)
+        ]
+
+    def checkpoint(self, name):
+        row = self.db.execute('SELECT block_number FROM checkpoints WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_checkpoint(self, name, block_number):
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO checkpoints VALUES (?, ?)', (name, block_number))
+
+    def highest_indexed_block(self):
+        row = self.db.execute('SELECT MAX(end_block) FROM indexed_chunks').fetchone()
+        return row[0]
+
+    def lookup(self, resume_hash):
+        resume_hash = resume_hash.lower().removeprefix('0x')
+        cursor = self.db.execute(
+            'SELECT * FROM anchors WHERE resume_hash = ? ORDER BY block_number, extrinsic_index', (resume_hash,)
+        )
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+
+def _account_hex(value):
+    """Normalises an address as decoded in call args (ss58, 0x public key, or {'Id': ...})."""
+    if isinstance(value, dict):
+        value = value.get('Id') or next(iter(value.values()), None)
+    if not isinstance(value, str):
+        return None
+    if value.startswith('0x'):
+        return value[2:].lower()
+    try:
+        return ss58_decode(value)
+    except ValueError:
+        return None
+
+
+class BlockScanner:
+    """Extracts the contract's store calls from one block; safe to share across threads."""
+
+    def __init__(self, url, contract_address, metadata_file=CONTRACT_METADATA_PATH):
+        self.url = url
+        self.contract_account = ss58_decode(contract_address)
+        self.selector = get_contract(contract_address, metadata_file).messages[STORE_MESSAGE].selector.hex()
+
+    def _is_store_call(self, call):
+        if call.get('call_module') != 'Contracts' or call.get('call_function') != 'call':
+            return None
+        args = {arg['name']: arg['value'] for arg in call.get('call_args', [])}
+        data = args.get('data')
+        if isinstance(data, (bytes, bytearray)):
+            data = '0x' + bytes(data).hex()
+        if _account_hex(args.get('dest')) != self.contract_account or not isinstance(data, str):
+            return None
+        data = data.lower().removeprefix('0x')
+        if not data.startswith(self.selector) or len(data) < len(self.selector) + 64:
+            return None
+        return data[len(self.selector):len(self.selector) + 64]
+
+    def scan(self, substrate, number):
+        block_hash = substrate.get_block_hash(number)
+        block = substrate.get_block(block_hash=block_hash)
+
+        timestamp_ms = None
+        rows = []
+        for index, extrinsic in enumerate(block['extrinsics']):
+            value = extrinsic.value
+            call = value.get('call', {})
+            if call.get('call_module') == 'Timestamp' and call.get('call_function') == 'set':
+                timestamp_ms = call['call_args'][0]['value']
+                continue
+            resume_hash = self._is_store_call(call)
+            if resume_hash is None:
+                continue
+            rows.append({
+                'resume_hash': resume_hash,
+                'block_number': number,
+                'block_hash': block_hash,
+                'extrinsic_index': index,
+                'extrinsic_hash': value.get('extrinsic_hash'),
+                'signer': value.get('address'),
+                'timestamp_ms': None,
+                'is_success': None,
+            })
+
+        if rows:
+            outcomes = {}
+            for event in substrate.get_events(block_hash=block_hash):
+                event = event.value
+                if event.get('module_id') == 'System' and event.get('event_id') in ('ExtrinsicSuccess', 'ExtrinsicFailed'):
+                    outcomes[event.get('extrinsic_idx')] = event['event_id'] == 'ExtrinsicSuccess'
+            for row in rows:
+                row['timestamp_ms'] = timestamp_ms
+                row['is_success'] = outcomes.get(row['extrinsic_index'])
+        return rows
+
+    def scan_range(self, start, end):
+        """Scans blocks start..end on one pooled connection."""
+        rows = []
+        with get_pool(self.url).connection() as substrate:
+            for number in range(start, end + 1):
+                rows.extend(self.scan(substrate, number))
+        return rows
+
+
+def finalized_head(url):
+    with get_pool(url).connection() as substrate:
+        return _header_number(substrate, substrate.get_chain_finalised_head())
+
+
+def backfill(store, scanner, start, end, workers=POOL_MAX_SIZE, chunk_size=DEFAULT_CHUNK_SIZE, log=print):
+    """Indexes the finalized blocks start..end that are not indexed yet. Returns the number of anchors found."""
+    chunks = store.missing_chunks(start, end, chunk_size)
+    log(f'Backfilling blocks {start}..{end}: {len(chunks)} chunk(s) of up to {chunk_size} block(s), {workers} worker(s).')
+
+    found = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, POOL_MAX_SIZE))) as executor:
+        futures = {executor.submit(scanner.scan_range, chunk_start, chunk_end): (chunk_start, chunk_end)
+                   for chunk_start, chunk_end in chunks}
+        for future in as_completed(futures):
+            chunk_start, chunk_end = futures[future]
+            rows = future.result()
+            store.save_chunk(chunk_start, chunk_end, rows)
+            found += len(rows)
+            log(f'Indexed blocks {chunk_start}..{chunk_end}: {len(rows)} anchor(s).')
+    return found
+
+
+def follow(store, scanner, poll_interval=DEFAULT_POLL_INTERVAL, stop=None, log=print):
+    """Indexes new finalized blocks as they appear, until `stop` (a threading.Event) is set."""
+    stop = stop or threading.Event()
+    next_block = store.checkpoint('live')
+    if next_block is None:
+        highest = store.highest_indexed_block()
+        next_block = highest + 1 if highest is not None else finalized_head(scanner.url)
+    log(f'Following finalized blocks from {next_block}.')
+
+    while not stop.is_set():
+        head = finalized_head(scanner.url)
+        while next_block <= head and not stop.is_set():
+            rows = scanner.scan_range(next_block, next_block)
+            store.save_chunk(next_block, next_block, rows)
+            store.set_checkpoint('live', next_block + 1)
+            if rows:
+                log(f'Block {next_block}: {len(rows)} anchor(s).')
+            next_block += 1
+        stop.wait(poll_interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m src.indexer', description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default=os.getenv('POLKADOT_SUBSTRATE_URL'))
+    parser.add_argument('--contract', default=os.getenv('POLKADOT_CONTRACT_ADDRESS'))
+    parser.add_argument('--db', default=DEFAULT_DB_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    backfill_parser = commands.add_parser('backfill', help='index historical finalized blocks')
+    backfill_parser.add_argument('--start', type=int, default=0)
+    backfill_parser.add_argument('--end', type=int, help='defaults to the finalized head')
+    backfill_parser.add_argument('--workers', type=int, default=POOL_MAX_SIZE)
+    backfill_parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    live_parser = commands.add_parser('live', help='follow new finalized blocks')
+    live_parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL)
+
+    lookup_parser = commands.add_parser('lookup', help='show where a resume hash was anchored')
+    lookup_parser.add_argument('resume_hash')
+
+    args = parser.parse_args(argv)
+    store = AnchorStore(args.db)
+
+    if args.command == 'lookup':
+        print(json.dumps(store.lookup(args.resume_hash), indent=2))
+        return
+
+    if not args.url or not args.contract:
+        parser.error('--url/POLKADOT_SUBSTRATE_URL and --contract/POLKADOT_CONTRACT_ADDRESS are required')
+    scanner = BlockScanner(args.url, args.contract)
+
+    if args.command == 'backfill':
+        head = finalized_head(args.url)
+        end = head if args.end is None else min(args.end, head)
+        found = backfill(store, scanner, args.start, end, args.workers, args.chunk_size)
+        print(f'Backfill done: {found} anchor(s) found.')
+    else:
+        try:
+            follow(store, scanner, args.poll_interval)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Per-request timing spans for the chain-writing functions.
+
+A Spans collects how long each named phase of one request took (pool wait, websocket
+connect, runtime metadata, signing, the gas dry run, waiting for inclusion, ...). The
+same name can be timed many times, e.g. once per action of an email2 run, and phases
+are totalled per name. Spans are recorded from the action worker threads too.
+
+With TIMINGS_ENABLED=false every span is the shared no-op NULL_SPAN, so instrumented
+code pays for one method call per phase and nothing is logged or returned.
+"""
+import json
+import os
+import threading
+import time
+
+
+TIMINGS_ENABLED = os.getenv('TIMINGS_ENABLED', 'true').lower() not in ('0', 'false', 'no', 'off')
+
+
+class _Span:
+    __slots__ = ('_spans', '_name', '_started')
+
+    def __init__(self, spans, name):
+        self._spans = spans
+        self._name = name
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._spans.add(self._name, time.perf_counter() - self._started)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Spans:
+    """Named phase timings of one request or cron run."""
+
+    def __init__(self, enabled=TIMINGS_ENABLED):
+        self.enabled = enabled
+        self._totals = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def span(self, name):
+        """A context manager that adds the time spent inside it to phase `name`."""
+        return _Span(self, name) if self.enabled else NULL_SPAN
+
+    def add(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._totals.get(name)
+            if entry is None:
+                self._totals[name] = [1, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+
+    def as_dict(self):
+        """{"total_ms": ..., "phases": {name: {"count": n, "ms": total}}} in first-seen order, or None when disabled."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            phases = {name: {'count': count, 'ms': round(seconds * 1000, 1)} for name, (count, seconds) in self._totals.items()}
+        return {'total_ms': round((time.perf_counter() - self._started) * 1000, 1), 'phases': phases}
+
+    def report(self, context, **fields):
+        """Logs one structured timing record through `context.log` and returns the timings for the response."""
+        timings = self.as_dict()
+        if timings is not None:
+            context.log('Timings: ' + json.dumps({**fields, **timings}, default=str))
+        return timings
+
+
+NULL_SPANS = Spans(enabled=False)